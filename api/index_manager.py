@@ -0,0 +1,226 @@
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from rag.config import FAQ_ENABLED, INDEX_CHECK_INTERVAL, INDEX_KEEP_VERSIONS, INDEX_WARMUP_QUERIES, TOP_K
+from rag.faq import FAQ_NAME, FAQStore
+from rag.index_versions import LEGACY_VERSION, current_version, gc_versions, list_versions, publish_version, version_dirs
+from rag.vectorstore import hybrid_retrieve_with_score, open_vectorstore
+
+
+class IndexHandle:
+    """
+    開いたインデックス1バージョン分。refs はこのバージョンで処理中のリクエスト数。
+
+    faq はこのバージョンの事前生成回答（FAQ_ENABLED=false なら None）。インデックスと一緒に切り替わる。
+    """
+
+    def __init__(self, version: str, db, persist_dir: Path, index_dir: Path, faq: FAQStore | None = None):
+        self.version = version
+        self.db = db
+        self.persist_dir = persist_dir
+        self.index_dir = index_dir
+        self.faq = faq
+        self.refs = 0
+        self.retired = False
+        self.loaded_at = time.time()
+
+
+def _close_store(db) -> None:
+    """Chroma のクライアントを閉じる（共有キャッシュの System は最後の参照が閉じられた時点で止まる）。"""
+    client = getattr(db, "_client", None)
+    if client is not None and hasattr(client, "close"):
+        try:
+            client.close()
+        except Exception as e:
+            print(f"[IndexManager] Chroma クライアントを閉じられませんでした: {e}")
+
+
+class IndexManager:
+    """
+    公開中のインデックス（storage/CURRENT）を開いて保持し、新しいバージョンに差し替える。
+
+    差し替えはバックグラウンドで「開く → ウォームアップ → 切り替え」の順に行い、
+    切り替えは参照の付け替え1回で済ませる。処理中のリクエストは acquire() で借りた
+    古いバージョンのまま最後まで処理し、参照が無くなった時点で古いバージョンを手放して
+    不要になったバージョンのディレクトリを削除する。
+
+    各ワーカーは監視スレッドで INDEX_CHECK_INTERVAL 秒ごとに CURRENT を確認し、変わっていれば
+    自分で切り替える（管理 API の reload が届かなかったワーカーや、リクエストの来ていない
+    ワーカーも追従する）。
+    """
+
+    def __init__(self, storage_dir: Path, check_interval: float = INDEX_CHECK_INTERVAL):
+        self.storage_dir = Path(storage_dir)
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._active: IndexHandle | None = None
+        self._retired: list[IndexHandle] = []
+        self._loading: str | None = None
+        self._failed: str | None = None
+        self._watcher: threading.Thread | None = None
+        self._last_reload: dict = {}
+        self._counters = {"reloads": 0, "failures": 0, "gc_removed": 0}
+
+    def _published(self) -> str:
+        return current_version(self.storage_dir) or LEGACY_VERSION
+
+    def _open(self, version: str) -> IndexHandle:
+        persist_dir, index_dir = version_dirs(self.storage_dir, version)
+        if version != LEGACY_VERSION and not persist_dir.exists():
+            raise FileNotFoundError(f"バージョンのディレクトリがありません: {persist_dir}")
+        db = open_vectorstore(persist_dir, index_dir=index_dir)
+        # faq.json はバージョンのディレクトリ（旧レイアウトでは storage/）に置く
+        faq = FAQStore.open(index_dir.parent / FAQ_NAME, db) if FAQ_ENABLED else None
+        return IndexHandle(version, db, persist_dir, index_dir, faq)
+
+    @staticmethod
+    def _warm(handle: IndexHandle) -> None:
+        """
+        BM25 転置リスト・量子化行列のページを読み込み、代表的な検索を流して各種遅延初期化を済ませる。
+
+        float32 の Embedding 行列全体は読まない（検索で触れる行だけが自然にページキャッシュに載る）。
+        """
+        shared = getattr(handle.db, "shared_index", None)
+        if shared is not None:
+            shared.prefetch(getattr(handle.db, "quantization", "none"))
+        found = 0
+        for query in INDEX_WARMUP_QUERIES:
+            found += len(hybrid_retrieve_with_score(handle.db, query, k=TOP_K))
+        if INDEX_WARMUP_QUERIES and found == 0:
+            raise RuntimeError("ウォームアップ検索の結果が0件です（インデックスが空の可能性があります）")
+
+    def _ensure_loaded(self) -> None:
+        if self._active is not None:
+            return
+        with self._init_lock:
+            if self._active is None:
+                handle = self._open(self._published())
+                with self._lock:
+                    self._active = handle
+                print(f"[IndexManager] インデックスを開きました: {handle.version}")
+                if self._check_interval > 0:
+                    self._watcher = threading.Thread(target=self._watch, name="index-watch", daemon=True)
+                    self._watcher.start()
+
+    def _watch(self) -> None:
+        """CURRENT を一定間隔で確認し、変わっていればバックグラウンドで切り替えを始める。"""
+        while True:
+            time.sleep(self._check_interval)
+            try:
+                version = self._published()
+                if version != self._active.version and version != self._failed:
+                    self.reload(version)
+            except Exception as e:
+                print(f"[IndexManager] CURRENT の確認に失敗しました: {e}")
+
+    @contextmanager
+    def acquire(self):
+        """
+        公開中のインデックスを借りる（IndexHandle を返す）。
+
+        with の間に切り替えが起きても、借りたバージョンは手放されない。
+        """
+        self._ensure_loaded()
+        with self._lock:
+            handle = self._active
+            handle.refs += 1
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                handle.refs -= 1
+                release = handle.retired and handle.refs == 0
+            if release:
+                self._release(handle)
+
+    def reload(self, version: str | None = None, publish: bool = False) -> dict:
+        """
+        version（省略時は CURRENT）への切り替えをバックグラウンドで始める。
+
+        publish=True なら先に CURRENT を version に差し替える（ロールバック用。他のワーカーも追従する）。
+        """
+        self._ensure_loaded()
+        if version is not None and version != LEGACY_VERSION and version not in list_versions(self.storage_dir):
+            raise ValueError(f"存在しないバージョンです: {version}")
+        if publish and version is not None:
+            publish_version(self.storage_dir, version)
+        version = version or self._published()
+        with self._lock:
+            if self._loading is not None:
+                return {"status": "already_loading", "version": self._loading}
+            if self._active.version == version:
+                return {"status": "unchanged", "version": version}
+            self._loading = version
+        threading.Thread(target=self._load_and_swap, args=(version,), name="index-reload", daemon=True).start()
+        return {"status": "loading", "version": version}
+
+    def _load_and_swap(self, version: str) -> None:
+        start = time.perf_counter()
+        try:
+            handle = self._open(version)
+            opened = time.perf_counter()
+            self._warm(handle)
+        except Exception as e:
+            print(f"[IndexManager] {version} の読み込みに失敗したため切り替えません: {e}")
+            with self._lock:
+                self._loading = None
+                self._failed = version
+                self._counters["failures"] += 1
+                self._last_reload = {"version": version, "error": f"{type(e).__name__}: {e}"}
+            return
+        warmed = time.perf_counter()
+
+        with self._lock:
+            old = self._active
+            self._active = handle
+            self._loading = None
+            self._failed = None
+            old.retired = True
+            release = old.refs == 0
+            if not release:
+                self._retired.append(old)
+            self._counters["reloads"] += 1
+            self._last_reload = {
+                "version": version,
+                "previous": old.version,
+                "load_ms": round((opened - start) * 1000, 1),
+                "warm_ms": round((warmed - opened) * 1000, 1),
+            }
+        print(f"[IndexManager] {old.version} → {version} に切り替えました"
+              f"（読み込み {self._last_reload['load_ms']}ms / ウォームアップ {self._last_reload['warm_ms']}ms）")
+        if release:
+            self._release(old)
+
+    def _release(self, handle: IndexHandle) -> None:
+        """切り替え済みで処理中のリクエストが無くなったバージョンを手放し、古いディレクトリを削除する。"""
+        with self._lock:
+            if handle in self._retired:
+                self._retired.remove(handle)
+            in_use = {self._active.version, *(h.version for h in self._retired)}
+            if self._loading is not None:
+                in_use.add(self._loading)
+        db, handle.db = handle.db, None
+        _close_store(db)
+        removed = gc_versions(self.storage_dir, keep=INDEX_KEEP_VERSIONS, in_use=in_use)
+        if removed:
+            with self._lock:
+                self._counters["gc_removed"] += len(removed)
+            print(f"[IndexManager] 古いバージョンを削除しました: {', '.join(removed)}")
+
+    def status(self) -> dict:
+        with self._lock:
+            active = self._active
+            return {
+                **self._counters,
+                "version": active.version if active else None,
+                "published": self._published(),
+                "loaded_at": round(active.loaded_at, 3) if active else None,
+                "in_flight": active.refs if active else 0,
+                "loading": self._loading,
+                "retired": [{"version": h.version, "in_flight": h.refs} for h in self._retired],
+                "last_reload": self._last_reload,
+                "faq": active.faq.stats() if active and active.faq else None,
+            }
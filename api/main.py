@@ -1,11 +1,14 @@
 from dotenv import load_dotenv
+
+# rag.config は import 時に環境変数を読むため、ルーターより先に .env を反映する
+load_dotenv()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from api.routers import chat, logs
+from api.routers import admin, chat, logs, metrics
 from api.config import get_allowed_origins, ALLOW_METHODS, ALLOW_HEADERS
-
-load_dotenv()
+from rag.config import LLM_BACKEND, EMBEDDING_BACKEND
 
 app = FastAPI(title="RAG Customer Support API", version="1.0.0")
 
@@ -19,8 +22,10 @@ app.add_middleware(
 
 app.include_router(chat.router, prefix="/api")
 app.include_router(logs.router, prefix="/api")
+app.include_router(metrics.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
 
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "llm_backend": LLM_BACKEND, "embedding_backend": EMBEDDING_BACKEND}
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from api.routers import chat
+from api.schemas import IndexReloadRequest
+from api.security import verify_api_key
+from rag.index_versions import list_versions
+
+router = APIRouter()
+
+
+@router.get("/admin/index", dependencies=[Depends(verify_api_key)])
+def index_status():
+    # マルチワーカー時は応答したワーカー1プロセス分の状態になる
+    manager = chat.index_manager()
+    return {**manager.status(), "versions": list_versions(manager.storage_dir)}
+
+
+@router.post("/admin/index/reload", dependencies=[Depends(verify_api_key)])
+def reload_index(request: IndexReloadRequest | None = None):
+    """
+    新しいバージョンをバックグラウンドで読み込み・ウォームアップしてから切り替える。
+
+    他のワーカーは storage/CURRENT の変化を検知して追従する（INDEX_CHECK_INTERVAL 秒以内）。
+    """
+    version = request.version if request else None
+    try:
+        return chat.index_manager().reload(version, publish=version is not None)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
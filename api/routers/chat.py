@@ -1,21 +1,30 @@
 import csv
+import re
+import time
 import traceback
+import unicodedata
 from datetime import datetime
 from pathlib import Path
 
 from fastapi import APIRouter, HTTPException
-from langchain_openai import ChatOpenAI
 
-from rag.config import MODEL_NAME, TEMPERATURE, TOP_K, WEAK_SCORE_THRESHOLD, AGENT_ROUNDS
+from rag.config import TOP_K, WEAK_SCORE_THRESHOLD, AGENT_ROUNDS, FORMAT_PREFETCH, RERANK_TOP_N, PARENT_EXPAND_MIN_HITS, FAQ_ENABLED
+from rag.chunking import expand_to_parents
 from rag.query import guess_category, rewrite_query_for_search
-from rag.vectorstore import open_vectorstore, hybrid_retrieve_with_score
+from rag.rerank import rerank
+from rag.retrieval_cache import RetrievalCache, index_generation
 from rag.agent import agent_answer
-from api.schemas import ChatRequest, ChatResponse, CitationItem
+from rag.formatter import FormatCache
+from rag.providers import create_llm
+from rag.llm_gateway import LLMBackpressureError
+from api.index_manager import IndexHandle, IndexManager
+from api.singleflight import SingleFlight
+from api.schemas import ChatRequest, ChatResponse, CitationItem, FormatRequest, FormatResponse
 
 router = APIRouter()
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
-PERSIST_DIR = BASE_DIR / "storage" / "chroma"
+STORAGE_DIR = BASE_DIR / "storage"
 
 LOG_HEADERS = [
     "日時", "質問", "回答", "カテゴリ",
@@ -23,8 +32,11 @@ LOG_HEADERS = [
     "エージェント実行回数", "使用トークン数", "参照資料",
 ]
 
-_db = None
+_index = IndexManager(STORAGE_DIR)
 _llm = None
+_format_cache = FormatCache()
+_retrieval_cache = RetrievalCache()
+_inflight = SingleFlight()
 
 
 def _log_path() -> Path:
@@ -32,17 +44,11 @@ def _log_path() -> Path:
     return BASE_DIR / "logs" / filename
 
 
-def _get_db():
-    global _db
-    if _db is None:
-        _db = open_vectorstore(PERSIST_DIR)
-    return _db
-
-
 def _get_llm():
     global _llm
     if _llm is None:
-        _llm = ChatOpenAI(model=MODEL_NAME, temperature=TEMPERATURE)
+        # 429 の再試行は LLM ゲートウェイ側で行う（二重リトライを避ける）
+        _llm = create_llm(max_retries=0)
     return _llm
 
 
@@ -51,8 +57,8 @@ def _save_log(
     answer: str,
     category: str,
     best_score,
-    accuracy: int,
-    completeness: int,
+    accuracy: int | None,
+    completeness: int | None,
     agent_loops: int,
     agent_tokens: int,
     citations: list,
@@ -67,8 +73,8 @@ def _save_log(
         "回答": answer,
         "カテゴリ": category,
         "最高スコア": round(best_score, 4) if best_score is not None else "",
-        "正確性": accuracy,
-        "完全性": completeness,
+        "正確性": accuracy if accuracy is not None else "",
+        "完全性": completeness if completeness is not None else "",
         "エージェント実行回数": agent_loops,
         "使用トークン数": agent_tokens,
         "参照資料": sources,
@@ -93,13 +99,23 @@ def _build_followup_questions() -> str:
 """
 
 
-@router.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest):
-    user_text = request.question.strip()
-    if not user_text:
-        raise HTTPException(status_code=422, detail="質問が空です")
+def _coalesce_key(question: str) -> str:
+    """表記ゆれ（全角/半角・空白・末尾の記号）を吸収した質問とカテゴリで同一性を判定する。"""
+    q = unicodedata.normalize("NFKC", question).lower()
+    q = re.sub(r"\s+", " ", q).strip()
+    q = q.rstrip("?!.。、 ")
+    return f"{guess_category(q)}:{q}"
+
+
+def _answer_question(user_text: str) -> dict:
+    # インデックスが差し替えられても、この質問は開始時点のバージョンで最後まで処理する
+    with _index.acquire() as index:
+        return _run_pipeline(user_text, index)
 
-    db = _get_db()
+
+def _run_pipeline(user_text: str, index: IndexHandle) -> dict:
+    """RAGパイプライン本体（検索→回答生成→自己評価）。結果はログ保存前の値を返す。"""
+    db = index.db
     llm = _get_llm()
 
     category = ""
@@ -110,21 +126,64 @@ def chat(request: ChatRequest):
     agent_tokens = 0
     citations: list[dict] = []
     context = ""
+    timings: dict[str, float] = {}
+    start = time.perf_counter()
+
+    def _lap(stage: str, since: float) -> float:
+        now = time.perf_counter()
+        timings[stage] = round((now - since) * 1000, 1)
+        return now
+
+    # よくある意図の短い質問は、このバージョン用に作っておいた回答をそのまま返す（LLM・検索なし）
+    faq = index.faq.match(user_text) if FAQ_ENABLED and index.faq is not None else None
+    if faq is not None:
+        _lap("faq_ms", start)
+        # 整形の先読みは回答ごとに1回だけ実行される（FormatCache が同じ回答をまとめる）
+        if FORMAT_PREFETCH:
+            _format_cache.prefetch(llm, faq["answer"])
+        _lap("total_ms", start)
+        return {
+            "answer": faq["answer"],
+            "category": faq["category"],
+            "best_score": faq["best_score"],
+            "accuracy": faq["accuracy"],
+            "completeness": faq["completeness"],
+            "agent_loops": 0,
+            "agent_tokens": 0,
+            "citations": [dict(c) for c in faq["citations"]],
+            "timings": timings,
+            "faq_intent": faq["intent"],
+        }
 
     try:
+        t = start
         search_query = rewrite_query_for_search(user_text, llm=llm)
+        t = _lap("rewrite_ms", t)
         category = guess_category(user_text, llm=llm)
+        t = _lap("category_ms", t)
 
-        search_results = hybrid_retrieve_with_score(
-            db=db,
-            query=search_query,
+        # インデックスのバージョンが変わった（作り直された）らキャッシュを破棄する
+        search_results = _retrieval_cache.retrieve(
+            db,
+            search_query,
             k=TOP_K,
             category=category,
+            generation=(index.version, *index_generation(index.index_dir / "manifest.json",
+                                                         index.persist_dir / "chroma.sqlite3")),
         )
+        t = _lap("retrieve_ms", t)
 
         if search_results:
+            # 補助質問の判定は並べ替え・絞り込み前の全候補のベクトル距離で行う
             scores = [score for _, score in search_results]
             best_score = min(scores)
+            if RERANK_TOP_N > 0:
+                search_results = rerank(db, search_query, search_results, top_n=RERANK_TOP_N)
+                t = _lap("rerank_ms", t)
+            # 同じ親の子チャンクが複数ヒットしたものだけ親チャンク（見出しセクション）に広げる
+            if PARENT_EXPAND_MIN_HITS > 0:
+                search_results = expand_to_parents(db, search_results)
+                t = _lap("expand_ms", t)
             context = "\n\n---\n\n".join(doc.page_content for doc, _ in search_results)
 
             for doc, score in search_results:
@@ -137,6 +196,7 @@ def chat(request: ChatRequest):
                     "category": cat,
                     "source": src,
                     "page": (page + 1) if isinstance(page, int) else None,
+                    "section": doc.metadata.get("section") or None,
                     "quote": quote,
                     "score": score,
                 })
@@ -153,32 +213,81 @@ def chat(request: ChatRequest):
     elif best_score is not None and best_score > WEAK_SCORE_THRESHOLD:
         answer = _build_followup_questions()
     else:
-        result = agent_answer(llm, user_text, context, rounds=AGENT_ROUNDS)
+        t = time.perf_counter()
+        try:
+            result = agent_answer(llm, user_text, context, rounds=AGENT_ROUNDS)
+        except LLMBackpressureError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        _lap("agent_ms", t)
         answer = result["answer"]
         agent_loops = result["loops"]
         agent_tokens = result["tokens"]
         accuracy = result["accuracy"]
         completeness = result["completeness"]
+        # ボタン押下を待たずにコール/チャット両モードを先読み整形しておく
+        # （定型文・補助質問は LLM の回答ではないため先読みしない）
+        if FORMAT_PREFETCH:
+            _format_cache.prefetch(llm, answer)
 
-    _save_log(
-        question=user_text,
-        answer=answer,
-        category=category,
-        best_score=best_score,
-        accuracy=accuracy,
-        completeness=completeness,
-        agent_loops=agent_loops,
-        agent_tokens=agent_tokens,
-        citations=citations,
-    )
+    _lap("total_ms", start)
+
+    return {
+        "answer": answer,
+        "category": category,
+        "best_score": best_score,
+        "accuracy": accuracy,
+        "completeness": completeness,
+        "agent_loops": agent_loops,
+        "agent_tokens": agent_tokens,
+        "citations": citations,
+        "timings": timings,
+        "faq_intent": None,
+    }
+
+
+@router.post("/chat", response_model=ChatResponse)
+def chat(request: ChatRequest):
+    user_text = request.question.strip()
+    if not user_text:
+        raise HTTPException(status_code=422, detail="質問が空です")
+
+    # 同じ質問が同時に来た場合はパイプラインを1回だけ実行して結果を共有する
+    result, coalesced = _inflight.do(_coalesce_key(user_text), lambda: _answer_question(user_text))
+    if coalesced:
+        print(f"[chat] 実行中の同一質問に相乗り: {user_text[:30]}")
+
+    _save_log(question=user_text, **{k: v for k, v in result.items() if k not in ("timings", "faq_intent")})
 
     return ChatResponse(
-        answer=answer,
-        category=category,
-        best_score=best_score,
-        accuracy=accuracy,
-        completeness=completeness,
-        agent_loops=agent_loops,
-        agent_tokens=agent_tokens,
-        citations=[CitationItem(**c) for c in citations],
+        **{k: v for k, v in result.items() if k != "citations"},
+        citations=[CitationItem(**c) for c in result["citations"]],
+        coalesced=coalesced,
     )
+
+
+def coalesce_stats() -> dict:
+    return _inflight.stats()
+
+
+def retrieval_cache_stats() -> dict:
+    return _retrieval_cache.stats()
+
+
+def index_manager() -> IndexManager:
+    return _index
+
+
+@router.post("/format", response_model=FormatResponse)
+def format_answer(request: FormatRequest):
+    answer = request.answer.strip()
+    if not answer:
+        raise HTTPException(status_code=422, detail="回答が空です")
+
+    try:
+        formatted, cached = _format_cache.get(_get_llm(), answer, request.mode)
+    except LLMBackpressureError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {e}")
+
+    return FormatResponse(mode=request.mode, formatted=formatted, cached=cached)
@@ -2,9 +2,11 @@ import os
 from datetime import datetime
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import FileResponse
 
+from api.security import verify_api_key
+
 router = APIRouter()
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -16,13 +18,7 @@ def _check_enabled():
         raise HTTPException(status_code=404, detail="Log API is disabled")
 
 
-def _verify_api_key(x_api_key: str | None = Header(default=None, alias="x-api-key")):
-    expected = os.getenv("ADMIN_API_KEY", "")
-    if not expected or x_api_key != expected:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-
-
-_deps = [Depends(_check_enabled), Depends(_verify_api_key)]
+_deps = [Depends(_check_enabled), Depends(verify_api_key)]
 
 
 @router.get("/logs", dependencies=_deps)
@@ -0,0 +1,21 @@
+import os
+
+from fastapi import APIRouter, Depends
+
+from api.security import verify_api_key
+from api.routers import chat
+from rag.llm_gateway import get_gateway
+
+router = APIRouter()
+
+
+@router.get("/metrics", dependencies=[Depends(verify_api_key)])
+def metrics():
+    # マルチワーカー時は応答したワーカー1プロセス分の値になる
+    return {
+        "worker_pid": os.getpid(),
+        "chat_coalescing": chat.coalesce_stats(),
+        "retrieval_cache": chat.retrieval_cache_stats(),
+        "index": chat.index_manager().status(),
+        "llm_gateway": get_gateway().stats(),
+    }
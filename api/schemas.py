@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
 
@@ -9,6 +11,7 @@ class CitationItem(BaseModel):
     category: str
     source: str
     page: int | None = None
+    section: str | None = None
     quote: str
     score: float
 
@@ -17,14 +20,32 @@ class ChatResponse(BaseModel):
     answer: str
     category: str
     best_score: float | None = None
-    accuracy: int
-    completeness: int
+    accuracy: int | None = None      # 自己評価スコア（0〜100）。自己評価をしていない回答（FAQ の抜粋回答）は None
+    completeness: int | None = None
     agent_loops: int
     agent_tokens: int
     citations: list[CitationItem]
+    timings: dict[str, float] = {}  # 処理段階ごとの所要時間（ミリ秒）
+    coalesced: bool = False         # 同時に来た同一質問の実行結果を共有したか
+    faq_intent: str | None = None   # 事前生成回答を返した場合の意図ID（rag/faq.py）
+
+
+class FormatRequest(BaseModel):
+    answer: str
+    mode: Literal["call", "chat"]
+
+
+class FormatResponse(BaseModel):
+    mode: str
+    formatted: str
+    cached: bool
 
 
 class LogFile(BaseModel):
     filename: str
     size: int
     modified: str
+
+
+class IndexReloadRequest(BaseModel):
+    version: str | None = None  # 省略時は storage/CURRENT。指定時は CURRENT をそのバージョンに差し替える（ロールバック）
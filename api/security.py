@@ -0,0 +1,9 @@
+import os
+
+from fastapi import Header, HTTPException
+
+
+def verify_api_key(x_api_key: str | None = Header(default=None, alias="x-api-key")):
+    expected = os.getenv("ADMIN_API_KEY", "")
+    if not expected or x_api_key != expected:
+        raise HTTPException(status_code=401, detail="Unauthorized")
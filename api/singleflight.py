@@ -0,0 +1,69 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中なら、新たに実行せずその結果を共有する（single-flight）。
+
+    先に来たリクエスト（leader）だけが fn を実行し、実行中に同じキーで
+    到着したリクエストは完了を待って同じ結果（または例外）を受け取る。
+    完了後の結果は保持しない（キャッシュではない）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+        self._counters = {"executed": 0, "coalesced": 0}
+
+    def do(self, key: str, fn) -> tuple[object, bool]:
+        """
+        Returns:
+            (fn の結果, 他リクエストの実行結果を共有したかどうか)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._counters["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._counters["executed"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            executed = self._counters["executed"]
+            coalesced = self._counters["coalesced"]
+            total = executed + coalesced
+            return {
+                **self._counters,
+                "in_flight": len(self._calls),
+                "coalesce_rate": round(coalesced / total, 4) if total else 0.0,
+            }
@@ -1,18 +1,29 @@
+import importlib.util
 import os
+import random
+import time
 from datetime import datetime
 from pathlib import Path
 
 import httpx
 import streamlit as st
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 
-from rag.config import MODEL_NAME, TEMPERATURE
-from rag.prompts import get_mode_prompt
 from rag.ui import render_citations, render_agent_log, render_copy_button
 
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 
+# API クライアント設定（接続確立は短く、RAG処理の待ちは長く取る）
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5.0"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "120.0"))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "2"))
+API_RETRY_BACKOFF = 0.5  # 秒。試行ごとに倍々で待つ
+
+# サーバーが処理していないと判断できる失敗のみ再試行する（POSTの二重実行を避ける）
+# 504 は API が受け付けて処理中のことが多い（再試行すると LLM 呼び出し・ログ保存まで二重に走る）ため再試行しない
+_RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+_RETRYABLE_STATUS = {502, 503}
+
 THINKING_STEPS: list[tuple[str, str]] = [
     ("🔍", "質問の意図を分析中..."),
     ("📄", "関連ドキュメントを検索中..."),
@@ -55,11 +66,6 @@ def _show_sidebar(
         render_agent_log(data)
 
 
-@st.cache_resource(show_spinner=False)
-def get_llm():
-    return ChatOpenAI(model=MODEL_NAME, temperature=TEMPERATURE)
-
-
 def safe_avatar(icon_path: Path) -> str | None:
     if icon_path and icon_path.exists():
         return str(icon_path)
@@ -69,15 +75,45 @@ def safe_avatar(icon_path: Path) -> str | None:
     return None
 
 
-def call_chat_api(question: str) -> dict:
+@st.cache_resource(show_spinner=False)
+def get_api_client() -> httpx.Client:
+    """API 呼び出し用の keep-alive 接続プールを返す（プロセス内で共有）。"""
+    return httpx.Client(
+        base_url=API_URL,
+        http2=importlib.util.find_spec("h2") is not None,
+        timeout=httpx.Timeout(API_READ_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+    )
+
+
+def _post_with_retry(path: str, payload: dict) -> tuple[httpx.Response, float]:
+    """
+    接続失敗・502/503 のときだけバックオフ付きで再試行して POST する（504 はそのままエラーを表示する）。
+    クライアント側のレイテンシを計測してログに出す。
+    """
+    client = get_api_client()
+    start = time.perf_counter()
+    for attempt in range(API_MAX_RETRIES + 1):
+        try:
+            resp = client.post(path, json=payload)
+            if resp.status_code not in _RETRYABLE_STATUS or attempt == API_MAX_RETRIES:
+                break
+        except _RETRYABLE_ERRORS:
+            if attempt == API_MAX_RETRIES:
+                raise
+        time.sleep(API_RETRY_BACKOFF * (2 ** attempt) + random.uniform(0, API_RETRY_BACKOFF))
+    elapsed = time.perf_counter() - start
+    print(f"[API] POST {path} {resp.status_code}: {elapsed:.2f}秒 (試行{attempt + 1}回, {resp.http_version})")
+    return resp, elapsed
+
+
+def _call_api(path: str, payload: dict) -> dict:
     try:
-        resp = httpx.post(
-            f"{API_URL}/api/chat",
-            json={"question": question},
-            timeout=120.0,
-        )
+        resp, elapsed = _post_with_retry(path, payload)
         resp.raise_for_status()
-        return resp.json()
+        data = resp.json()
+        data["client_latency"] = elapsed
+        return data
     except httpx.HTTPStatusError as e:
         detail = ""
         try:
@@ -89,14 +125,19 @@ def call_chat_api(question: str) -> dict:
         raise RuntimeError(f"API への接続に失敗しました: {e}") from e
 
 
+def call_chat_api(question: str) -> dict:
+    return _call_api("/api/chat", {"question": question})
+
+
+def call_format_api(answer: str, mode: str) -> str:
+    """コール/チャットモードの整形をAPIに依頼する（サーバー側で先読み・キャッシュ済み）。"""
+    return _call_api("/api/format", {"answer": answer, "mode": mode})["formatted"]
+
+
 def main():
     st.set_page_config(page_title="問い合わせ対応支援RAGエージェント", layout="wide")
 
     load_dotenv()
-    if not os.getenv("OPENAI_API_KEY"):
-        st.error("OPENAI_API_KEY が .env に設定されていません")
-        st.stop()
-    os.environ["OPENAI_API_KEY"] = os.environ["OPENAI_API_KEY"].strip()
 
     BASE_DIR = Path(__file__).resolve().parent
     user_icon_path = BASE_DIR / "images" / "User_アイコン.png"
@@ -156,22 +197,27 @@ def main():
 
     if st.session_state.display_mode and st.session_state.last_answer:
         mode = st.session_state.display_mode
+        st.session_state.display_mode = None
+        format_error = None
         if mode not in st.session_state.formatted_answers:
-            llm = get_llm()
-            prompt = get_mode_prompt(mode, st.session_state.last_answer)
             with st.spinner("整形中..."):
-                formatted = llm.invoke([{"role": "user", "content": prompt}]).content
-            st.session_state.formatted_answers[mode] = formatted
-            label = "📞 コールモード" if mode == "call" else "💬 チャットモード"
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": f"**【{label}】**\n\n{formatted}",
-                "mode": mode,
-                "formatted_text": formatted,
-            })
-            st.session_state.messages = st.session_state.messages[-MAX_MESSAGES:]
-        st.session_state.display_mode = None
-        st.rerun()
+                try:
+                    formatted = call_format_api(st.session_state.last_answer, mode)
+                except RuntimeError as e:
+                    format_error = str(e)
+            if format_error is None:
+                st.session_state.formatted_answers[mode] = formatted
+                label = "📞 コールモード" if mode == "call" else "💬 チャットモード"
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": f"**【{label}】**\n\n{formatted}",
+                    "mode": mode,
+                    "formatted_text": formatted,
+                })
+                st.session_state.messages = st.session_state.messages[-MAX_MESSAGES:]
+        if format_error is None:
+            st.rerun()
+        st.error(format_error)
 
     messages_to_show = st.session_state.messages[-MAX_MESSAGES:]
     last_rag_idx = next(
@@ -227,10 +273,11 @@ def main():
 
         answer = data["answer"]
         citations = [dict(c) for c in data.get("citations", [])]
-        accuracy = data.get("accuracy", 0)
-        completeness = data.get("completeness", 0)
+        accuracy = data.get("accuracy")
+        completeness = data.get("completeness")
         agent_loops = data.get("agent_loops", 0)
         agent_tokens = data.get("agent_tokens", 0)
+        client_latency = data.get("client_latency")
 
         st.markdown(answer)
 
@@ -238,8 +285,9 @@ def main():
     final_log = {
         "steps": _make_steps(len(THINKING_STEPS)),
         "is_processing": False,
-        "self_eval": {"accuracy": accuracy, "completeness": completeness},
-        "exec_meta": {"loops": agent_loops, "tokens": agent_tokens},
+        # 自己評価をしていない回答（FAQ の抜粋回答）はスコアを表示しない
+        "self_eval": {"accuracy": accuracy, "completeness": completeness} if accuracy is not None else None,
+        "exec_meta": {"loops": agent_loops, "tokens": agent_tokens, "latency": client_latency},
     }
     with agent_log_placeholder.container():
         render_agent_log(final_log)
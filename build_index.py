@@ -1,17 +1,55 @@
 # ------------------------------------------------------------
-# 1) data/ 配下のPDFを読み込む（サブフォルダも対象）
-# 2) 文書を分割してEmbedding
-# 3) Chroma(storage/chroma) に保存
+# 1) data/ 配下の文書を読み込む（サブフォルダも対象）
+#    同名の .md があれば PDF の代わりに markdown を見出しのセクション単位で読む（INGEST_FORMAT / --format）
+# 2) 文書を分割してEmbedding（文末・見出しの境界でトークン数に収まる親子チャンク。CHUNKER=char で従来の文字数分割）
+# 3) Chroma(storage/versions/<バージョン>/chroma) に保存
+# 4) 共有インデックス(storage/versions/<バージョン>/index) を書き出す（複数ワーカーで mmap 共有）
+#    よくある意図の事前生成回答(storage/versions/<バージョン>/faq.json) も作る（FAQ_ENABLED）
+# 5) storage/CURRENT を新しいバージョンに差し替え、古いバージョンを削除する
+#    （起動中の API は CURRENT の変化を検知して再起動なしで切り替える）
+#
+# --watch を付けると常駐して data/ を監視し、追加・更新・削除された文書だけを
+# 公開中のバージョンのコピーに反映して新しいバージョンとして公開する
+# （変更の無い文書は Embedding し直さない）。
+#
+# 使い方:
+#     python build_index.py
+#     python build_index.py --export-only   # 公開中のバージョンの Chroma から共有インデックスだけ作り直して新しいバージョンで公開
+#     python build_index.py --watch         # data/ の変更を監視して差分だけ再インデックスする
+#     python build_index.py --format pdf    # markdown を使わず PDF だけから作る
 # ------------------------------------------------------------
+import argparse
+import hashlib
 import os
+import shutil
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 
-from langchain_community.document_loaders import PyPDFDirectoryLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
+load_dotenv()
+
+from chromadb.api.client import SharedSystemClient
 from langchain_chroma import Chroma
 
+from rag.config import EMBEDDING_BACKEND, FAQ_ENABLED, INDEX_KEEP_VERSIONS, INDEX_WATCH_DEBOUNCE, INDEX_WATCH_INTERVAL, INGEST_FORMAT
+from rag.index_versions import (
+    LEGACY_VERSION,
+    create_version,
+    current_version,
+    gc_versions,
+    publish_version,
+    read_sources,
+    version_dirs,
+    write_sources,
+)
+from rag.chunking import split_documents
+from rag.faq import FAQ_NAME, build_faq, write_faq
+from rag.ivf import IVFIndex
+from rag.loader import SOURCE_SUFFIXES, load_source_documents, select_source_files
+from rag.providers import create_embeddings
+from rag.shared_index import export_shared_index
+from rag.vectorstore import open_vectorstore
+
 
 # ------------------------------------------------------------
 # 追加: source からカテゴリ(company/customer/service)を付与する
@@ -35,73 +73,333 @@ def infer_category_from_source(source: str) -> str:
     return "unknown"
 
 
-def main():
-    # ------------------------------------------------------------
-    # 0) APIキー確認
-    # ------------------------------------------------------------
-    load_dotenv()
-    if not os.getenv("OPENAI_API_KEY"):
-        raise RuntimeError("OPENAI_API_KEY が .env に設定されていません")
+def export_index(db, index_dir: Path, base_index_dir: Path | None = None) -> None:
+    """共有インデックスを書き出す。base_index_dir の IVF があれば重心を再利用する（差分更新用）。"""
+    base_ivf = None
+    if base_index_dir is not None and (base_index_dir / "ivf.json").exists():
+        base_ivf = IVFIndex.load(base_index_dir)
+    export_shared_index(db, index_dir, base_ivf=base_ivf)
+    print(f"共有インデックス: {index_dir}")
+
+
+def export_faq(version_dir: Path) -> None:
+    """書き出したインデックスで検索して、よくある意図の回答を faq.json に保存する。"""
+    if not FAQ_ENABLED:
+        return
+    db = open_vectorstore(version_dir / "chroma", index_dir=version_dir / "index")
+    faq = build_faq(db)
+    write_faq(version_dir / FAQ_NAME, faq)
+    print(f"事前生成回答: {version_dir / FAQ_NAME}（{len(faq['entries'])} 件 / {faq['mode']}）")
+
+
+def open_chroma(persist_dir: Path) -> Chroma:
+    return Chroma(
+        collection_name="docs",
+        persist_directory=str(persist_dir),
+        embedding_function=create_embeddings(),
+    )
+
+
+# ------------------------------------------------------------
+# 元文書の一覧（data/ からの相対パス → 更新時刻・サイズ・SHA-256）
+# バージョンごとに sources.json として残し、--watch はこれとの差分だけを再インデックスする
+# ------------------------------------------------------------
+
+def scan_sources(data_dir: Path) -> dict[str, tuple[int, int]]:
+    """data/ 配下の文書の (更新時刻, サイズ)。隠しファイル・Office の一時ファイルは除く。"""
+    found = {}
+    for path in data_dir.rglob("*"):
+        if path.suffix.lower() not in SOURCE_SUFFIXES or path.name.startswith((".", "~$")):
+            continue
+        try:
+            st = path.stat()
+        except OSError:
+            continue  # 走査中に消えた
+        found[path.relative_to(data_dir).as_posix()] = (st.st_mtime_ns, st.st_size)
+    return found
 
-    base_dir = Path(__file__).parent
-    pdf_dir = base_dir / "data"
-    persist_dir = base_dir / "storage" / "chroma"
 
-    if not pdf_dir.exists():
-        raise RuntimeError(f"PDFフォルダがありません: {pdf_dir}")
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def source_record(data_dir: Path, rel: str, stat: tuple[int, int]) -> dict:
+    return {"mtime_ns": stat[0], "size": stat[1], "sha256": file_digest(data_dir / rel)}
+
+
+def diff_sources(data_dir: Path, published: dict[str, dict], snapshot: dict[str, tuple[int, int]]):
+    """
+    公開中のバージョンの sources.json と現在の data/ を比べ、(変更・追加, 削除, 新しい一覧) を返す。
+
+    更新時刻・サイズが変わったファイルだけハッシュを取り、内容が同じなら変更とみなさない。
+    """
+    changed, sources = [], {}
+    for rel, stat in snapshot.items():
+        old = published.get(rel)
+        if old is not None and (old["mtime_ns"], old["size"]) == stat:
+            sources[rel] = old
+            continue
+        try:
+            record = source_record(data_dir, rel, stat)
+        except OSError:
+            continue  # 書き込み中・削除された。次の走査で拾う
+        if old is None or old["sha256"] != record["sha256"]:
+            changed.append(rel)
+        sources[rel] = record
+    removed = sorted(set(published) - set(snapshot))
+    return sorted(changed), removed, sources
+
+
+def source_key(data_dir: Path, source: str) -> str:
+    """
+    チャンクの metadata["source"] を data/ からの相対パスにする。
+
+    source は data/ の親からの相対パス（data/service/解約.pdf）だが、以前のバージョンには
+    実行時の絶対パスのまま保存したチャンクもあるため、パス中の data/ 以降を取り出す。
+    """
+    parts = Path(source.replace("\\", "/")).parts
+    if data_dir.name not in parts:
+        return source
+    last = len(parts) - 1 - parts[::-1].index(data_dir.name)
+    return "/".join(parts[last + 1:])
+
+
+def document_key(rel: str) -> str:
+    """拡張子を除いた文書名（同名の .md と .pdf は同じ文書）。"""
+    return rel.rsplit(".", 1)[0]
+
+
+def load_documents(paths: list[Path], data_dir: Path):
+    """data_dir 配下の文書を読み込み、カテゴリを付与する。"""
+    docs = load_source_documents(paths, data_dir)
+    for d in docs:
+        d.metadata["category"] = infer_category_from_source(d.metadata.get("source", ""))
+    return docs
+
+
+def publish(storage_dir: Path, version: str) -> list[str]:
+    publish_version(storage_dir, version)
+    return gc_versions(storage_dir, keep=INDEX_KEEP_VERSIONS)
+
+
+def build_full(data_dir: Path, storage_dir: Path, fmt: str = INGEST_FORMAT) -> str:
+    """data/ 全体から新しいバージョンを作って公開し、バージョン名を返す。"""
+    snapshot = scan_sources(data_dir)
 
     # ------------------------------------------------------------
-    # 1) PDF読み込み（data/配下をまとめて読む）
+    # 1) 文書読み込み（data/配下をまとめて読む。読み込み直後にカテゴリを付与）
     # ------------------------------------------------------------
-    loader = PyPDFDirectoryLoader(str(pdf_dir))
-    docs = loader.load()
+    files = select_source_files(data_dir, fmt)
+    docs = load_documents(files, data_dir)
 
     if not docs:
-        raise RuntimeError("PDFが1件も読み込めませんでした。data/配下にPDFがあるか確認してください。")
-
-    # docs を読み込んだ直後にカテゴリを付与
-    for d in docs:
-        src = d.metadata.get("source", "")
-        d.metadata["category"] = infer_category_from_source(src)
+        raise RuntimeError("文書が1件も読み込めませんでした。data/配下にPDFまたはmarkdownがあるか確認してください。")
 
     # ------------------------------------------------------------
     # 2) 分割
     # ------------------------------------------------------------
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=100,
-    )
-    splits = splitter.split_documents(docs)
+    splits = split_documents(docs)
 
     # ------------------------------------------------------------
-    # 3) Chromaへ保存（混在防止で一度コレクションを消す）
+    # 3) 新しいバージョンのディレクトリで Chroma へ保存
+    #    （毎回空のディレクトリに作るため、既存コレクションとの混在は起きない）
     # ------------------------------------------------------------
-    persist_dir.mkdir(parents=True, exist_ok=True)
+    version, version_dir = create_version(storage_dir)
+    db = open_chroma(version_dir / "chroma")
+    db.add_documents(splits)
+    write_sources(version_dir, {rel: source_record(data_dir, rel, stat) for rel, stat in snapshot.items()})
+    export_index(db, version_dir / "index")
+    export_faq(version_dir)
 
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    db = Chroma(
-        collection_name="docs",
-        persist_directory=str(persist_dir),
-        embedding_function=embeddings,
+    # ------------------------------------------------------------
+    # 4) 公開（CURRENT の差し替え）と古いバージョンの削除
+    # ------------------------------------------------------------
+    removed = publish(storage_dir, version)
+
+    print("インデックス作成完了")
+    markdown = sum(1 for f in files if f.suffix.lower() == ".md")
+    print(f"読み込み文書数: {len(files)}（markdown {markdown} / PDF {len(files) - markdown}）")
+    print(f"分割チャンク数: {len(splits)}")
+    print(f"公開バージョン: {version}（保存先: {version_dir}）")
+    if removed:
+        print(f"削除した古いバージョン: {', '.join(removed)}")
+    return version
+
+
+def build_incremental(
+    data_dir: Path,
+    storage_dir: Path,
+    base: str,
+    changed: list[str],
+    removed: list[str],
+    sources: dict[str, dict],
+    fmt: str = INGEST_FORMAT,
+) -> str:
+    """
+    公開中のバージョン base の Chroma をコピーし、changed / removed の文書のチャンクだけを
+    入れ替えて新しいバージョンとして公開する。Embedding するのは changed の文書だけ。
+
+    .md と .pdf は拡張子を除いた名前で同じ文書として扱い、どちらが変わっても
+    その文書を（.md を優先して）読み直す。IVF は base の重心を再利用し、リストの偏りが
+    大きくなったときだけ学習し直す。
+    """
+    start = time.perf_counter()
+    version, version_dir = create_version(storage_dir)
+    try:
+        shutil.copytree(version_dirs(storage_dir, base)[0], version_dir / "chroma")
+        db = open_chroma(version_dir / "chroma")
+
+        stale = {document_key(rel) for rel in changed + removed}
+        data = db.get(include=["metadatas"])
+        stale_ids = [
+            chunk_id for chunk_id, meta in zip(data["ids"], data["metadatas"])
+            if document_key(source_key(data_dir, (meta or {}).get("source", ""))) in stale
+        ]
+        if stale_ids:
+            db.delete(ids=stale_ids)
+        files = [
+            path for path in select_source_files(data_dir, fmt)
+            if document_key(path.relative_to(data_dir).as_posix()) in stale
+        ]
+        splits = split_documents(load_documents(files, data_dir))
+        if splits:
+            db.add_documents(splits)
+
+        write_sources(version_dir, sources)
+        export_index(db, version_dir / "index", base_index_dir=version_dirs(storage_dir, base)[1])
+        export_faq(version_dir)
+    except Exception:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    finally:
+        # 削除したバージョンのファイルを開いたままにしない
+        SharedSystemClient.clear_system_cache()
+
+    gc_removed = publish(storage_dir, version)
+    print(
+        f"[watch] {base} → {version} を公開しました（更新 {len(changed)} 件・削除 {len(removed)} 件、"
+        f"チャンク -{len(stale_ids)} / +{len(splits)}、{time.perf_counter() - start:.1f}s）"
     )
+    if gc_removed:
+        print(f"[watch] 削除した古いバージョン: {', '.join(gc_removed)}")
+    return version
+
+
+def build_export_only(storage_dir: Path) -> str:
+    """
+    公開中のバージョンの Chroma をコピーし、共有インデックスと事前生成回答だけを作り直して
+    新しいバージョンとして公開する（Embedding はし直さない）。
 
-    # 同名コレクションに追記されるのを避ける（課題では毎回作り直し推奨）
+    公開済みのバージョンは稼働中のワーカーが開いているため書き換えない。
+    """
+    base = current_version(storage_dir) or LEGACY_VERSION
+    base_persist, base_index = version_dirs(storage_dir, base)
+    if not base_persist.exists():
+        raise RuntimeError(f"公開中のインデックスがありません: {base_persist}（先に build_index.py を実行してください）")
+
+    version, version_dir = create_version(storage_dir)
     try:
-        db.delete_collection()
-        db = Chroma(
-            collection_name="docs",
-            persist_directory=str(persist_dir),
-            embedding_function=embeddings,
-        )
+        shutil.copytree(base_persist, version_dir / "chroma")
+        sources = read_sources(storage_dir, base)
+        if sources is not None:
+            write_sources(version_dir, sources)
+        db = open_chroma(version_dir / "chroma")
+        export_index(db, version_dir / "index", base_index_dir=base_index)
+        export_faq(version_dir)
     except Exception:
-        pass
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    finally:
+        SharedSystemClient.clear_system_cache()
 
-    db.add_documents(splits)
+    removed = publish(storage_dir, version)
+    print(f"公開バージョン: {version}（{base} の Chroma から共有インデックスを作り直しました）")
+    if removed:
+        print(f"削除した古いバージョン: {', '.join(removed)}")
+    return version
 
-    print("インデックス作成完了")
-    print(f"読み込みPDF数: {len(docs)}")
-    print(f"分割チャンク数: {len(splits)}")
-    print(f"保存先: {persist_dir}")
+
+def watch(data_dir: Path, storage_dir: Path, interval: float, debounce: float, fmt: str = INGEST_FORMAT) -> None:
+    """
+    data/ を interval 秒ごとに走査し、最後の変更から debounce 秒間変化が無くなったら
+    公開中のバージョンとの差分を再インデックスする（コピー途中のファイルを読まないため）。
+    """
+    published = read_sources(storage_dir, current_version(storage_dir))
+    if published is None:
+        print("[watch] 公開中のバージョンに元文書の記録が無いため、最初に全件でビルドします")
+        build_full(data_dir, storage_dir, fmt)
+        published = read_sources(storage_dir, current_version(storage_dir))
+
+    print(f"[watch] {data_dir} を監視しています（間隔 {interval}s・デバウンス {debounce}s、Ctrl+C で終了）")
+    snapshot = scan_sources(data_dir)
+    last_change = time.monotonic()
+    settled = False
+    while True:
+        time.sleep(interval)
+        current = scan_sources(data_dir)
+        if current != snapshot:
+            snapshot = current
+            last_change = time.monotonic()
+            settled = False
+            continue
+        if settled or time.monotonic() - last_change < debounce:
+            continue
+
+        settled = True  # 次に data/ が変わるまで差分を取り直さない
+        base = current_version(storage_dir)
+        published = read_sources(storage_dir, base) or published
+        changed, removed, sources = diff_sources(data_dir, published, snapshot)
+        if not changed and not removed:
+            continue
+        print(f"[watch] 変更を検知しました: 更新 {changed or 'なし'} / 削除 {removed or 'なし'}")
+        try:
+            build_incremental(data_dir, storage_dir, base, changed, removed, sources, fmt)
+        except Exception as e:
+            print(f"[watch] 再インデックスに失敗しました（公開中のバージョンはそのまま）: {type(e).__name__}: {e}")
+            settled = False
+            last_change = time.monotonic()  # デバウンス後に再試行する
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--export-only", action="store_true",
+                        help="公開中の Chroma から共有インデックスだけ作り直し、新しいバージョンとして公開する")
+    parser.add_argument("--format", choices=["auto", "pdf"], default=INGEST_FORMAT,
+                        help="auto: 同名の .md があれば markdown を優先 / pdf: PDF だけを読む")
+    parser.add_argument("--watch", action="store_true", help="data/ を監視し、変更された文書だけ再インデックスして公開する")
+    parser.add_argument("--interval", type=float, default=INDEX_WATCH_INTERVAL, help="監視の間隔（秒）")
+    parser.add_argument("--debounce", type=float, default=INDEX_WATCH_DEBOUNCE, help="最後の変更から再インデックスまで待つ秒数")
+    args = parser.parse_args()
+
+    # ------------------------------------------------------------
+    # 0) APIキー確認
+    # ------------------------------------------------------------
+    if EMBEDDING_BACKEND != "stub" and not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("OPENAI_API_KEY が .env に設定されていません")
+
+    base_dir = Path(__file__).parent
+    data_dir = base_dir / "data"
+    storage_dir = base_dir / "storage"
+
+    if args.export_only:
+        build_export_only(storage_dir)
+        return
+
+    if not data_dir.exists():
+        raise RuntimeError(f"文書フォルダがありません: {data_dir}")
+
+    if args.watch:
+        try:
+            watch(data_dir, storage_dir, args.interval, args.debounce, args.format)
+        except KeyboardInterrupt:
+            print("\n[watch] 終了しました")
+        return
+
+    build_full(data_dir, storage_dir, args.format)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,301 @@
+"""
+eval/results/ の評価結果CSVを集計するスクリプト。
+
+全CSVを1つのSQLiteテーブル（eval/cache/results.sqlite）に取り込み、
+ファイル名から評価条件（Temperature・データセット・Janome・リライトなど）を復元して、
+条件別・カテゴリ別の正解率と平均類似度を信頼区間付きで比較表にする。
+取り込み済みのCSVは再読込しないため、新しい評価結果を追加したら再実行するだけでよい
+（削除したCSVの実行は集計DBからも取り除く）。
+
+使い方:
+    python eval/aggregate_results.py
+    python eval/aggregate_results.py --by-category
+    python eval/aggregate_results.py --dataset dataset_colloquial --output eval/results/SUMMARY.md
+"""
+import argparse
+import csv
+import math
+import re
+import sqlite3
+import statistics
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+DB_PATH = Path(__file__).resolve().parent / "cache" / "results.sqlite"
+
+CONFIG_COLUMNS = ["dataset", "temperature", "janome", "rewrite", "rerank", "judge_batch", "similarity"]
+Z_95 = 1.96
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id       INTEGER PRIMARY KEY,
+    filename     TEXT UNIQUE,
+    mtime        REAL,
+    run_at       TEXT,
+    dataset      TEXT,
+    temperature  TEXT,
+    janome       INTEGER,
+    rewrite      INTEGER,
+    rerank       INTEGER,
+    judge_batch  INTEGER,
+    similarity   TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    run_id             INTEGER REFERENCES runs(run_id) ON DELETE CASCADE,
+    qid                TEXT,
+    category           TEXT,
+    vector_correct     INTEGER,
+    hybrid_correct     INTEGER,
+    vector_similarity  REAL,
+    hybrid_similarity  REAL
+);
+CREATE INDEX IF NOT EXISTS idx_items_run ON items(run_id);
+CREATE INDEX IF NOT EXISTS idx_items_category ON items(category);
+CREATE INDEX IF NOT EXISTS idx_runs_config ON runs(dataset, temperature, janome, rewrite, rerank, judge_batch, similarity);
+"""
+
+
+def parse_run_params(filename: str) -> dict | None:
+    """
+    run_eval.py の出力ファイル名から評価条件を復元する。
+
+    eval_<日時>[_temp<T>][_<データセット>][_nojanome][_rewrite][_rerank<N>][_judgebatch<N>][_sim<method>].csv
+    """
+    m = re.match(r"^eval_(\d{8}_\d{6})(.*)\.csv$", filename)
+    if not m:
+        return None
+    run_at, rest = m.groups()
+    params = {
+        "run_at": run_at, "dataset": "dataset", "temperature": "?",
+        "janome": 1, "rewrite": 0, "rerank": 0, "judge_batch": 1, "similarity": "compat",
+    }
+    # 末尾から順に付与されるラベルを剥がしていく
+    if sm := re.search(r"_sim([a-z]+)$", rest):
+        params["similarity"] = sm.group(1)
+        rest = rest[:sm.start()]
+    if jm := re.search(r"_judgebatch(\d+)$", rest):
+        params["judge_batch"] = int(jm.group(1))
+        rest = rest[:jm.start()]
+    if rm := re.search(r"_rerank(\d+)$", rest):
+        params["rerank"] = int(rm.group(1))
+        rest = rest[:rm.start()]
+    if rest.endswith("_rewrite"):
+        params["rewrite"] = 1
+        rest = rest[:-len("_rewrite")]
+    if rest.endswith("_nojanome"):
+        params["janome"] = 0
+        rest = rest[:-len("_nojanome")]
+    if tm := re.match(r"^_temp([\d.]+)", rest):
+        params["temperature"] = tm.group(1)
+        rest = rest[tm.end():]
+    if rest.startswith("_"):
+        params["dataset"] = rest[1:]
+    return params
+
+
+def ingest(conn: sqlite3.Connection, results_dir: Path = RESULTS_DIR) -> tuple[int, int]:
+    """
+    未取り込み・更新されたCSVだけを取り込み、CSVが無くなった実行を取り除く。
+
+    Returns:
+        (取り込んだファイル数, 取り除いた実行数)
+    """
+    known = dict(conn.execute("SELECT filename, mtime FROM runs"))
+    paths = sorted(results_dir.glob("eval_*.csv"))
+    gone = sorted(set(known) - {path.name for path in paths})
+    with conn:
+        for filename in gone:
+            conn.execute("DELETE FROM items WHERE run_id IN (SELECT run_id FROM runs WHERE filename = ?)", (filename,))
+            conn.execute("DELETE FROM runs WHERE filename = ?", (filename,))
+    added = 0
+    for path in paths:
+        mtime = path.stat().st_mtime
+        if known.get(path.name) == mtime:
+            continue
+        params = parse_run_params(path.name)
+        if params is None:
+            continue
+        with open(path, encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+        with conn:
+            conn.execute("DELETE FROM items WHERE run_id IN (SELECT run_id FROM runs WHERE filename = ?)", (path.name,))
+            conn.execute("DELETE FROM runs WHERE filename = ?", (path.name,))
+            cur = conn.execute(
+                "INSERT INTO runs (filename, mtime, run_at, dataset, temperature, janome, rewrite, rerank, judge_batch, similarity)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path.name, mtime, params["run_at"], params["dataset"], params["temperature"],
+                 params["janome"], params["rewrite"], params["rerank"], params["judge_batch"], params["similarity"]),
+            )
+            conn.executemany(
+                "INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (cur.lastrowid, r["id"], r.get("category", "unknown"),
+                     int(r["vector_judge"] == "○"), int(r["hybrid_judge"] == "○"),
+                     float(r["vector_similarity"] or 0), float(r["hybrid_similarity"] or 0))
+                    for r in rows
+                ],
+            )
+        added += 1
+    return added, len(gone)
+
+
+def wilson_interval(successes: int, n: int, z: float = Z_95) -> tuple[float, float]:
+    """正解率の Wilson スコア信頼区間。"""
+    if n == 0:
+        return 0.0, 0.0
+    p = successes / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def mean_interval(values: list[float], z: float = Z_95) -> tuple[float, float, float]:
+    """平均値と正規近似の信頼区間。"""
+    if not values:
+        return 0.0, 0.0, 0.0
+    mean = sum(values) / len(values)
+    if len(values) < 2:
+        return mean, mean, mean
+    half = z * statistics.stdev(values) / math.sqrt(len(values))
+    return mean, mean - half, mean + half
+
+
+def _summarize(conn: sqlite3.Connection, where: str, args: tuple, group_by: list[str]) -> list[dict]:
+    cols = ", ".join(group_by)
+    sql = f"""
+        SELECT {cols}, r.run_id, i.vector_correct, i.hybrid_correct, i.vector_similarity, i.hybrid_similarity
+        FROM items i JOIN runs r ON r.run_id = i.run_id
+        WHERE {where}
+        ORDER BY {cols}
+    """
+    groups: dict[tuple, dict] = {}
+    for row in conn.execute(sql, args):
+        key = tuple(row[:len(group_by)])
+        run_id, vc, hc, vs, hs = row[len(group_by):]
+        g = groups.setdefault(key, {"runs": {}, "vc": [], "hc": [], "vs": [], "hs": []})
+        run = g["runs"].setdefault(run_id, [0, 0, 0])
+        run[0] += vc
+        run[1] += hc
+        run[2] += 1
+        g["vc"].append(vc)
+        g["hc"].append(hc)
+        g["vs"].append(vs)
+        g["hs"].append(hs)
+
+    summary = []
+    for key, g in groups.items():
+        n = len(g["vc"])
+        run_vec = [v / t for v, _, t in g["runs"].values()]
+        run_hyb = [h / t for _, h, t in g["runs"].values()]
+        summary.append({
+            **{col.split(".")[-1]: value for col, value in zip(group_by, key)},
+            "runs": len(g["runs"]),
+            "n": n,
+            "vector_acc": sum(g["vc"]) / n,
+            "vector_acc_ci": wilson_interval(sum(g["vc"]), n),
+            "vector_acc_run_std": statistics.stdev(run_vec) if len(run_vec) > 1 else 0.0,
+            "hybrid_acc": sum(g["hc"]) / n,
+            "hybrid_acc_ci": wilson_interval(sum(g["hc"]), n),
+            "hybrid_acc_run_std": statistics.stdev(run_hyb) if len(run_hyb) > 1 else 0.0,
+            "vector_sim": mean_interval(g["vs"]),
+            "hybrid_sim": mean_interval(g["hs"]),
+        })
+    return summary
+
+
+def _fmt_config(row: dict) -> str:
+    parts = [row["dataset"], f"temp{row['temperature']}"]
+    if not row["janome"]:
+        parts.append("Janomeなし")
+    if row["rewrite"]:
+        parts.append("リライト")
+    if row["rerank"]:
+        parts.append(f"リランク上位{row['rerank']}")
+    if row["judge_batch"] > 1:
+        parts.append(f"judge×{row['judge_batch']}")
+    if row["similarity"] != "compat":
+        parts.append(f"sim:{row['similarity']}")
+    return " / ".join(parts)
+
+
+def _fmt_acc(acc: float, ci: tuple[float, float], std: float, runs: int) -> str:
+    std_part = f" ±{std:.1%}" if runs > 1 else ""
+    return f"{acc:.1%}{std_part} [{ci[0]:.1%}, {ci[1]:.1%}]"
+
+
+def render_markdown(summary: list[dict], first_col: str, first_col_fn) -> str:
+    lines = [
+        f"| {first_col} | 回数 | 件数 | ベクトル正解率 | ハイブリッド正解率 | 差分 | ベクトル類似度 | ハイブリッド類似度 |",
+        "|:---|:---:|:---:|:---:|:---:|:---:|:---:|:---:|",
+    ]
+    for r in summary:
+        diff = r["hybrid_acc"] - r["vector_acc"]
+        vs, hs = r["vector_sim"], r["hybrid_sim"]
+        lines.append(
+            f"| {first_col_fn(r)} | {r['runs']} | {r['n']} "
+            f"| {_fmt_acc(r['vector_acc'], r['vector_acc_ci'], r['vector_acc_run_std'], r['runs'])} "
+            f"| {_fmt_acc(r['hybrid_acc'], r['hybrid_acc_ci'], r['hybrid_acc_run_std'], r['runs'])} "
+            f"| {diff:+.1%} "
+            f"| {vs[0]:.1%} [{vs[1]:.1%}, {vs[2]:.1%}] | {hs[0]:.1%} [{hs[1]:.1%}, {hs[2]:.1%}] |"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--by-category", action="store_true", help="条件×カテゴリ別の表も出力する")
+    parser.add_argument("--dataset", default=None, help="データセット名で絞り込む（例: dataset_colloquial）")
+    parser.add_argument("--since", default=None, help="この日付以降の実行のみ（YYYYMMDD）")
+    parser.add_argument("--output", type=Path, default=None, help="Markdown の出力先（省略時は標準出力）")
+    parser.add_argument("--rebuild", action="store_true", help="取り込み済みデータを破棄して作り直す")
+    args = parser.parse_args()
+
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    if args.rebuild and DB_PATH.exists():
+        DB_PATH.unlink()
+    conn = sqlite3.connect(DB_PATH)
+    conn.executescript(_SCHEMA)
+    added, pruned = ingest(conn)
+    total = conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    where, params = "1 = 1", []
+    if args.dataset:
+        where += " AND r.dataset = ?"
+        params.append(args.dataset)
+    if args.since:
+        where += " AND r.run_at >= ?"
+        params.append(args.since)
+    config_cols = [f"r.{c}" for c in CONFIG_COLUMNS]
+
+    sections = [
+        "# 評価結果サマリー（自動集計）",
+        "",
+        f"取り込み済みの実行: {total} 件（今回追加 {added} 件・削除 {pruned} 件）  ",
+        "正解率は「全問題をプールした値 ±実行間の標準偏差 [Wilson 95%信頼区間]」、類似度は「平均 [95%信頼区間]」。",
+        "",
+        "## 条件別",
+        "",
+        render_markdown(_summarize(conn, where, tuple(params), config_cols), "条件", _fmt_config),
+    ]
+    if args.by_category:
+        sections += [
+            "",
+            "## 条件×カテゴリ別",
+            "",
+            render_markdown(
+                _summarize(conn, where, tuple(params), config_cols + ["i.category"]),
+                "条件 / カテゴリ", lambda r: f"{_fmt_config(r)} / {r['category']}",
+            ),
+        ]
+    text = "\n".join(sections) + "\n"
+
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+        print(f"📄 {args.output} に出力しました（今回追加 {added} 件・削除 {pruned} 件）")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+/api/chat の負荷試験・性能ベンチマークスクリプト。
+
+eval/dataset.json と dataset_colloquial.json の質問を指定した同時実行数で
+/api/chat に投げ続け、スループット・レイテンシ（p50/p95/p99）・
+処理段階ごとの内訳（レスポンスの timings）を集計して JSON に保存する。
+
+実 OpenAI バックエンドでも stub バックエンド（LLM_BACKEND=stub）でも動作する。
+
+使い方:
+    # 起動済みの API に対して実行
+    python eval/bench_api.py --url http://localhost:8000 --concurrency 1,4,16 --requests 100
+
+    # API をこのプロセス内で起動して実行（オフライン計測）
+    LLM_BACKEND=stub STUB_LLM_LATENCY_MS=800 python eval/bench_api.py --in-process
+
+    # 直近の結果と比較
+    python eval/bench_api.py --in-process --compare
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from eval.benchlib import summarize_latencies, save_result, latest_result, load_result
+
+EVAL_DIR = Path(__file__).resolve().parent
+DEFAULT_DATASETS = ["dataset.json", "dataset_colloquial.json"]
+SERVER_START_TIMEOUT = 120.0  # --in-process で API の起動（インデックスの読み込み・ウォームアップ）を待つ上限（秒）
+
+
+def _load_questions(names: list[str]) -> list[str]:
+    questions = []
+    for name in names:
+        with open(EVAL_DIR / name, encoding="utf-8") as f:
+            questions.extend(d["question"] for d in json.load(f) if d.get("question"))
+    return questions
+
+
+def _start_in_process_server() -> tuple[str, object]:
+    """uvicorn を別スレッドで起動し、ベースURLとサーバーを返す。"""
+    import uvicorn
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    config = uvicorn.Config("api.main:app", host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    failure: list[BaseException] = []
+
+    def _run():
+        try:
+            server.run()
+        except BaseException as e:  # 起動失敗時の SystemExit（ポート使用中など）も拾う
+            failure.append(e)
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while not server.started:
+        if not thread.is_alive():
+            reason = f"{type(failure[0]).__name__}: {failure[0]}" if failure else "サーバーのスレッドが終了しました"
+            raise RuntimeError(f"API サーバーを起動できませんでした（{reason}）") from (failure[0] if failure else None)
+        if time.monotonic() > deadline:
+            server.should_exit = True
+            raise RuntimeError(f"API サーバーが {SERVER_START_TIMEOUT:g} 秒以内に起動しませんでした")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
+
+
+def _one_request(client: httpx.Client, question: str) -> dict:
+    start = time.perf_counter()
+    try:
+        resp = client.post("/api/chat", json={"question": question})
+        latency = (time.perf_counter() - start) * 1000
+        if resp.status_code != 200:
+            return {"ok": False, "status": resp.status_code, "latency_ms": latency}
+        data = resp.json()
+        return {
+            "ok": True,
+            "status": 200,
+            "latency_ms": latency,
+            "timings": data.get("timings", {}),
+            "coalesced": data.get("coalesced", False),
+        }
+    except httpx.HTTPError as e:
+        return {"ok": False, "status": type(e).__name__, "latency_ms": (time.perf_counter() - start) * 1000}
+
+
+def run_level(client: httpx.Client, questions: list[str], concurrency: int, n_requests: int) -> dict:
+    """同時実行数 concurrency で n_requests 件を投げて集計する。"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda q: _one_request(client, q), questions[:n_requests]))
+    wall = time.perf_counter() - start
+
+    ok = [s for s in samples if s["ok"]]
+    errors: dict[str, int] = {}
+    for s in samples:
+        if not s["ok"]:
+            errors[str(s["status"])] = errors.get(str(s["status"]), 0) + 1
+
+    stages: dict[str, list[float]] = {}
+    for s in ok:
+        for stage, ms in s["timings"].items():
+            stages.setdefault(stage, []).append(ms)
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "succeeded": len(ok),
+        "errors": errors,
+        "coalesced": sum(1 for s in ok if s["coalesced"]),
+        "wall_sec": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 3) if wall > 0 else 0.0,
+        "latency_ms": summarize_latencies([s["latency_ms"] for s in ok]),
+        "stages_ms": {stage: summarize_latencies(v) for stage, v in sorted(stages.items())},
+    }
+
+
+def _print_level(r: dict) -> None:
+    lat = r["latency_ms"]
+    print(
+        f"  c={r['concurrency']:<4} {r['succeeded']}/{r['requests']} ok  "
+        f"{r['throughput_rps']:.2f} req/s  "
+        f"p50 {lat['p50']:.0f}ms  p95 {lat['p95']:.0f}ms  p99 {lat['p99']:.0f}ms"
+        + (f"  errors={r['errors']}" if r["errors"] else "")
+    )
+    for stage, st in r["stages_ms"].items():
+        print(f"      {stage:<14} p50 {st['p50']:>8.1f}ms  p95 {st['p95']:>8.1f}ms")
+
+
+def _print_comparison(current: dict, previous: dict, prev_path: Path) -> None:
+    print(f"\n🔁 前回結果との比較: {prev_path.name}")
+    prev_by_c = {r["concurrency"]: r for r in previous.get("levels", [])}
+    for r in current["levels"]:
+        p = prev_by_c.get(r["concurrency"])
+        if p is None:
+            continue
+        d_rps = r["throughput_rps"] - p["throughput_rps"]
+        d_p95 = r["latency_ms"]["p95"] - p["latency_ms"]["p95"]
+        print(f"  c={r['concurrency']:<4} throughput {d_rps:+.2f} req/s  p95 {d_p95:+.0f}ms")
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=os.getenv("API_URL", "http://localhost:8000"))
+    parser.add_argument("--in-process", action="store_true", help="API をこのプロセス内で起動して計測する")
+    parser.add_argument("--concurrency", default="1,4,16", help="同時実行数（カンマ区切りで複数指定）")
+    parser.add_argument("--requests", type=int, default=50, help="同時実行数ごとのリクエスト数")
+    parser.add_argument("--warmup", type=int, default=2, help="計測前に投げるリクエスト数")
+    parser.add_argument("--datasets", default=",".join(DEFAULT_DATASETS), help="質問を取り出すデータセット（eval/配下）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--label", default="", help="結果ファイル名に付けるラベル")
+    parser.add_argument("--compare", action="store_true", help="直近の結果と比較する")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    datasets = [d.strip() for d in args.datasets.split(",") if d.strip()]
+    questions = _load_questions(datasets)
+    random.Random(args.seed).shuffle(questions)
+
+    base_url = args.url
+    if args.in_process:
+        base_url, _ = _start_in_process_server()
+
+    client = httpx.Client(
+        base_url=base_url,
+        timeout=httpx.Timeout(args.timeout, connect=5.0),
+        limits=httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels)),
+    )
+    health = client.get("/health").json()
+
+    print("=" * 55)
+    print("⏱️  /api/chat 負荷試験")
+    print(f"   API: {base_url}{'（プロセス内）' if args.in_process else ''}")
+    print(f"   バックエンド: LLM={health.get('llm_backend', '?')} / Embedding={health.get('embedding_backend', '?')}")
+    print(f"   質問数: {len(questions)} 件（{', '.join(datasets)}）")
+    print(f"   同時実行数: {levels} × {args.requests} 件")
+    print("=" * 55)
+
+    for q in questions[:args.warmup]:
+        _one_request(client, q)
+
+    results = []
+    offset = args.warmup
+    for c in levels:
+        # 同時実行数ごとに別の質問を使い、キャッシュや相乗りの影響を揃える
+        pool = [questions[(offset + i) % len(questions)] for i in range(args.requests)]
+        offset += args.requests
+        r = run_level(client, pool, c, args.requests)
+        _print_level(r)
+        results.append(r)
+
+    payload = {
+        "target": {"url": base_url, "in_process": args.in_process, **health},
+        "params": {"datasets": datasets, "requests": args.requests, "warmup": args.warmup, "seed": args.seed},
+        "env": {k: os.environ[k] for k in ("LLM_BACKEND", "STUB_LLM_LATENCY_MS", "LLM_MAX_CONCURRENCY") if k in os.environ},
+        "levels": results,
+    }
+    path = save_result("bench_api", payload, args.label)
+    print(f"\n📄 結果: {path}")
+
+    if args.compare:
+        prev = latest_result("bench_api", exclude=path)
+        if prev is None:
+            print("比較対象の過去結果がありません")
+        else:
+            _print_comparison(payload, load_result(prev), prev)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,173 @@
+"""
+チャンク分割の比較ベンチマーク（従来の 1000 文字分割 vs トークン単位の親子チャンク、LLM呼び出しなし）。
+
+data/ 配下から分割方法ごとに一時ディレクトリへインデックスを作り、dataset.json の各質問で
+ハイブリッド検索 → 親チャンクへの展開（rag.chunking.expand_to_parents）を行って、
+
+- 正解資料に対する recall@k・MRR（bench_retrieval と同じ判定）
+- LLM に渡すコンテキストのトークン数（1回答あたりの平均・p95）
+- 期待回答の文字bigramのうちコンテキストに含まれる割合（回答に必要な情報が渡っているかの目安）
+
+を出力する。展開のしきい値（同じ親の子チャンクが何件ヒットしたら親に広げるか）も振れる。
+0 は展開なし、1 はヒットした子チャンクを常に親に広げる。
+
+使い方:
+    python eval/bench_chunking.py
+    python eval/bench_chunking.py --chunkers char,token:128,token:256 --expand 0,1,2
+    LLM_BACKEND=stub python eval/bench_chunking.py   # オフライン（stub Embedding で）
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chromadb.api.client import SharedSystemClient
+
+from build_index import export_index, load_documents, open_chroma
+from rag.chunking import count_tokens, expand_to_parents, split_documents
+from rag.config import CHUNK_TOKENS, INGEST_FORMAT, PARENT_CHUNK_TOKENS, TOP_K
+from rag.loader import select_source_files
+from rag.vectorstore import hybrid_retrieve_with_score, open_vectorstore
+from eval.bench_retrieval import RECALL_KS, _bigrams, _load_reference_docs, gold_sources
+from eval.benchlib import percentile, save_result
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = BASE_DIR / "data"
+DATASET_PATH = Path(__file__).resolve().parent / "dataset.json"
+
+
+def _parse_chunker(spec: str) -> tuple[str, int]:
+    """"char" / "token" / "token:128" → (方法, 子チャンクのトークン数)。"""
+    method, _, size = spec.partition(":")
+    return method, int(size) if size else CHUNK_TOKENS
+
+
+def evaluate(db, items: list[dict], k: int, min_hits: int) -> dict:
+    hits = {kk: 0 for kk in RECALL_KS if kk <= k}
+    rr_total = 0.0
+    context_tokens = []
+    coverage = []
+    for item in items:
+        results = hybrid_retrieve_with_score(db, item["question"], k=k, category=item["category"])
+        results = expand_to_parents(db, results, min_hits=min_hits)
+
+        ranked = [Path(doc.metadata.get("source", "")).stem for doc, _ in results]
+        first = next((i for i, src in enumerate(ranked) if src in item["_gold"]), None)
+        if first is not None:
+            rr_total += 1 / (first + 1)
+            for kk in hits:
+                if first < kk:
+                    hits[kk] += 1
+
+        context = "\n\n---\n\n".join(doc.page_content for doc, _ in results)
+        context_tokens.append(count_tokens(context))
+        expected = _bigrams(item.get("expected_answer", ""))
+        if expected:
+            coverage.append(len(expected & _bigrams(context)) / len(expected))
+
+    n = len(items)
+    return {
+        "expand_min_hits": min_hits,
+        **{f"recall@{kk}": round(v / n, 4) for kk, v in hits.items()},
+        "mrr": round(rr_total / n, 4),
+        "context_tokens_mean": round(statistics.mean(context_tokens), 1),
+        "context_tokens_p95": round(percentile(context_tokens, 95), 1),
+        "answer_coverage": round(statistics.mean(coverage), 4) if coverage else None,
+    }
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default=None, help="eval/ 配下のデータセットJSON（既定: dataset.json）")
+    parser.add_argument("--chunkers", default=f"char,token:128,token:{CHUNK_TOKENS}",
+                        help="比較する分割方法（char / token:<子チャンクのトークン数>）")
+    parser.add_argument("--parent-tokens", type=int, default=PARENT_CHUNK_TOKENS)
+    parser.add_argument("--expand", default="0,1,2", help="親チャンクに広げるヒット数のしきい値（0 で展開なし）")
+    parser.add_argument("--format", choices=["auto", "pdf"], default=INGEST_FORMAT, help="取り込む文書の形式")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--limit", type=int, default=0, help="先頭から使う問題数（0は全件）")
+    parser.add_argument("--label", default="")
+    args = parser.parse_args()
+
+    dataset_path = Path(__file__).resolve().parent / args.dataset if args.dataset else DATASET_PATH
+    with open(dataset_path, encoding="utf-8") as f:
+        items = [d for d in json.load(f) if d.get("question")]
+    if args.limit:
+        items = items[:args.limit]
+    reference_docs = _load_reference_docs()
+    for item in items:
+        item["_gold"] = gold_sources(item, reference_docs)
+
+    chunkers = [_parse_chunker(x.strip()) for x in args.chunkers.split(",") if x.strip()]
+    expand_levels = [int(x) for x in args.expand.split(",") if x.strip()]
+    docs = load_documents(select_source_files(DATA_DIR, args.format), DATA_DIR)
+
+    print("=" * 110)
+    print("✂️  チャンク分割の比較（recall・1回答あたりのコンテキストトークン数）")
+    print(f"   データセット: {dataset_path.name}（{len(items)} 件） / k={args.k} / 文書 {len(docs)} 件（{args.format}）")
+    print("=" * 110)
+
+    rows = []
+    for method, chunk_tokens in chunkers:
+        name = method if method == "char" else f"token:{chunk_tokens}"
+        start = time.perf_counter()
+        splits = split_documents(docs, method=method, chunk_tokens=chunk_tokens, parent_tokens=args.parent_tokens)
+        split_sec = time.perf_counter() - start
+        tokens = [count_tokens(d.page_content) for d in splits]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            db = open_chroma(Path(tmp) / "chroma")
+            db.add_documents(splits)
+            export_index(db, Path(tmp) / "index")
+            del db
+            db = open_vectorstore(Path(tmp) / "chroma", index_dir=Path(tmp) / "index", backend="chroma")
+            # 文字数分割のチャンクには親が無いため展開しても変わらない
+            levels = expand_levels if method != "char" else [0]
+            results = [evaluate(db, items, args.k, min_hits) for min_hits in levels]
+            del db
+            SharedSystemClient.clear_system_cache()
+
+        row = {
+            "chunker": name,
+            "chunks": len(splits),
+            "chunk_tokens_mean": round(statistics.mean(tokens), 1),
+            "chunk_tokens_max": max(tokens),
+            "split_sec": round(split_sec, 3),
+            "results": results,
+        }
+        rows.append(row)
+        print(f"{name:<10} チャンク {row['chunks']:>4}（平均 {row['chunk_tokens_mean']:.0f} / 最大 {row['chunk_tokens_max']} トークン）")
+        for r in results:
+            recalls = "  ".join(f"R@{kk} {r[f'recall@{kk}']:.3f}" for kk in RECALL_KS if kk <= args.k)
+            print(
+                f"   展開 {r['expand_min_hits']}  {recalls}  MRR {r['mrr']:.3f}  "
+                f"コンテキスト 平均 {r['context_tokens_mean']:7.1f} / p95 {r['context_tokens_p95']:7.1f} トークン  "
+                f"回答bigram被覆 {r['answer_coverage']:.3f}"
+            )
+
+    path = save_result(
+        "bench_chunking",
+        {
+            "params": {
+                "dataset": dataset_path.name, "k": args.k, "queries": len(items),
+                "format": args.format, "parent_tokens": args.parent_tokens,
+                "token_counter": "tiktoken" if count_tokens("テスト") != len("テスト") else "chars",
+            },
+            "results": rows,
+        },
+        args.label,
+    )
+    print(f"\n📄 結果: {path}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,148 @@
+"""
+取り込み経路の比較ベンチマーク（PDF のみ vs markdown 優先、LLM呼び出しなし）。
+
+data/ 配下から一時ディレクトリにインデックスを作り、形式ごとに
+読み込み・分割・Embedding＋Chroma 保存・共有インデックス書き出しの時間と、
+チャンクの統計（件数・文字数・複数の見出しセクションにまたがるチャンクの割合）、
+dataset.json に対する検索の recall@k・MRR（bench_retrieval と同じ判定）を出力する。
+
+セクションの判定には資料の項目ID（corp-001 など。PDF では行頭、markdown では見出しの先頭）を使う。
+
+使い方:
+    python eval/bench_ingest.py
+    python eval/bench_ingest.py --formats pdf,auto --modes vector,hybrid
+    LLM_BACKEND=stub python eval/bench_ingest.py   # オフライン（stub Embedding で）
+"""
+import argparse
+import json
+import re
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chromadb.api.client import SharedSystemClient
+
+from build_index import export_index, load_documents, open_chroma
+from rag.chunking import split_documents
+from rag.config import TOP_K
+from rag.loader import select_source_files
+from rag.vectorstore import open_vectorstore
+from eval.bench_retrieval import RECALL_KS, _load_reference_docs, evaluate, gold_sources
+from eval.benchlib import save_result
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = BASE_DIR / "data"
+DATASET_PATH = Path(__file__).resolve().parent / "dataset.json"
+
+# 資料の項目ID（行頭、または markdown の見出し "## corp-001|..." の先頭）
+_SECTION_ID = re.compile(r"^(?:#+\s*)?([a-z]+(?:-\d{2,3})+)(?=\||\s*$)", re.MULTILINE)
+
+
+def chunk_stats(splits) -> dict:
+    lengths = [len(d.page_content) for d in splits]
+    sections = [len(set(_SECTION_ID.findall(d.page_content))) for d in splits]
+    return {
+        "chunks": len(splits),
+        "chars_mean": round(statistics.mean(lengths), 1),
+        "chars_max": max(lengths),
+        "sections_per_chunk": round(statistics.mean(sections), 2),
+        "mixed_section_ratio": round(sum(1 for n in sections if n > 1) / len(splits), 4),
+    }
+
+
+def build(fmt: str, work_dir: Path) -> tuple[dict, Path, Path]:
+    """形式 fmt で work_dir にインデックスを作り、(計測結果, Chroma, 共有インデックス) を返す。"""
+    timings = {}
+    start = time.perf_counter()
+    files = select_source_files(DATA_DIR, fmt)
+    docs = load_documents(files, DATA_DIR)
+    timings["load_sec"] = time.perf_counter() - start
+
+    t = time.perf_counter()
+    splits = split_documents(docs)
+    timings["split_sec"] = time.perf_counter() - t
+
+    persist_dir, index_dir = work_dir / "chroma", work_dir / "index"
+    t = time.perf_counter()
+    db = open_chroma(persist_dir)
+    db.add_documents(splits)
+    timings["embed_sec"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    export_index(db, index_dir)
+    timings["export_sec"] = time.perf_counter() - t
+    timings["total_sec"] = time.perf_counter() - start
+
+    markdown = sum(1 for f in files if f.suffix.lower() == ".md")
+    return {
+        "format": fmt,
+        "files": {"markdown": markdown, "pdf": len(files) - markdown},
+        **{name: round(sec, 3) for name, sec in timings.items()},
+        **chunk_stats(splits),
+    }, persist_dir, index_dir
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default=None, help="eval/ 配下のデータセットJSON（既定: dataset.json）")
+    parser.add_argument("--formats", default="pdf,auto", help="比較する取り込み形式（pdf / auto）")
+    parser.add_argument("--modes", default="vector,hybrid", help="recall を測る検索モード")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--limit", type=int, default=0, help="先頭から使う問題数（0は全件）")
+    parser.add_argument("--label", default="")
+    args = parser.parse_args()
+
+    dataset_path = Path(__file__).resolve().parent / args.dataset if args.dataset else DATASET_PATH
+    with open(dataset_path, encoding="utf-8") as f:
+        items = [d for d in json.load(f) if d.get("question")]
+    if args.limit:
+        items = items[:args.limit]
+    reference_docs = _load_reference_docs()
+    for item in items:
+        item["_gold"] = gold_sources(item, reference_docs)
+
+    formats = [x.strip() for x in args.formats.split(",") if x.strip()]
+    modes = [x.strip() for x in args.modes.split(",") if x.strip()]
+
+    print("=" * 100)
+    print("📥 取り込み経路の比較（PDF のみ vs markdown 優先）")
+    print(f"   データセット: {dataset_path.name}（{len(items)} 件） / k={args.k}")
+    print("=" * 100)
+
+    rows = []
+    for fmt in formats:
+        with tempfile.TemporaryDirectory() as tmp:
+            row, persist_dir, index_dir = build(fmt, Path(tmp))
+            db = open_vectorstore(persist_dir, index_dir=index_dir, backend="chroma")
+            row["retrieval"] = [evaluate(mode, True, db, items, args.k, memory_queries=0) for mode in modes]
+            del db
+            SharedSystemClient.clear_system_cache()
+        rows.append(row)
+
+        print(
+            f"{fmt:<5} 読み込み {row['load_sec']:6.2f}s  分割 {row['split_sec']:5.2f}s  "
+            f"Embedding {row['embed_sec']:6.2f}s  書き出し {row['export_sec']:5.2f}s  計 {row['total_sec']:6.2f}s  |  "
+            f"チャンク {row['chunks']:>4}（平均 {row['chars_mean']:.0f} 字）  複数セクション {row['mixed_section_ratio']:6.1%}"
+        )
+        for r in row["retrieval"]:
+            recalls = "  ".join(f"R@{kk} {r[f'recall@{kk}']:.3f}" for kk in RECALL_KS if kk <= args.k)
+            print(f"      {r['mode']:<7} {recalls}  MRR {r['mrr']:.3f}")
+
+    path = save_result(
+        "bench_ingest",
+        {"params": {"dataset": dataset_path.name, "k": args.k, "queries": len(items)}, "results": rows},
+        args.label,
+    )
+    print(f"\n📄 結果: {path}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,213 @@
+"""
+IVF（k-means 粗量子化）インデックスの recall-レイテンシ掃引ベンチマーク（LLM呼び出しなし）。
+
+共有インデックス（storage/index）の Embedding 行列に対して、リスト数 nlist と
+検索リスト数 nprobe を振り、float32 の全件検索に対する recall@k と1クエリあたりの
+レイテンシ、学習時間を計測する。--incremental を付けると、前半の行だけで学習して
+残りを add で追加したインデックス（再学習なしの挿入）も同じ条件で計測する。
+
+サンプルの data/ は数十チャンクしかないため、--scale N で合成コーパスを使うこと。
+
+あわせて、/api/chat が使うハイブリッド検索（hybrid_retrieve_with_score）そのものを
+実インデックスの IVF（VECTOR_BACKEND=ivf と同じ NumpyVectorStore）で nprobe・ベクトル側の
+順位付け件数（--depths、HYBRID_VECTOR_DEPTH）ごとに実行し、全件検索のハイブリッド結果に対する
+上位k件の一致率とレイテンシを出力する（本文・BM25 が必要なため合成コーパスでは計測しない）。
+
+使い方:
+    python eval/bench_ivf.py --scale 100000
+    python eval/bench_ivf.py --scale 100000 --nlists 316,632,1264 --nprobes 1,4,16,64 --incremental
+    python eval/bench_ivf.py --depths 10,25,50
+    LLM_BACKEND=stub python eval/bench_ivf.py --scale 50000
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rag.config import HYBRID_VECTOR_DEPTH, TOP_K
+from rag.index_versions import resolve_index_dirs
+from rag.ivf import IVFIndex, default_nlist
+from rag.numpy_store import NumpyVectorStore
+from rag.providers import create_embeddings
+from rag.shared_index import SharedIndex
+from eval.benchlib import (
+    PrecomputedEmbeddings,
+    hybrid_top_ids,
+    overlap,
+    save_result,
+    summarize_latencies,
+    synthetic_embeddings,
+)
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+_, INDEX_DIR = resolve_index_dirs(BASE_DIR / "storage")  # 公開中のバージョン
+DATASET_PATH = Path(__file__).resolve().parent / "dataset.json"
+
+
+def _ivf_top_k(index: IVFIndex, matrix: np.ndarray, q: np.ndarray, k: int, nprobe: int) -> np.ndarray:
+    rows = index.probe(q, nprobe)
+    if len(rows) == 0:
+        return rows
+    sims = matrix[rows] @ q
+    return rows[np.argsort(-sims, kind="stable")[:k]]
+
+
+def sweep(name: str, index: IVFIndex, matrix, queries, exact, k: int, nprobes: list[int], build_sec: float) -> list[dict]:
+    rows = []
+    sizes = np.diff(index.indptr)
+    for nprobe in nprobes:
+        if nprobe > index.nlist:
+            continue
+        hits = 0
+        scanned = 0
+        latencies = []
+        for q, gold in zip(queries, exact):
+            start = time.perf_counter()
+            top = _ivf_top_k(index, matrix, q, k, nprobe)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(gold & set(top.tolist()))
+            scanned += len(index.probe(q, nprobe))
+        r = {
+            "variant": name, "nlist": index.nlist, "nprobe": nprobe,
+            "build_sec": round(build_sec, 2),
+            "max_list_size": int(sizes.max()), "needs_retrain": index.needs_retrain(),
+            "scanned_ratio": round(scanned / (len(queries) * len(matrix)), 4),
+            "recall@k": round(hits / (len(queries) * min(k, len(matrix))), 4),
+            "latency_ms": summarize_latencies(latencies),
+        }
+        rows.append(r)
+        print(
+            f"{name:<11} nlist {r['nlist']:>5}  nprobe {nprobe:>4}  走査率 {r['scanned_ratio']:6.1%}  "
+            f"recall@{k} {r['recall@k']:.3f}  p50 {r['latency_ms']['p50']:7.3f}ms  p95 {r['latency_ms']['p95']:7.3f}ms"
+        )
+    return rows
+
+
+def bench_hybrid(index: SharedIndex, embeddings, items: list[dict], k: int, nprobes: list[int], depths: list[int]) -> list[dict]:
+    """ハイブリッド検索を IVF の nprobe・順位付け件数ごとに実行し、全件検索との一致率を測る。"""
+    exact = NumpyVectorStore(index, embeddings)
+    hybrid_top_ids(exact, items[:5], k)  # トークナイザ等の初期化を計測から外す
+    reference, latencies = hybrid_top_ids(exact, items, k)
+    rows = [{"nprobe": None, "depth": None, f"overlap@{k}": 1.0, "latency_ms": summarize_latencies(latencies)}]
+    nlist = index.ivf().nlist
+    for nprobe in nprobes:
+        if nprobe > nlist:
+            continue
+        db = NumpyVectorStore(index, embeddings, ann="ivf", nprobe=nprobe)
+        for depth in depths:
+            ids, latencies = hybrid_top_ids(db, items, k, vector_depth=depth)
+            rows.append({
+                "nprobe": nprobe, "depth": depth,
+                f"overlap@{k}": overlap(reference, ids), "latency_ms": summarize_latencies(latencies),
+            })
+    for r in rows:
+        nprobe = f"{r['nprobe']}/{nlist}" if r["nprobe"] else "全件"
+        depth = r["depth"] if r["depth"] else "全件"
+        print(
+            f"hybrid      nprobe {nprobe:<7} depth {depth:<4} overlap@{k} {r[f'overlap@{k}']:.3f}  "
+            f"p50 {r['latency_ms']['p50']:7.3f}ms  p95 {r['latency_ms']['p95']:7.3f}ms"
+        )
+    return rows
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default=None, help="eval/ 配下のデータセットJSON（既定: dataset.json）")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--nlists", default="", help="リスト数（カンマ区切り。既定は √n×4 とその半分・2倍）")
+    parser.add_argument("--nprobes", default="1,2,4,8,16,32,64")
+    parser.add_argument("--depths", default=f"10,25,{HYBRID_VECTOR_DEPTH}",
+                        help="ハイブリッド検索でベクトル側の順位を付ける件数（カンマ区切り）")
+    parser.add_argument("--incremental", action="store_true", help="前半で学習し後半を add したインデックスも計測する")
+    parser.add_argument("--limit", type=int, default=100, help="使う質問数（0は全件）")
+    parser.add_argument("--scale", type=int, default=0, help="合成コーパスの件数（0で実インデックス）")
+    parser.add_argument("--noise", type=float, default=0.01, help="合成コーパスのノイズ（標準偏差）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="")
+    args = parser.parse_args()
+
+    dataset_path = Path(__file__).resolve().parent / args.dataset if args.dataset else DATASET_PATH
+    with open(dataset_path, encoding="utf-8") as f:
+        items = [d for d in json.load(f) if d.get("question")]
+    if args.limit:
+        items = items[:args.limit]
+    nprobes = [int(x) for x in args.nprobes.split(",") if x.strip()]
+    depths = [int(x) for x in args.depths.split(",") if x.strip()]
+
+    questions = [item["question"] for item in items]
+    embeddings = PrecomputedEmbeddings(create_embeddings(), questions)
+    queries = []
+    for vec in embeddings.embed_documents(questions):
+        q = np.asarray(vec, dtype=np.float32)
+        queries.append(q / max(np.linalg.norm(q), 1e-12))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = SharedIndex(INDEX_DIR).embeddings
+        matrix = synthetic_embeddings(np.asarray(base), args.scale, args.noise, args.seed, Path(tmp)) if args.scale else base
+        n = len(matrix)
+        auto = default_nlist(n)
+        nlists = [int(x) for x in args.nlists.split(",") if x.strip()] or sorted({max(1, auto // 2), auto, min(n, auto * 2)})
+
+        print("=" * 100)
+        print("🧭 IVF recall-レイテンシ掃引（float32 全件検索との比較）")
+        print(f"   コーパス: {'合成' if args.scale else '実インデックス'} {n} 件 / 質問 {len(queries)} 件 / k={args.k}")
+        print("=" * 100)
+
+        exact_latencies = []
+        exact = []
+        for q in queries:
+            start = time.perf_counter()
+            sims = matrix @ q
+            top = np.argpartition(-sims, min(args.k, n) - 1)[:args.k]
+            exact_latencies.append((time.perf_counter() - start) * 1000)
+            exact.append(set(top.tolist()))
+        exact_summary = summarize_latencies(exact_latencies)
+        print(f"{'exact':<11} 全件走査                                   p50 {exact_summary['p50']:7.3f}ms  p95 {exact_summary['p95']:7.3f}ms")
+
+        rows = []
+        for nlist in nlists:
+            start = time.perf_counter()
+            index = IVFIndex.train(matrix, nlist=nlist, seed=args.seed)
+            rows += sweep("trained", index, matrix, queries, exact, args.k, nprobes, time.perf_counter() - start)
+
+            if args.incremental:
+                half = n // 2
+                start = time.perf_counter()
+                index = IVFIndex.train(matrix[:half], nlist=nlist, seed=args.seed)
+                index.add(matrix[half:], first_row=half)
+                rows += sweep("incremental", index, matrix, queries, exact, args.k, nprobes, time.perf_counter() - start)
+        del matrix
+
+    shared = SharedIndex(INDEX_DIR)
+    hybrid = []
+    if shared.ivf() is not None:
+        print()
+        hybrid = bench_hybrid(shared, embeddings, items, args.k, nprobes, depths)
+
+    path = save_result(
+        "bench_ivf",
+        {
+            "params": {
+                "dataset": dataset_path.name, "k": args.k, "queries": len(queries), "chunks": n,
+                "scale": args.scale, "noise": args.noise, "seed": args.seed,
+            },
+            "exact_latency_ms": exact_summary,
+            "results": rows,
+            "hybrid": hybrid,
+        },
+        args.label,
+    )
+    print(f"\n📄 結果: {path}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,192 @@
+"""
+量子化 Embedding（int8 / binary）+ float32 再採点のベンチマーク（LLM呼び出しなし）。
+
+共有インデックス（storage/index）の Embedding 行列に対して、量子化方式と
+再採点候補数の倍率（k × factor）ごとに、float32 の厳密検索に対する recall@k と
+1クエリあたりのレイテンシ、1ベクトルあたりの常駐バイト数を計測する。
+
+サンプルの data/ は数十チャンクしかないため、--scale N を指定すると実インデックスの
+ベクトル2本をランダムな比率で混ぜてノイズを加えた N 件の合成コーパス
+（一時ファイルに書き出して mmap）でも計測する。
+
+あわせて、/api/chat が使うハイブリッド検索（hybrid_retrieve_with_score）そのものを
+量子化方式とベクトル側の順位付け件数（--depths、HYBRID_VECTOR_DEPTH）ごとに実インデックスで実行し、
+float32 全件検索のハイブリッド結果に対する上位k件の一致率とレイテンシを出力する
+（本文・BM25 が必要なため合成コーパスでは計測しない）。
+
+使い方:
+    python eval/bench_quantization.py
+    python eval/bench_quantization.py --scale 100000 --factors 1,2,4,8
+    python eval/bench_quantization.py --depths 10,25,50
+    LLM_BACKEND=stub python eval/bench_quantization.py --scale 50000
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rag.config import HYBRID_VECTOR_DEPTH, TOP_K, VECTOR_RESCORE_FACTOR
+from rag.index_versions import resolve_index_dirs
+from rag.providers import create_embeddings
+from rag.numpy_store import NumpyVectorStore
+from rag.quantization import binary_scores, int8_scores, quantize_binary, quantize_int8, rescored_top_k
+from rag.shared_index import SharedIndex
+from eval.benchlib import (
+    PrecomputedEmbeddings,
+    hybrid_top_ids,
+    overlap,
+    save_result,
+    summarize_latencies,
+    synthetic_embeddings,
+)
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+_, INDEX_DIR = resolve_index_dirs(BASE_DIR / "storage")  # 公開中のバージョン
+DATASET_PATH = Path(__file__).resolve().parent / "dataset.json"
+
+
+def _exact_top_k(matrix: np.ndarray, q: np.ndarray, k: int) -> np.ndarray:
+    sims = matrix @ q
+    k = min(k, len(sims))
+    return np.argpartition(-sims, k - 1)[:k]
+
+
+def bench_corpus(name: str, matrix: np.ndarray, queries: list[np.ndarray], k: int, factors: list[int]) -> list[dict]:
+    n, dim = matrix.shape
+    exact = [set(_exact_top_k(matrix, q, k).tolist()) for q in queries]
+    codes, scales = quantize_int8(np.asarray(matrix))
+    bits, center = quantize_binary(np.asarray(matrix))
+
+    rows = []
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        _exact_top_k(matrix, q, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    rows.append({
+        "corpus": name, "chunks": n, "quantization": "none", "factor": None,
+        "bytes_per_vector": dim * 4, "recall@k": 1.0, "latency_ms": summarize_latencies(latencies),
+    })
+
+    for kind, bytes_per_vector in (("int8", dim + 4), ("binary", bits.shape[1])):  # int8 は行スケール分を含む
+        for factor in factors:
+            hits = 0
+            latencies = []
+            for q, gold in zip(queries, exact):
+                start = time.perf_counter()
+                approx = int8_scores(codes, scales, q) if kind == "int8" else binary_scores(bits, center, q)
+                top, _ = rescored_top_k(matrix, approx, q, k, k * factor)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += len(gold & set(top.tolist()))
+            rows.append({
+                "corpus": name, "chunks": n, "quantization": kind, "factor": factor,
+                "bytes_per_vector": bytes_per_vector,
+                "recall@k": round(hits / (len(queries) * min(k, n)), 4),
+                "latency_ms": summarize_latencies(latencies),
+            })
+
+    for r in rows:
+        factor = f"×{r['factor']}" if r["factor"] else "-"
+        print(
+            f"{r['corpus']:<10} n={r['chunks']:<7} {r['quantization']:<7} {factor:<4} "
+            f"{r['bytes_per_vector']:>5}B/vec  recall@{k} {r['recall@k']:.3f}  "
+            f"p50 {r['latency_ms']['p50']:8.3f}ms  p95 {r['latency_ms']['p95']:8.3f}ms"
+        )
+    return rows
+
+
+def bench_hybrid(index: SharedIndex, embeddings, items: list[dict], k: int, factor: int, depths: list[int]) -> list[dict]:
+    """ハイブリッド検索を量子化方式・順位付け件数ごとに実行し、float32 全件検索との一致率を測る。"""
+    exact = NumpyVectorStore(index, embeddings)
+    hybrid_top_ids(exact, items[:5], k)  # トークナイザ等の初期化を計測から外す
+    reference, latencies = hybrid_top_ids(exact, items, k)
+    rows = [{"quantization": "none", "depth": None, f"overlap@{k}": 1.0, "latency_ms": summarize_latencies(latencies)}]
+    for kind in ("int8", "binary"):
+        db = NumpyVectorStore(index, embeddings, quantization=kind, rescore_factor=factor)
+        for depth in depths:
+            ids, latencies = hybrid_top_ids(db, items, k, vector_depth=depth)
+            rows.append({
+                "quantization": kind, "depth": depth, "factor": factor,
+                f"overlap@{k}": overlap(reference, ids), "latency_ms": summarize_latencies(latencies),
+            })
+    for r in rows:
+        depth = r["depth"] if r["depth"] else "全件"
+        print(
+            f"hybrid     {r['quantization']:<7} depth {depth:<4} overlap@{k} {r[f'overlap@{k}']:.3f}  "
+            f"p50 {r['latency_ms']['p50']:8.3f}ms  p95 {r['latency_ms']['p95']:8.3f}ms"
+        )
+    return rows
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default=None, help="eval/ 配下のデータセットJSON（既定: dataset.json）")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--factors", default="1,2,4,8", help="再採点候補数の倍率（k × factor 件を float32 で再採点）")
+    parser.add_argument("--depths", default=f"10,25,{HYBRID_VECTOR_DEPTH}",
+                        help="ハイブリッド検索でベクトル側の順位を付ける件数（カンマ区切り）")
+    parser.add_argument("--limit", type=int, default=100, help="使う質問数（0は全件）")
+    parser.add_argument("--scale", type=int, default=0, help="水増しした合成コーパスの件数（0で実インデックスのみ）")
+    parser.add_argument("--noise", type=float, default=0.01, help="合成コーパスのノイズ（標準偏差）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="")
+    args = parser.parse_args()
+
+    dataset_path = Path(__file__).resolve().parent / args.dataset if args.dataset else DATASET_PATH
+    with open(dataset_path, encoding="utf-8") as f:
+        items = [d for d in json.load(f) if d.get("question")]
+    if args.limit:
+        items = items[:args.limit]
+    factors = [int(x) for x in args.factors.split(",") if x.strip()]
+    depths = [int(x) for x in args.depths.split(",") if x.strip()]
+
+    index = SharedIndex(INDEX_DIR)
+    questions = [item["question"] for item in items]
+    embeddings = PrecomputedEmbeddings(create_embeddings(), questions)
+    queries = []
+    for vec in embeddings.embed_documents(questions):
+        q = np.asarray(vec, dtype=np.float32)
+        queries.append(q / max(np.linalg.norm(q), 1e-12))
+
+    print("=" * 90)
+    print("🗜️  量子化 Embedding ベンチマーク（float32 厳密検索に対する recall@k とレイテンシ）")
+    print(f"   データセット: {dataset_path.name}（{len(queries)} 件） / k={args.k} / 倍率 {factors}")
+    print("=" * 90)
+
+    rows = bench_corpus("index", index.embeddings, queries, args.k, factors)
+    if args.scale:
+        with tempfile.TemporaryDirectory() as tmp:
+            matrix = synthetic_embeddings(np.asarray(index.embeddings), args.scale, args.noise, args.seed, Path(tmp))
+            print()
+            rows += bench_corpus("synthetic", matrix, queries, args.k, factors)
+            del matrix
+
+    print()
+    hybrid = bench_hybrid(index, embeddings, items, args.k, VECTOR_RESCORE_FACTOR, depths)
+
+    path = save_result(
+        "bench_quantization",
+        {
+            "params": {
+                "dataset": dataset_path.name, "k": args.k, "queries": len(queries),
+                "scale": args.scale, "noise": args.noise, "seed": args.seed,
+            },
+            "results": rows,
+            "hybrid": hybrid,
+        },
+        args.label,
+    )
+    print(f"\n📄 結果: {path}")
+
+
+if __name__ == "__main__":
+    run()
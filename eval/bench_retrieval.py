@@ -0,0 +1,182 @@
+"""
+検索のみのマイクロベンチマーク（LLM呼び出しなし）。
+
+dataset.json の各質問について、検索モード（vector / bm25 / hybrid / rerank）と
+トークナイザ（Janome / 正規表現）の組み合わせごとに検索を実行し、
+正解資料に対する recall@k・MRR と、1クエリあたりのレイテンシ・メモリを計測する。
+
+rerank は hybrid の上位k件を rag.rerank で並べ替えたもの（--rerank-top N で上位N件に絞る）。
+
+正解資料はデータセットの "source" を使う。無い場合（既存の dataset.json）は
+期待回答の文字bigramを最も多く含む data/<category>/ 配下の資料を正解とみなす。
+
+使い方:
+    python eval/bench_retrieval.py
+    python eval/bench_retrieval.py --dataset dataset_colloquial.json --modes hybrid --tokenizers janome
+    LLM_BACKEND=stub python eval/bench_retrieval.py   # オフライン（stub Embedding のインデックスで）
+    python eval/bench_retrieval.py --no-shared-index  # 共有インデックスを使わない従来経路で計測
+    python eval/bench_retrieval.py --modes hybrid,rerank --tokenizers janome  # リランキングの効果
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rag.config import TOP_K
+from rag.index_versions import resolve_index_dirs
+from rag.vectorstore import open_vectorstore, hybrid_retrieve_with_score, _vector_only_search, _bm25_only_search
+from rag.rerank import rerank
+from eval.benchlib import summarize_latencies, save_result
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+PERSIST_DIR, INDEX_DIR = resolve_index_dirs(BASE_DIR / "storage")  # 公開中のバージョン
+DATA_DIR = BASE_DIR / "data"
+DATASET_PATH = Path(__file__).resolve().parent / "dataset.json"
+
+RECALL_KS = (1, 3, 5, 8)
+
+
+def _bigrams(text: str) -> set[str]:
+    t = "".join(text.split())
+    return {t[i:i + 2] for i in range(len(t) - 1)}
+
+
+def _load_reference_docs() -> dict[str, tuple[str, set[str]]]:
+    """data/ 配下の markdown を {資料名(拡張子なし): (カテゴリ, bigram集合)} で返す。"""
+    docs = {}
+    for md in sorted(DATA_DIR.rglob("*.md")):
+        docs[md.stem] = (md.parent.name, _bigrams(md.read_text(encoding="utf-8")))
+    return docs
+
+
+def gold_sources(item: dict, reference_docs: dict[str, tuple[str, set[str]]]) -> set[str]:
+    """質問の正解資料名（拡張子なし）の集合を返す。"""
+    if item.get("source"):
+        return {Path(item["source"]).stem}
+    answer = _bigrams(item.get("expected_answer", ""))
+    if not answer:
+        return set()
+    candidates = {
+        name: len(answer & grams) / len(answer)
+        for name, (cat, grams) in reference_docs.items()
+        if cat == item.get("category")
+    } or {name: len(answer & grams) / len(answer) for name, (_, grams) in reference_docs.items()}
+    return {max(candidates, key=candidates.get)}
+
+
+def _search(mode: str, db, query: str, k: int, category: str, use_janome: bool, rerank_top: int = 0):
+    if mode == "vector":
+        return _vector_only_search(db, query, k, category)
+    if mode == "bm25":
+        return _bm25_only_search(db, query, k, category, use_janome=use_janome)
+    results = hybrid_retrieve_with_score(db, query, k=k, category=category, use_janome=use_janome)
+    if mode == "rerank":
+        results = rerank(db, query, results, top_n=rerank_top, use_janome=use_janome)
+    return results
+
+
+def evaluate(mode: str, use_janome: bool, db, items: list[dict], k: int, memory_queries: int,
+             rerank_top: int = 0) -> dict:
+    hits = {kk: 0 for kk in RECALL_KS if kk <= k}
+    rr_total = 0.0
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        results = _search(mode, db, item["question"], k, item["category"], use_janome, rerank_top)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        ranked = [Path(doc.metadata.get("source", "")).stem for doc, _ in results]
+        gold = item["_gold"]
+        first = next((i for i, src in enumerate(ranked) if src in gold), None)
+        if first is not None:
+            rr_total += 1 / (first + 1)
+            for kk in hits:
+                if first < kk:
+                    hits[kk] += 1
+
+    # メモリは tracemalloc のオーバーヘッドがレイテンシに乗らないよう別パスで計測
+    peak = 0
+    tracemalloc.start()
+    for item in items[:memory_queries]:
+        tracemalloc.reset_peak()
+        _search(mode, db, item["question"], k, item["category"], use_janome, rerank_top)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    n = len(items)
+    return {
+        "mode": mode,
+        "tokenizer": ("janome" if use_janome else "regex") if mode != "vector" else "-",
+        "queries": n,
+        **{f"recall@{kk}": round(v / n, 4) for kk, v in hits.items()},
+        "mrr": round(rr_total / n, 4),
+        "latency_ms": summarize_latencies(latencies),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", type=str, default=None, help="使用するデータセットファイル名（eval/配下）")
+    parser.add_argument("--modes", default="vector,bm25,hybrid")
+    parser.add_argument("--tokenizers", default="janome,regex")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--limit", type=int, default=0, help="先頭から使う問題数（0は全件）")
+    parser.add_argument("--memory-queries", type=int, default=10, help="メモリ計測に使う問題数")
+    parser.add_argument("--no-shared-index", action="store_true", help="共有インデックス（storage/index）を使わない")
+    parser.add_argument("--rerank-top", type=int, default=0, help="rerank モードで残す件数（0は k 件すべて）")
+    parser.add_argument("--label", default="")
+    args = parser.parse_args()
+
+    dataset_path = Path(__file__).resolve().parent / args.dataset if args.dataset else DATASET_PATH
+    with open(dataset_path, encoding="utf-8") as f:
+        items = [d for d in json.load(f) if d.get("question")]
+    if args.limit:
+        items = items[:args.limit]
+
+    reference_docs = _load_reference_docs()
+    for item in items:
+        item["_gold"] = gold_sources(item, reference_docs)
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    tokenizers = [t.strip() == "janome" for t in args.tokenizers.split(",") if t.strip()]
+
+    print("=" * 70)
+    print("🔍 検索マイクロベンチマーク（LLM呼び出しなし）")
+    print(f"   データセット: {dataset_path.name}（{len(items)} 件） / k={args.k}")
+    print("=" * 70)
+
+    db = open_vectorstore(PERSIST_DIR, index_dir=None if args.no_shared_index else INDEX_DIR)
+    shared = getattr(db, "shared_index", None) is not None
+    print(f"   共有インデックス: {'使用' if shared else '未使用'}")
+    rows = []
+    for mode in modes:
+        for use_janome in (tokenizers if mode != "vector" else [True]):
+            r = evaluate(mode, use_janome, db, items, args.k, args.memory_queries, args.rerank_top)
+            rows.append(r)
+            recalls = "  ".join(f"R@{kk} {r[f'recall@{kk}']:.3f}" for kk in RECALL_KS if kk <= args.k)
+            print(
+                f"{r['mode']:<7} {r['tokenizer']:<7} {recalls}  MRR {r['mrr']:.3f}  "
+                f"p50 {r['latency_ms']['p50']:.1f}ms  p95 {r['latency_ms']['p95']:.1f}ms  "
+                f"peak {r['peak_memory_kb']:.0f}KB"
+            )
+
+    path = save_result(
+        "bench_retrieval",
+        {"params": {"dataset": dataset_path.name, "k": args.k, "queries": len(items), "shared_index": shared,
+                    "rerank_top": args.rerank_top}, "results": rows},
+        args.label,
+    )
+    print(f"\n📄 結果: {path}")
+
+
+if __name__ == "__main__":
+    run()
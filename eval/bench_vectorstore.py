@@ -0,0 +1,145 @@
+"""
+ベクトルストアのバックエンド比較ベンチマーク（Chroma vs NumPy、LLM呼び出しなし）。
+
+dataset.json の質問を事前に Embedding しておき、検索部分だけのレイテンシを
+「上位k件」「全件ランキング（ハイブリッド検索が内部で使う k=n）」×「カテゴリ絞り込みあり/なし」
+で計測する。あわせて、起動（オープン）時間・オープン時のメモリ確保量と、
+NumPy（厳密な全件探索）の上位k件に対する Chroma の一致率（overlap@k）を出力する。
+
+使い方:
+    python eval/bench_vectorstore.py
+    python eval/bench_vectorstore.py --repeat 5 --k 8
+    LLM_BACKEND=stub python eval/bench_vectorstore.py   # オフライン（stub Embedding のインデックスで）
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rag.config import TOP_K
+from rag.index_versions import resolve_index_dirs
+from rag.providers import create_embeddings
+from rag.vectorstore import open_vectorstore
+from eval.benchlib import summarize_latencies, save_result
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+PERSIST_DIR, INDEX_DIR = resolve_index_dirs(BASE_DIR / "storage")  # 公開中のバージョン
+DATASET_PATH = Path(__file__).resolve().parent / "dataset.json"
+
+BACKENDS = ("chroma", "numpy")
+
+
+def _open(backend: str):
+    """バックエンドを開き、(db, オープン時間ms, 確保メモリKB) を返す。"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    db = open_vectorstore(PERSIST_DIR, index_dir=INDEX_DIR, backend=backend)
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if backend == "numpy" and type(db).__name__ != "NumpyVectorStore":
+        raise RuntimeError("共有インデックス（storage/index）がありません。先に build_index.py を実行してください")
+    return db, round(elapsed, 1), round(peak / 1024, 1)
+
+
+def _search(db, vec, k: int, category: str | None):
+    kwargs = {"filter": {"category": category}} if category else {}
+    return db.similarity_search_by_vector_with_relevance_scores(vec, k=k, **kwargs)
+
+
+def bench_backend(db, queries: list[tuple[list[float], str]], k: int, n: int, repeat: int) -> dict:
+    cases = {}
+    for label, kk, filtered in (
+        (f"top{k}", k, False),
+        (f"top{k}_category", k, True),
+        ("full_rank", n, False),
+        ("full_rank_category", n, True),
+    ):
+        latencies = []
+        for _ in range(repeat):
+            for vec, category in queries:
+                start = time.perf_counter()
+                _search(db, vec, kk, category if filtered else None)
+                latencies.append((time.perf_counter() - start) * 1000)
+        cases[label] = summarize_latencies(latencies)
+    return cases
+
+
+def overlap_at_k(reference, candidate, queries, k: int) -> float:
+    """reference の上位k件のうち candidate の上位k件にも含まれる割合の平均。"""
+    total = 0.0
+    for vec, category in queries:
+        ref = {doc.page_content for doc, _ in _search(reference, vec, k, category)}
+        got = {doc.page_content for doc, _ in _search(candidate, vec, k, category)}
+        total += len(ref & got) / max(1, len(ref))
+    return total / max(1, len(queries))
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default=None, help="eval/ 配下のデータセットJSON（既定: dataset.json）")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--repeat", type=int, default=3, help="各ケースを全質問で繰り返す回数")
+    parser.add_argument("--limit", type=int, default=0, help="先頭から使う問題数（0は全件）")
+    parser.add_argument("--label", default="")
+    args = parser.parse_args()
+
+    dataset_path = Path(__file__).resolve().parent / args.dataset if args.dataset else DATASET_PATH
+    with open(dataset_path, encoding="utf-8") as f:
+        items = [d for d in json.load(f) if d.get("question")]
+    if args.limit:
+        items = items[:args.limit]
+
+    embeddings = create_embeddings()
+    vectors = embeddings.embed_documents([item["question"] for item in items])
+    queries = [(vec, item.get("category")) for vec, item in zip(vectors, items)]
+
+    print("=" * 70)
+    print("🧮 ベクトルストア比較ベンチマーク（検索部分のみ、Embedding は事前計算）")
+    print(f"   データセット: {dataset_path.name}（{len(items)} 件） / k={args.k} / 繰り返し {args.repeat} 回")
+    print("=" * 70)
+
+    stores = {}
+    rows = []
+    for backend in BACKENDS:
+        db, open_ms, open_kb = _open(backend)
+        stores[backend] = db
+        n = len(db) if backend == "numpy" else db._collection.count()
+        # 初回呼び出しのキャッシュ構築を計測から外す
+        for vec, category in queries[:5]:
+            _search(db, vec, args.k, category)
+        cases = bench_backend(db, queries, args.k, n, args.repeat)
+        rows.append({"backend": backend, "chunks": n, "open_ms": open_ms, "open_alloc_kb": open_kb, "latency_ms": cases})
+        print(f"\n[{backend}] チャンク数 {n} / オープン {open_ms:.1f}ms / 確保 {open_kb:.0f}KB")
+        for label, lat in cases.items():
+            print(f"  {label:<20} p50 {lat['p50']:7.3f}ms  p95 {lat['p95']:7.3f}ms  p99 {lat['p99']:7.3f}ms")
+
+    overlap = round(overlap_at_k(stores["numpy"], stores["chroma"], queries, args.k), 4)
+    print(f"\nChroma の overlap@{args.k}（NumPy の厳密解に対する一致率）: {overlap:.3f}")
+
+    base = {r["backend"]: r["latency_ms"][f"top{args.k}_category"]["p50"] for r in rows}
+    if base["numpy"] > 0:
+        print(f"カテゴリ絞り込み top{args.k} の p50 比（chroma / numpy）: {base['chroma'] / base['numpy']:.1f} 倍")
+
+    path = save_result(
+        "bench_vectorstore",
+        {
+            "params": {"dataset": dataset_path.name, "k": args.k, "queries": len(items), "repeat": args.repeat},
+            "results": rows,
+            f"chroma_overlap@{args.k}": overlap,
+        },
+        args.label,
+    )
+    print(f"\n📄 結果: {path}")
+
+
+if __name__ == "__main__":
+    run()
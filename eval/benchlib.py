@@ -0,0 +1,134 @@
+"""
+ベンチマークスクリプト共通の集計・保存処理。
+
+レイテンシのパーセンタイル計算と、結果JSONの保存・前回結果との比較を行う。
+ベクトル検索系のベンチマーク用に、実インデックスを水増しした合成 Embedding も作れる。
+量子化・IVF の比較用に、ハイブリッド検索（/api/chat と同じ経路）の一致率・レイテンシも測れる。
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+BENCH_RESULTS_DIR = Path(__file__).resolve().parent / "bench_results"
+
+
+def percentile(values: list[float], p: float) -> float:
+    """線形補間によるパーセンタイル（p は 0〜100）。空なら 0.0。"""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    pos = (len(s) - 1) * p / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (pos - lo)
+
+
+def summarize_latencies(values_ms: list[float]) -> dict:
+    """ミリ秒のリストから mean / p50 / p95 / p99 / max を返す。"""
+    if not values_ms:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "count": len(values_ms),
+        "mean": round(sum(values_ms) / len(values_ms), 2),
+        "p50": round(percentile(values_ms, 50), 2),
+        "p95": round(percentile(values_ms, 95), 2),
+        "p99": round(percentile(values_ms, 99), 2),
+        "max": round(max(values_ms), 2),
+    }
+
+
+def synthetic_embeddings(base: np.ndarray, n: int, noise: float, seed: int, tmp_dir: Path) -> np.ndarray:
+    """
+    実ベクトル2本をランダムな比率で混ぜ、ガウスノイズを加えた n 件の正規化済み行列を
+    tmp_dir に書き出し、本番と同じく mmap で開き直して返す。
+    """
+    rng = np.random.default_rng(seed)
+    a, b = rng.integers(0, len(base), size=(2, n))
+    mix = rng.uniform(0, 1, size=(n, 1)).astype(np.float32)
+    matrix = mix * base[a] + (1 - mix) * base[b]
+    matrix += rng.normal(0, noise, size=matrix.shape).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    path = Path(tmp_dir) / "synthetic.npy"
+    np.save(path, matrix.astype(np.float32))
+    return np.load(path, mmap_mode="r")
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """事前に Embedding した質問はその値を返す（検索部分だけのレイテンシを測るため）。"""
+
+    def __init__(self, base: Embeddings, texts: list[str]):
+        self.base = base
+        self.vectors = dict(zip(texts, base.embed_documents(texts)))
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        vec = self.vectors.get(text)
+        return vec if vec is not None else self.base.embed_query(text)
+
+
+def hybrid_top_ids(db, items: list[dict], k: int, **kwargs) -> tuple[list[set[str]], list[float]]:
+    """各質問のハイブリッド検索の上位k件のチャンクIDと、1件あたりのレイテンシ（ms）。"""
+    from rag.vectorstore import hybrid_retrieve_with_score
+
+    ids, latencies = [], []
+    for item in items:
+        start = time.perf_counter()
+        results = hybrid_retrieve_with_score(db, item["question"], k=k, category=item.get("category", "unknown"), **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append({doc.id for doc, _ in results})
+    return ids, latencies
+
+
+def overlap(reference: list[set[str]], candidate: list[set[str]]) -> float:
+    """reference の上位k件のうち candidate にも含まれる割合の平均。"""
+    return round(sum(len(r & c) / max(1, len(r)) for r, c in zip(reference, candidate)) / max(1, len(reference)), 4)
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def save_result(kind: str, payload: dict, label: str = "") -> Path:
+    """eval/bench_results/<kind>_<日時>[_label].json に保存してパスを返す。"""
+    BENCH_RESULTS_DIR.mkdir(exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    suffix = f"_{label}" if label else ""
+    path = BENCH_RESULTS_DIR / f"{kind}_{stamp}{suffix}.json"
+    doc = {
+        "kind": kind,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        **payload,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def latest_result(kind: str, exclude: Path | None = None) -> Path | None:
+    """同じ種類の直近の結果ファイルを返す（比較用）。"""
+    files = sorted(BENCH_RESULTS_DIR.glob(f"{kind}_*.json"))
+    files = [f for f in files if exclude is None or f.resolve() != exclude.resolve()]
+    return files[-1] if files else None
+
+
+def load_result(path: Path) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,47 @@
+"""
+評価用の永続キャッシュ（JSONL 追記型のキー・バリューストア）。
+
+検索結果や生成回答をキャッシュし、再採点・再スコアリング時に
+再生成しないようにする。1行1エントリで追記するため、途中で落ちても
+書き込み済みのエントリは失われない。
+"""
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+CACHE_DIR = Path(__file__).resolve().parent / "cache"
+
+
+def make_key(*parts) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class JsonlCache:
+    def __init__(self, name: str, cache_dir: Path = CACHE_DIR):
+        self.path = cache_dir / f"{name}.jsonl"
+        self._lock = threading.Lock()
+        self._data: dict[str, object] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 書き込み途中で落ちた最終行は捨てる
+                    self._data[entry["key"]] = entry["value"]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str, default=None):
+        return self._data.get(key, default)
+
+    def put(self, key: str, value) -> None:
+        line = json.dumps({"key": key, "value": value}, ensure_ascii=False)
+        with self._lock:
+            self._data[key] = value
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
@@ -4,25 +4,39 @@
 クリーンな質問文を実際のユーザーが入力するような表現に変換し、
 クエリリライトの効果を検証するためのデータセットを生成する。
 
+質問ごとの変換は並列に実行し、結果は eval/cache/ に元の質問文単位でキャッシュする（LLM_BACKEND ごと。変換されなかった結果は保存しない）。
+途中で失敗しても再実行すれば、変換済みの質問はキャッシュから復元される（同じ質問は毎回同じ口語文になる）。
+
 使い方:
     python eval/colloquialize_dataset.py
+
+    # 並列数を指定して実行
+    python eval/colloquialize_dataset.py --workers 16
+
+    # キャッシュを使わずに全件を変換し直す
+    python eval/colloquialize_dataset.py --no-cache
 """
+import argparse
 import json
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from rag.config import MODEL_NAME
+from rag.config import LLM_BACKEND, MODEL_NAME
+from rag.llm_gateway import PRIORITY_EVAL, llm_invoke
+from rag.providers import create_llm
+from eval.cache import JsonlCache, make_key
 
 BASE_DIR = Path(__file__).resolve().parent
 INPUT_PATH = BASE_DIR / "dataset.json"
 OUTPUT_PATH = BASE_DIR / "dataset_colloquial.json"
+COLLOQUIAL_TEMPERATURE = 0.7
 
 
-def colloquialize(question: str, llm) -> str:
+def colloquialize(question: str, llm, cache: JsonlCache | None = None) -> str:
     prompt = f"""以下の質問文を、実際のユーザーがカスタマーサポートに送るような
 口語・ノイズ入りの表現に書き換えてください。
 
@@ -37,36 +51,58 @@ def colloquialize(question: str, llm) -> str:
 
 口語化した質問（1文のみ出力）："""
 
+    # バックエンドもキーに含める（stub 実行の結果を本番の LLM で再利用しないため）
+    key = make_key(LLM_BACKEND, MODEL_NAME, COLLOQUIAL_TEMPERATURE, prompt)
+    if cache is not None and (hit := cache.get(key)) is not None:
+        return hit
+
     try:
-        result = llm.invoke([{"role": "user", "content": prompt}])
-        return result.content.strip()
+        result = llm_invoke(llm, [{"role": "user", "content": prompt}], priority=PRIORITY_EVAL)
     except Exception as e:
+        # 失敗は元の質問のまま出力し、キャッシュしない（再実行で変換し直す）
         print(f"  ⚠️ エラー: {e}")
         return question
+    colloquial = result.content.strip()
+    if not colloquial or colloquial == question:
+        # 変換されなかった結果は元の質問のまま出力し、キャッシュしない
+        return question
+    if cache is not None:
+        cache.put(key, colloquial)
+    return colloquial
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8, help="同時に変換する質問数")
+    parser.add_argument("--no-cache", action="store_true", help="キャッシュを使わずに全件を変換し直す")
+    args = parser.parse_args()
+
     load_dotenv()
-    llm = ChatOpenAI(model=MODEL_NAME, temperature=0.7)
+    llm = create_llm(temperature=COLLOQUIAL_TEMPERATURE)
+    cache = None if args.no_cache else JsonlCache("colloquialize_dataset")
 
     with open(INPUT_PATH, encoding="utf-8") as f:
         dataset = json.load(f)
 
-    print(f"口語化開始: {len(dataset)} 件")
-
-    colloquial_dataset = []
-    for i, item in enumerate(dataset, 1):
-        original = item["question"]
-        colloquial = colloquialize(original, llm)
-        print(f"[{i}/{len(dataset)}] {original[:30]}...")
-        print(f"         → {colloquial[:50]}...")
-
-        colloquial_dataset.append({
-            **item,
-            "question_original": original,
-            "question": colloquial,
-        })
-
+    print(f"口語化開始: {len(dataset)} 件 / 並列数: {args.workers}")
+
+    converted: dict[int, dict] = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(colloquialize, item["question"], llm, cache): i for i, item in enumerate(dataset)}
+        for fut in as_completed(futures):
+            i = futures[fut]
+            original = dataset[i]["question"]
+            colloquial = fut.result()
+            converted[i] = {
+                **dataset[i],
+                "question_original": original,
+                "question": colloquial,
+            }
+            print(f"[{len(converted)}/{len(dataset)}] {original[:30]}...")
+            print(f"         → {colloquial[:50]}...")
+
+    # 元のデータセット順に並べ直して出力
+    colloquial_dataset = [converted[i] for i in range(len(dataset))]
     with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
         json.dump(colloquial_dataset, f, ensure_ascii=False, indent=2)
 
@@ -4,24 +4,39 @@ PDFから評価用Q&Aデータセットを自動生成するスクリプト。
 各PDFの内容をLLMに読み込ませ、「良い質問と正解」のペアを生成して
 eval/dataset.json に上書き保存する。
 
+PDFごとの生成は並列に実行し（LLMのレート制限は rag.llm_gateway の設定に従う）、
+生成結果は eval/cache/ にPDF内容単位でキャッシュする（形式を確認できた空でない結果だけを、LLM_BACKEND ごとに保存する）。
+途中で失敗しても再実行すれば、生成済みのPDFはキャッシュから即座に復元される。
+
 使い方:
     python eval/generate_dataset.py
+
+    # 並列数を指定して実行
+    python eval/generate_dataset.py --workers 8
+
+    # キャッシュを使わずに全PDFを再生成する
+    python eval/generate_dataset.py --no-cache
 """
+import argparse
 import json
 import sys
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 from dotenv import load_dotenv
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_openai import ChatOpenAI
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from rag.config import MODEL_NAME, TEMPERATURE
+from rag.config import LLM_BACKEND, MODEL_NAME
+from rag.llm_gateway import PRIORITY_EVAL, llm_invoke
+from rag.providers import create_llm
+from eval.cache import JsonlCache, make_key
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 OUTPUT_PATH = Path(__file__).resolve().parent / "dataset.json"
+GENERATE_TEMPERATURE = 0.0
 
 # カテゴリとPDFの対応
 CATEGORY_MAP = {
@@ -58,14 +73,27 @@ CATEGORY_MAP = {
 }
 
 
-def extract_qa_from_pdf(pdf_path: Path, category: str, llm) -> list[dict]:
-    """PDFの内容からQ&Aペアを生成する。"""
-    print(f"  読み込み中: {pdf_path.name}")
+def _valid_pairs(pairs) -> list[dict]:
+    """LLM の出力が {"question", "expected_answer"} の配列であることを確かめ、空の組を除いて返す。"""
+    if not isinstance(pairs, list):
+        raise ValueError(f"JSON配列ではありません（{type(pairs).__name__}）")
+    valid = []
+    for p in pairs:
+        if not isinstance(p, dict):
+            raise ValueError(f"配列の要素がオブジェクトではありません（{type(p).__name__}）")
+        question, answer = p.get("question"), p.get("expected_answer")
+        if isinstance(question, str) and isinstance(answer, str) and question and answer:
+            valid.append({"question": question, "expected_answer": answer})
+    return valid
+
+
+def extract_qa_from_pdf(pdf_path: Path, category: str, llm, cache: JsonlCache | None = None) -> list[dict]:
+    """PDFの内容からQ&Aペアを生成する（cache があればPDF内容単位で再利用する）。"""
     try:
         loader = PyPDFLoader(str(pdf_path))
         pages = loader.load()
     except Exception as e:
-        print(f"  ⚠️ 読み込みエラー: {e}")
+        print(f"  ⚠️ {pdf_path.name} 読み込みエラー: {e}")
         return []
 
     content = "\n".join(p.page_content for p in pages)[:3000]
@@ -88,45 +116,77 @@ def extract_qa_from_pdf(pdf_path: Path, category: str, llm) -> list[dict]:
   ...
 ]"""
 
-    try:
-        response = llm.invoke([{"role": "user", "content": prompt}]).content
-        match = re.search(r'\[.*\]', response, re.DOTALL)
-        if match:
-            pairs = json.loads(match.group())
-            return [
-                {
-                    "category": category,
-                    "question": p.get("question", ""),
-                    "expected_answer": p.get("expected_answer", ""),
-                }
-                for p in pairs
-                if p.get("question") and p.get("expected_answer")
-            ]
-    except Exception as e:
-        print(f"  ⚠️ Q&A生成エラー: {e}")
-
-    return []
+    # バックエンドもキーに含める（stub 実行の結果を本番の LLM で再利用しないため）
+    key = make_key(LLM_BACKEND, MODEL_NAME, GENERATE_TEMPERATURE, prompt)
+    cached = cache.get(key) if cache is not None else None
+    pairs = None
+    if cached is not None:
+        try:
+            pairs = _valid_pairs(cached) or None
+        except ValueError:
+            pass  # 以前の実行で保存された不正・空の結果は使わずに作り直す
+    if pairs is None:
+        try:
+            response = llm_invoke(llm, [{"role": "user", "content": prompt}], priority=PRIORITY_EVAL).content
+            match = re.search(r'\[.*\]', response, re.DOTALL)
+            if not match:
+                print(f"  ⚠️ {pdf_path.name} Q&A生成エラー: JSON配列が見つかりません")
+                return []
+            pairs = _valid_pairs(json.loads(match.group()))
+        except Exception as e:
+            print(f"  ⚠️ {pdf_path.name} Q&A生成エラー: {e}")
+            return []
+        if cache is not None and pairs:  # 空の結果はキャッシュせず、再実行で生成し直す
+            cache.put(key, pairs)
+
+    return [
+        {
+            "category": category,
+            "source": pdf_path.relative_to(BASE_DIR).as_posix(),  # 検索ベンチマークの正解資料
+            **p,
+        }
+        for p in pairs
+    ]
 
 
 def main():
-    load_dotenv()
-    llm = ChatOpenAI(model=MODEL_NAME, temperature=0.0)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4, help="同時に処理するPDF数")
+    parser.add_argument("--no-cache", action="store_true", help="キャッシュを使わずに全PDFを再生成する")
+    args = parser.parse_args()
 
-    all_pairs = []
-    q_id = 1
+    load_dotenv()
+    llm = create_llm(temperature=GENERATE_TEMPERATURE)
+    cache = None if args.no_cache else JsonlCache("generate_dataset")
 
+    targets = []
     for category, pdf_paths in CATEGORY_MAP.items():
-        print(f"\n📂 カテゴリ: {category}")
         for pdf_path in pdf_paths:
             if not pdf_path.exists():
                 print(f"  ⚠️ ファイルが見つかりません: {pdf_path}")
                 continue
-            pairs = extract_qa_from_pdf(pdf_path, category, llm)
-            for pair in pairs:
-                pair["id"] = f"q{q_id:03d}"
-                q_id += 1
-                all_pairs.append(pair)
-                print(f"  ✅ Q{pair['id']}: {pair['question'][:40]}...")
+            targets.append((category, pdf_path))
+
+    print(f"対象PDF: {len(targets)} 件 / 並列数: {args.workers}\n")
+
+    # 完了したPDFから順に受け取る（並び順は最後にCATEGORY_MAP順へ戻す）
+    results: dict[int, list[dict]] = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(extract_qa_from_pdf, pdf_path, category, llm, cache): i
+            for i, (category, pdf_path) in enumerate(targets)
+        }
+        for fut in as_completed(futures):
+            i = futures[fut]
+            category, pdf_path = targets[i]
+            results[i] = fut.result()
+            print(f"[{len(results)}/{len(targets)}] 📂 {category} / {pdf_path.name}: {len(results[i])} 件")
+
+    all_pairs = []
+    for i in range(len(targets)):
+        for pair in results[i]:
+            pair["id"] = f"q{len(all_pairs) + 1:03d}"
+            all_pairs.append(pair)
 
     # dataset.json に保存
     with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
@@ -2,12 +2,15 @@
 評価指標モジュール
 
 ② LLM as a Judge：生成回答が正解と一致しているか ○/× で判定
+   （複数件を1回の呼び出しでまとめて判定するバッチモードあり）
 ③ 文字類似度：正解と生成回答の文字レベルの一致率を計算
 """
 import re
 import json
 import difflib
 
+from rag.llm_gateway import llm_invoke, PRIORITY_EVAL
+
 
 def text_similarity(expected: str, generated: str) -> float:
     """
@@ -15,6 +18,7 @@ def text_similarity(expected: str, generated: str) -> float:
 
     空白・改行を除去してから比較することで、
     表現の違いではなく内容の一致度を測る。
+    大量のペアをまとめて計算する場合は eval.similarity.batch_similarity を使う。
 
     Returns:
         0.0（完全不一致）〜 1.0（完全一致）
@@ -60,7 +64,7 @@ def llm_judge(question: str, expected: str, generated: str, llm) -> dict:
 {{"judgment": "○ または ×", "reason": "判定理由を1文で"}}"""
 
     try:
-        response = llm.invoke([{"role": "user", "content": prompt}]).content
+        response = llm_invoke(llm, [{"role": "user", "content": prompt}], priority=PRIORITY_EVAL).content
         match = re.search(r'\{[^}]+\}', response, re.DOTALL)
         if match:
             data = json.loads(match.group())
@@ -70,3 +74,84 @@ def llm_judge(question: str, expected: str, generated: str, llm) -> dict:
         print(f"  [LLM Judge] エラー: {e}")
 
     return {"judgment": "×", "reason": "評価エラー"}
+
+
+def llm_judge_batch(triples: list[tuple[str, str, str]], llm) -> list[dict]:
+    """
+    LLM as a Judge のバッチ版：(質問, 期待回答, 生成回答) を複数件まとめて1回で判定する。
+
+    判定基準は llm_judge と同じ。JSON のパースに失敗した項目・欠けた項目は
+    llm_judge で1件ずつ判定し直す。
+
+    Returns:
+        入力と同じ順序の [{"judgment": "○" or "×", "reason": str, "batched": bool}, ...]
+    """
+    if len(triples) <= 1:
+        return [{**llm_judge(q, e, g, llm), "batched": False} for q, e, g in triples]
+
+    items = "\n\n".join(
+        f"### 項目{i}\n[質問]\n{q}\n\n[期待する回答]\n{e}\n\n[生成された回答]\n{g}"
+        for i, (q, e, g) in enumerate(triples, 1)
+    )
+    prompt = f"""あなたは回答品質を評価する厳格な審査員です。
+
+以下の各項目について「質問」「期待する回答」「生成された回答」を比較し、
+生成された回答が質問に対して適切かどうかを項目ごとに独立して判定してください。
+
+【判定基準】
+○：生成回答が質問の要点に答えており、期待回答の重要な情報を含んでいる
+×：重要な情報が欠けている、または内容が明らかに誤っている
+
+{items}
+
+以下のJSON配列のみで回答してください（全{len(triples)}項目・説明文不要）：
+[{{"id": 項目番号, "judgment": "○ または ×", "reason": "判定理由を1文で"}}, ...]"""
+
+    verdicts: dict[int, dict] = {}
+    try:
+        response = llm_invoke(llm, [{"role": "user", "content": prompt}], priority=PRIORITY_EVAL).content
+        match = re.search(r'\[.*\]', response, re.DOTALL)
+        if match:
+            for data in json.loads(match.group()):
+                try:
+                    idx = int(data.get("id"))
+                except (TypeError, ValueError):
+                    continue
+                if 1 <= idx <= len(triples):
+                    judgment = "○" if "○" in str(data.get("judgment", "")) else "×"
+                    verdicts[idx] = {"judgment": judgment, "reason": data.get("reason", ""), "batched": True}
+    except Exception as e:
+        print(f"  [LLM Judge] バッチ判定エラー: {e}")
+
+    results = []
+    for i, (q, e, g) in enumerate(triples, 1):
+        if i in verdicts:
+            results.append(verdicts[i])
+        else:
+            results.append({**llm_judge(q, e, g, llm), "batched": False})
+    return results
+
+
+def judge_agreement(pairs: list[tuple[str, str]]) -> dict:
+    """
+    バッチ判定と1件ずつの判定の一致度を返す。
+
+    Args:
+        pairs: [(バッチ判定, 単独判定), ...]  各値は "○" or "×"
+
+    Returns:
+        {"n", "agreement", "kappa", "confusion"}  confusion のキーは "バッチ/単独"
+    """
+    n = len(pairs)
+    if n == 0:
+        return {"n": 0, "agreement": 0.0, "kappa": 0.0, "confusion": {}}
+    confusion: dict[str, int] = {}
+    for b, s in pairs:
+        confusion[f"{b}/{s}"] = confusion.get(f"{b}/{s}", 0) + 1
+    agree = sum(1 for b, s in pairs if b == s) / n
+    # Cohen's kappa（偶然の一致を除いた一致度）
+    pb = sum(1 for b, _ in pairs if b == "○") / n
+    ps = sum(1 for _, s in pairs if s == "○") / n
+    expected = pb * ps + (1 - pb) * (1 - ps)
+    kappa = (agree - expected) / (1 - expected) if expected < 1 else 1.0
+    return {"n": n, "agreement": round(agree, 4), "kappa": round(kappa, 4), "confusion": confusion}
@@ -13,27 +13,56 @@ dataset.json の各質問に対して両方の検索方法で回答を生成し
 
     # 3. Temperatureを指定して実行
     python eval/run_eval.py --temperature 0.3
+
+    # 4. 並列数を指定して実行（LLMのレート制限は rag.llm_gateway の設定に従う）
+    python eval/run_eval.py --workers 8
+
+    # 5. 中断した評価を再開する（同じ条件の直近の途中結果から続行）
+    python eval/run_eval.py --resume
+
+    # 6. 検索結果・回答をキャッシュから再利用して採点だけやり直す
+    python eval/run_eval.py --cached
+
+    # 7. ハイブリッド検索の結果をリランキングして上位4件だけで回答する
+    #    （--rerank なしの実行と aggregate_results.py で正解率を比べる）
+    python eval/run_eval.py --rerank 4
 """
 import argparse
 import csv
+import hashlib
 import json
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+
+load_dotenv()
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from rag.config import MODEL_NAME, TEMPERATURE, TOP_K, AGENT_ROUNDS
+from langchain_core.documents import Document
+
+from rag.config import (
+    MODEL_NAME, TEMPERATURE, TOP_K, AGENT_ROUNDS, LLM_BACKEND, EMBEDDING_BACKEND,
+    VECTOR_BACKEND, VECTOR_QUANTIZATION, VECTOR_RESCORE_FACTOR, IVF_NPROBE, HYBRID_VECTOR_DEPTH,
+)
+from rag.index_versions import LEGACY_VERSION, current_version, resolve_index_dirs
 from rag.vectorstore import open_vectorstore, hybrid_retrieve_with_score, _vector_only_search
+from rag.rerank import rerank
+from rag.chunking import expand_to_parents
 from rag.agent import agent_answer
+from rag.providers import create_llm
 from rag.query import rewrite_query_for_search
-from eval.metrics import text_similarity, llm_judge
+from eval.cache import JsonlCache, make_key
+from eval.metrics import llm_judge, llm_judge_batch, judge_agreement
+from eval.similarity import METHODS as SIMILARITY_METHODS, similarity
 
 BASE_DIR = Path(__file__).resolve().parent.parent
-PERSIST_DIR = BASE_DIR / "storage" / "chroma"
+PERSIST_DIR, INDEX_DIR = resolve_index_dirs(BASE_DIR / "storage")  # 公開中のバージョン
+INDEX_VERSION = current_version(BASE_DIR / "storage") or LEGACY_VERSION
 DATASET_PATH = Path(__file__).resolve().parent / "dataset.json"
 RESULTS_DIR = Path(__file__).resolve().parent / "results"
 
@@ -55,19 +84,175 @@ def _generate_answer(search_results: list, question: str, llm) -> str:
     return result["answer"]
 
 
+class EvalCaches:
+    """
+    検索結果・クエリリライト・生成回答のキャッシュ。
+
+    書き込みは常に行い、読み出しは reuse=True のときだけ行う
+    （Temperature > 0 の繰り返し計測で同じ回答を使い回さないため）。
+    検索結果はインデックスのバージョンと検索バックエンドの設定ごと、リライト・回答は
+    LLM_BACKEND ごとにキーを分けるため、インデックスの作り直しや stub での実行結果は再利用されない。
+    """
+
+    def __init__(self, reuse: bool):
+        self.reuse = reuse
+        self.retrieval = JsonlCache("retrieval")
+        self.rewrite = JsonlCache("rewrite")
+        self.answer = JsonlCache("answer")
+        # 検索結果を左右する設定（どれかが変われば別のキャッシュエントリになる）
+        self.retrieval_settings = (
+            INDEX_VERSION, EMBEDDING_BACKEND, VECTOR_BACKEND, VECTOR_QUANTIZATION,
+            VECTOR_RESCORE_FACTOR, IVF_NPROBE, HYBRID_VECTOR_DEPTH,
+        )
+
+    def _cached(self, cache: JsonlCache, key: str, compute):
+        if self.reuse:
+            hit = cache.get(key)
+            if hit is not None:
+                return hit
+        value = compute()
+        cache.put(key, value)
+        return value
+
+    def search(self, mode: str, fn, query: str, category: str, use_janome: bool) -> list:
+        key = make_key(mode, query, category, TOP_K, use_janome, *self.retrieval_settings)
+
+        def _compute():
+            return [[d.page_content, d.metadata, float(score)] for d, score in fn()]
+
+        return [(Document(page_content=c, metadata=m or {}), score)
+                for c, m, score in self._cached(self.retrieval, key, _compute)]
+
+    def rewrite_query(self, question: str, llm, temperature: float) -> str:
+        key = make_key(question, LLM_BACKEND, MODEL_NAME, temperature)
+        return self._cached(self.rewrite, key, lambda: rewrite_query_for_search(question, llm=llm))
+
+    def generate(self, search_results: list, question: str, llm, temperature: float) -> str:
+        context = [doc.page_content for doc, _ in search_results]
+        key = make_key(question, context, LLM_BACKEND, MODEL_NAME, temperature, AGENT_ROUNDS)
+        return self._cached(self.answer, key, lambda: _generate_answer(search_results, question, llm))
+
+
+def _answer_item(item: dict, db, llm, caches: EvalCaches, temperature: float,
+                 use_rewrite: bool, use_janome: bool, sim_method: str, rerank_top: int = 0) -> dict:
+    """1問分の検索・回答生成・文字類似度を計算し、採点前のCSV行を返す。"""
+    qid      = item["id"]
+    question = item["question"]
+    expected = item["expected_answer"]
+    category = item.get("category", "unknown")
+
+    search_query = caches.rewrite_query(question, llm, temperature) if use_rewrite else question
+
+    # ── ベクトル検索 ──────────────────────────────────
+    vec_results = caches.search(
+        "vector", lambda: _vector_only_search(db, search_query, k=TOP_K, category=category),
+        search_query, category, use_janome,
+    )
+    vec_answer = caches.generate(expand_to_parents(db, vec_results), question, llm, temperature)
+
+    # ── ハイブリッド検索 ──────────────────────────────
+    hyb_results = caches.search(
+        "hybrid",
+        lambda: hybrid_retrieve_with_score(db, search_query, k=TOP_K, category=category, use_janome=use_janome),
+        search_query, category, use_janome,
+    )
+    if rerank_top > 0:
+        hyb_results = rerank(db, search_query, hyb_results, top_n=rerank_top, use_janome=use_janome)
+    hyb_answer = caches.generate(expand_to_parents(db, hyb_results), question, llm, temperature)
+
+    # ── ③ 文字類似度 ──────────────────────────────────
+    vec_sim = similarity(expected, vec_answer, method=sim_method)
+    hyb_sim = similarity(expected, hyb_answer, method=sim_method)
+
+    return {
+        "id":                   qid,
+        "category":             category,
+        "question":             question,
+        "expected_answer":      expected,
+        "vector_answer":        vec_answer,
+        "hybrid_answer":        hyb_answer,
+        "vector_similarity":    f"{vec_sim:.3f}",
+        "hybrid_similarity":    f"{hyb_sim:.3f}",
+        "_search_query":        search_query,
+    }
+
+
+def _in_agreement_sample(qid: str, rate: float) -> bool:
+    """問題IDから決定的に一致度検証の対象かどうかを決める（再開しても対象が変わらない）。"""
+    return int(hashlib.md5(qid.encode("utf-8")).hexdigest(), 16) % 1000 < rate * 1000
+
+
+def _judge_rows(rows: list[dict], llm, judge_batch: int, agreement_rate: float) -> None:
+    """② LLM as a Judge で rows の vector / hybrid 回答を採点し、判定列を書き込む。"""
+    targets = [(row, mode) for row in rows for mode in ("vector", "hybrid")]
+    triples = [(row["question"], row["expected_answer"], row[f"{mode}_answer"]) for row, mode in targets]
+
+    if judge_batch > 1:
+        verdicts = llm_judge_batch(triples, llm)
+    else:
+        verdicts = [{**llm_judge(q, e, g, llm), "batched": False} for q, e, g in triples]
+
+    for (row, mode), (q, e, g), verdict in zip(targets, triples, verdicts):
+        row[f"{mode}_judge"] = verdict["judgment"]
+        row[f"{mode}_judge_reason"] = verdict["reason"]
+        row[f"_{mode}_judge_batched"] = verdict["batched"]
+        # バッチ判定が単独判定とどれだけ一致するかを抜き取りで検証する
+        if verdict["batched"] and _in_agreement_sample(row["id"], agreement_rate):
+            row[f"_{mode}_judge_single"] = llm_judge(q, e, g, llm)["judgment"]
+
+
+def _evaluate_group(items: list[dict], db, llm, caches: EvalCaches, temperature: float,
+                    use_rewrite: bool, use_janome: bool, judge_batch: int, agreement_rate: float,
+                    sim_method: str, rerank_top: int = 0) -> list[dict]:
+    """複数問の回答を生成し、まとめて採点して CSV 行のリストを返す。"""
+    rows = [
+        _answer_item(item, db, llm, caches, temperature, use_rewrite, use_janome, sim_method, rerank_top)
+        for item in items
+    ]
+    _judge_rows(rows, llm, judge_batch, agreement_rate)
+    return rows
+
+
+def _find_checkpoint(suffix: str) -> Path | None:
+    """同じ評価条件（ファイル名の suffix が一致）の直近の途中結果を返す。"""
+    candidates = sorted(RESULTS_DIR.glob(f"eval_*{suffix}.partial.jsonl"))
+    return candidates[-1] if candidates else None
+
+
+def _load_checkpoint(path: Path) -> dict[str, dict]:
+    done = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done[row["id"]] = row
+    return done
+
+
 def run():
     parser = argparse.ArgumentParser()
     parser.add_argument("--temperature", type=float, default=TEMPERATURE)
     parser.add_argument("--rewrite", action="store_true", help="クエリリライトを有効にする")
     parser.add_argument("--dataset", type=str, default=None, help="使用するデータセットファイル名（eval/配下）")
     parser.add_argument("--no-janome", action="store_true", help="Janome形態素解析を無効にする（正規表現にフォールバック）")
+    parser.add_argument("--workers", type=int, default=4, help="同時に評価する問題数")
+    parser.add_argument("--resume", action="store_true", help="同じ条件の直近の途中結果から再開する")
+    parser.add_argument("--cached", action="store_true", help="検索結果・リライト・回答をキャッシュから再利用する（採点のみやり直す）")
+    parser.add_argument("--similarity", choices=SIMILARITY_METHODS, default="compat",
+                        help="文字類似度の計算方法（compat は従来の SequenceMatcher と同じ値）")
+    parser.add_argument("--judge-batch", type=int, default=1, help="1回のLLM呼び出しでまとめて判定する回答数（1は従来どおり1件ずつ）")
+    parser.add_argument("--judge-agreement", type=float, default=0.0,
+                        help="バッチ判定を1件ずつの判定と突き合わせる問題の割合（0〜1）")
+    parser.add_argument("--rerank", type=int, default=0,
+                        help="ハイブリッド検索の結果をリランキングし、上位N件だけで回答する（0は無効）")
     args = parser.parse_args()
     temperature = args.temperature
     use_rewrite = args.rewrite
     use_janome = not args.no_janome
 
-    load_dotenv()
-
     dataset_path = Path(__file__).resolve().parent / args.dataset if args.dataset else DATASET_PATH
 
     print("=" * 55)
@@ -75,6 +260,7 @@ def run():
     print(f"   Temperature: {temperature}")
     print(f"   クエリリライト: {'あり' if use_rewrite else 'なし'}")
     print(f"   Janome形態素解析: {'あり' if use_janome else 'なし（正規表現）'}")
+    print(f"   リランキング: {f'上位{args.rerank}件' if args.rerank > 0 else 'なし'}")
     print(f"   データセット: {dataset_path.name}")
     print("=" * 55)
 
@@ -90,73 +276,83 @@ def run():
         print("   python eval/generate_dataset.py\n")
         return
 
-    print(f"\n評価問題数: {len(valid)} 件\n")
+    print(f"\n評価問題数: {len(valid)} 件 / 並列数: {args.workers}\n")
 
-    db = open_vectorstore(PERSIST_DIR)
-    llm = ChatOpenAI(model=MODEL_NAME, temperature=temperature)
+    db = open_vectorstore(PERSIST_DIR, index_dir=INDEX_DIR)
+    llm = create_llm(temperature=temperature)
+    caches = EvalCaches(reuse=args.cached)
 
     RESULTS_DIR.mkdir(exist_ok=True)
     rewrite_label = "_rewrite" if use_rewrite else ""
     dataset_label = f"_{dataset_path.stem}" if args.dataset else ""
     janome_label = "_nojanome" if not use_janome else ""
-    results_path = RESULTS_DIR / f"eval_{datetime.now().strftime('%Y%m%d_%H%M%S')}_temp{temperature}{dataset_label}{janome_label}{rewrite_label}.csv"
-
-    rows = []
-
-    for i, item in enumerate(valid, 1):
-        qid      = item["id"]
-        question = item["question"]
-        expected = item["expected_answer"]
-        category = item.get("category", "unknown")
-
-        print(f"[{i}/{len(valid)}] {question}")
-
-        search_query = rewrite_query_for_search(question, llm=llm) if use_rewrite else question
-        if use_rewrite:
-            print(f"  ✏️  リライト: {search_query}")
-
-        # ── ベクトル検索 ──────────────────────────────────
-        print("  🔍 ベクトル検索...")
-        vec_results = _vector_only_search(db, search_query, k=TOP_K, category=category)
-        vec_answer  = _generate_answer(vec_results, question, llm)
-
-        # ── ハイブリッド検索 ──────────────────────────────
-        print("  🔍 ハイブリッド検索...")
-        hyb_results = hybrid_retrieve_with_score(db, search_query, k=TOP_K, category=category, use_janome=use_janome)
-        hyb_answer  = _generate_answer(hyb_results, question, llm)
-
-        # ── ② LLM as a Judge ─────────────────────────────
-        print("  🤖 LLM評価...")
-        vec_judge = llm_judge(question, expected, vec_answer, llm)
-        hyb_judge = llm_judge(question, expected, hyb_answer, llm)
-
-        # ── ③ 文字類似度 ──────────────────────────────────
-        vec_sim = text_similarity(expected, vec_answer)
-        hyb_sim = text_similarity(expected, hyb_answer)
-
-        print(f"  ベクトル   : {vec_judge['judgment']}  類似度 {vec_sim:.1%}")
-        print(f"  ハイブリッド: {hyb_judge['judgment']}  類似度 {hyb_sim:.1%}\n")
-
-        rows.append({
-            "id":                   qid,
-            "category":             category,
-            "question":             question,
-            "expected_answer":      expected,
-            "vector_answer":        vec_answer,
-            "hybrid_answer":        hyb_answer,
-            "vector_judge":         vec_judge["judgment"],
-            "hybrid_judge":         hyb_judge["judgment"],
-            "vector_similarity":    f"{vec_sim:.3f}",
-            "hybrid_similarity":    f"{hyb_sim:.3f}",
-            "vector_judge_reason":  vec_judge["reason"],
-            "hybrid_judge_reason":  hyb_judge["reason"],
-        })
+    rerank_label = f"_rerank{args.rerank}" if args.rerank > 0 else ""
+    judge_label = f"_judgebatch{args.judge_batch}" if args.judge_batch > 1 else ""
+    sim_label = f"_sim{args.similarity}" if args.similarity != "compat" else ""
+    suffix = f"_temp{temperature}{dataset_label}{janome_label}{rewrite_label}{rerank_label}{judge_label}{sim_label}"
+
+    checkpoint_path = _find_checkpoint(suffix) if args.resume else None
+    if checkpoint_path is None:
+        checkpoint_path = RESULTS_DIR / f"eval_{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}.partial.jsonl"
+    results_path = checkpoint_path.with_name(checkpoint_path.name.replace(".partial.jsonl", ".csv"))
+
+    done = _load_checkpoint(checkpoint_path)
+    if done:
+        print(f"♻️  途中結果から再開: {checkpoint_path.name}（完了済み {len(done)} 件）\n")
+    pending = [item for item in valid if item["id"] not in done]
+
+    lock = threading.Lock()
+    completed = len(done)
+
+    def _record(row: dict) -> None:
+        nonlocal completed
+        with lock:
+            done[row["id"]] = row
+            with open(checkpoint_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            completed += 1
+            print(f"[{completed}/{len(valid)}] {row['question']}")
+            if use_rewrite:
+                print(f"  ✏️  リライト: {row['_search_query']}")
+            print(f"  ベクトル   : {row['vector_judge']}  類似度 {float(row['vector_similarity']):.1%}")
+            print(f"  ハイブリッド: {row['hybrid_judge']}  類似度 {float(row['hybrid_similarity']):.1%}\n")
+
+    # 1問あたり vector / hybrid の2回答を採点するため、バッチ判定時は judge_batch/2 問ずつまとめる
+    group_size = max(1, args.judge_batch // 2)
+    groups = [pending[i:i + group_size] for i in range(0, len(pending), group_size)]
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(
+                _evaluate_group, group, db, llm, caches, temperature, use_rewrite, use_janome,
+                args.judge_batch, args.judge_agreement, args.similarity, args.rerank,
+            ): group
+            for group in groups
+        }
+        for fut in as_completed(futures):
+            try:
+                for row in fut.result():
+                    _record(row)
+            except Exception as e:
+                ids = ", ".join(item["id"] for item in futures[fut])
+                print(f"  ⚠️ {ids} の評価に失敗しました（--resume で再実行できます）: {e}")
+
+    missing = [item["id"] for item in valid if item["id"] not in done]
+    if missing:
+        print(f"\n⚠️  未完了の問題が {len(missing)} 件あります。python eval/run_eval.py --resume で続きから再開できます。")
+        print(f"   途中結果: {checkpoint_path}")
+        return
+
+    # データセット順に並べ直して出力
+    full_rows = [done[item["id"]] for item in valid]
+    rows = [{k: v for k, v in row.items() if not k.startswith("_")} for row in full_rows]
 
     # ── CSV 出力 ───────────────────────────────────────────
     with open(results_path, "w", newline="", encoding="utf-8-sig") as f:
         writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
         writer.writeheader()
         writer.writerows(rows)
+    checkpoint_path.unlink()
 
     # ── サマリー ───────────────────────────────────────────
     n = len(rows)
@@ -185,6 +381,20 @@ def run():
     else:
         verdict = "両者同等"
     print(f"\n差分: 正解率 {diff_acc:+.1%}  類似度 {diff_sim:+.1%}  → {verdict}")
+    if args.judge_batch > 1:
+        verdicts = [row.get(f"_{mode}_judge_batched") for row in full_rows for mode in ("vector", "hybrid")]
+        fallback = sum(1 for v in verdicts if v is False)
+        print(f"\nバッチ判定: {args.judge_batch}件/呼び出し  単独判定へのフォールバック {fallback}/{len(verdicts)} 件")
+        pairs = [
+            (row[f"{mode}_judge"], row[f"_{mode}_judge_single"])
+            for row in full_rows for mode in ("vector", "hybrid")
+            if f"_{mode}_judge_single" in row
+        ]
+        if pairs:
+            agr = judge_agreement(pairs)
+            print(f"バッチ判定と単独判定の一致率: {agr['agreement']:.1%}  κ={agr['kappa']:.3f}  "
+                  f"（{agr['n']}件, バッチ/単独: {agr['confusion']}）")
+
     print(f"\n📄 詳細結果: {results_path}")
 
 
@@ -0,0 +1,183 @@
+"""
+文字類似度の計算モジュール（大量の回答ペア向け）。
+
+method:
+    "compat"  : difflib.SequenceMatcher.ratio()。既存の評価結果（text_similarity）と同じ値。
+                長い回答では二乗オーダーで遅くなるため、workers で並列化できる。
+    "jaccard" : 文字 n-gram 集合の Jaccard 係数
+    "cosine"  : 文字 n-gram 出現頻度ベクトルのコサイン類似度
+
+jaccard / cosine はバッチ全体を NumPy でまとめて計算する（ペアごとの Python ループなし）。
+いずれも空白・改行を除去してから比較し、両方空なら 1.0、片方だけ空なら 0.0 を返す。
+
+使い方（既存の結果CSVを別の指標で再計算して比較）:
+    python eval/similarity.py eval/results/*.csv --method jaccard
+    python eval/similarity.py eval/results/*.csv --method compat --workers 8
+"""
+import argparse
+import csv
+import difflib
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+METHODS = ("compat", "jaccard", "cosine")
+
+_CODEPOINT_BITS = 21  # Unicode のコードポイントは 21bit に収まる
+_PAIR_SHIFT = 2 * _CODEPOINT_BITS
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'\s+', '', text)
+
+
+def _ratio(pair: tuple[str, str], prefilter: float | None = None) -> float:
+    a, b = pair
+    if not a and not b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    sm = difflib.SequenceMatcher(None, a, b)
+    if prefilter is not None:
+        # quick_ratio() は ratio() の上限値。閾値未満が確定したら重い ratio() を省略する
+        upper = sm.quick_ratio()
+        if upper < prefilter:
+            return upper
+    return sm.ratio()
+
+
+def _gram_codes(text: str, n: int) -> np.ndarray:
+    """文字 n-gram（n=1,2）をコードポイントを詰めた整数として返す。"""
+    cp = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    if n == 1 or len(cp) < 2:
+        return cp
+    return (cp[:-1] << _CODEPOINT_BITS) | cp[1:]
+
+
+def _keyed_counts(texts: list[str], n: int) -> tuple[np.ndarray, np.ndarray]:
+    """バッチ全体の (ペア番号, n-gram) キーを一意化し、キーと出現回数を返す。"""
+    grams = [_gram_codes(t, n) for t in texts]
+    lengths = np.array([len(g) for g in grams], dtype=np.int64)
+    if lengths.sum() == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pair_idx = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+    keys = (pair_idx << _PAIR_SHIFT) | np.concatenate(grams)
+    return np.unique(keys, return_counts=True)
+
+
+def _ngram_similarity(expected: list[str], generated: list[str], method: str, n: int) -> np.ndarray:
+    m = len(expected)
+    keys_a, cnt_a = _keyed_counts(expected, n)
+    keys_b, cnt_b = _keyed_counts(generated, n)
+    pair_a = keys_a >> _PAIR_SHIFT
+    pair_b = keys_b >> _PAIR_SHIFT
+    _, ia, ib = np.intersect1d(keys_a, keys_b, assume_unique=True, return_indices=True)
+    pair_common = pair_a[ia]
+
+    if method == "jaccard":
+        inter = np.bincount(pair_common, minlength=m).astype(np.float64)
+        size_a = np.bincount(pair_a, minlength=m)
+        size_b = np.bincount(pair_b, minlength=m)
+        union = size_a + size_b - inter
+        sim = np.divide(inter, union, out=np.zeros(m), where=union > 0)
+    else:
+        dot = np.bincount(pair_common, weights=(cnt_a[ia] * cnt_b[ib]).astype(np.float64), minlength=m)
+        norm_a = np.sqrt(np.bincount(pair_a, weights=cnt_a.astype(np.float64) ** 2, minlength=m))
+        norm_b = np.sqrt(np.bincount(pair_b, weights=cnt_b.astype(np.float64) ** 2, minlength=m))
+        denom = norm_a * norm_b
+        sim = np.divide(dot, denom, out=np.zeros(m), where=denom > 0)
+
+    # 空文字の扱いを text_similarity と揃える（1文字で n-gram が作れない場合も含む）
+    empty_a = np.array([not t for t in expected])
+    empty_b = np.array([not t for t in generated])
+    sim[empty_a | empty_b] = 0.0
+    sim[empty_a & empty_b] = 1.0
+    return sim
+
+
+def batch_similarity(
+    expected: list[str],
+    generated: list[str],
+    method: str = "compat",
+    n: int = 2,
+    prefilter: float | None = None,
+    workers: int = 1,
+) -> np.ndarray:
+    """
+    (期待回答, 生成回答) のペアごとの類似度をまとめて計算する。
+
+    Args:
+        method: "compat" | "jaccard" | "cosine"
+        n: jaccard / cosine の n-gram 長（1 または 2）
+        prefilter: compat のみ。quick_ratio() がこの値未満のペアは ratio() を省略し、
+            上限値 quick_ratio() を返す（閾値以上のペアは厳密値と一致）
+        workers: compat のみ。ratio() を計算するプロセス数
+
+    Returns:
+        0.0〜1.0 の配列（入力と同じ順序）
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown similarity method: {method}")
+    if len(expected) != len(generated):
+        raise ValueError("expected と generated の件数が一致しません")
+    a = [_normalize(t) for t in expected]
+    b = [_normalize(t) for t in generated]
+
+    if method == "compat":
+        pairs = list(zip(a, b))
+        if workers > 1 and len(pairs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                values = list(pool.map(_ratio, pairs, [prefilter] * len(pairs), chunksize=16))
+        else:
+            values = [_ratio(p, prefilter) for p in pairs]
+        return np.array(values, dtype=np.float64)
+
+    if n not in (1, 2):
+        raise ValueError("n-gram 長は 1 または 2 を指定してください")
+    return _ngram_similarity(a, b, method, n)
+
+
+def similarity(expected: str, generated: str, method: str = "compat", n: int = 2) -> float:
+    """1ペア分の類似度。"""
+    return float(batch_similarity([expected], [generated], method=method, n=n)[0])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("csv_files", nargs="+", type=Path)
+    parser.add_argument("--method", choices=METHODS, default="compat")
+    parser.add_argument("--n", type=int, default=2)
+    parser.add_argument("--prefilter", type=float, default=None)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    expected, generated, owners = [], [], []
+    for path in args.csv_files:
+        with open(path, encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                for mode in ("vector", "hybrid"):
+                    expected.append(row["expected_answer"])
+                    generated.append(row[f"{mode}_answer"])
+                    owners.append((path.name, mode))
+
+    start = time.perf_counter()
+    sims = batch_similarity(expected, generated, args.method, args.n, args.prefilter, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"{len(sims)} ペアを {elapsed:.2f} 秒で計算（method={args.method}）\n")
+
+    totals: dict[tuple[str, str], list[float]] = {}
+    for owner, v in zip(owners, sims):
+        totals.setdefault(owner, []).append(float(v))
+    print(f"{'ファイル':<64} {'ベクトル':>8} {'ハイブリッド':>10}")
+    for path in args.csv_files:
+        vec = totals.get((path.name, "vector"), [])
+        hyb = totals.get((path.name, "hybrid"), [])
+        if vec:
+            print(f"{path.name:<64} {sum(vec) / len(vec):>8.1%} {sum(hyb) / len(hyb):>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
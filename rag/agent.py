@@ -4,6 +4,7 @@ import time
 from typing import Callable, Optional
 import tiktoken
 from .prompts import SYSTEM_PROMPT
+from .llm_gateway import llm_invoke, PRIORITY_ANSWER, PRIORITY_EVAL
 
 
 def _self_evaluate(llm, question: str, context_excerpt: str, answer: str) -> dict:
@@ -33,7 +34,7 @@ def _self_evaluate(llm, question: str, context_excerpt: str, answer: str) -> dic
 {{"accuracy": <整数>, "completeness": <整数>}}"""
 
     try:
-        response = llm.invoke([{"role": "user", "content": eval_prompt}]).content
+        response = llm_invoke(llm, [{"role": "user", "content": eval_prompt}], priority=PRIORITY_EVAL).content
         match = re.search(r'\{[^}]+\}', response)
         if match:
             data = json.loads(match.group())
@@ -69,9 +70,11 @@ def summarize_context(llm, context: str, question: str) -> str:
 
 [要点抽出(箇条書き)]
 """
-    context_slim = llm.invoke(
+    context_slim = llm_invoke(
+        llm,
         [{"role": "system", "content": "あなたは情報を簡潔にまとめる専門家です。"},
-         {"role": "user", "content": summary_prompt}]
+         {"role": "user", "content": summary_prompt}],
+        priority=PRIORITY_ANSWER,
     ).content
     return context_slim
 
@@ -153,9 +156,11 @@ def agent_answer(
 [回答]
 """
     total_tokens += _tok(SYSTEM_PROMPT) + _tok(base_prompt)
-    answer = llm.invoke(
+    answer = llm_invoke(
+        llm,
         [{"role": "system", "content": SYSTEM_PROMPT},
-         {"role": "user", "content": base_prompt}]
+         {"role": "user", "content": base_prompt}],
+        priority=PRIORITY_ANSWER,
     ).content
     total_tokens += _tok(answer)
     elapsed = time.time() - step_start
@@ -183,9 +188,11 @@ def agent_answer(
 [改善後の回答]
 """
         total_tokens += _tok(SYSTEM_PROMPT) + _tok(unified_prompt)
-        answer = llm.invoke(
+        answer = llm_invoke(
+            llm,
             [{"role": "system", "content": SYSTEM_PROMPT},
-             {"role": "user", "content": unified_prompt}]
+             {"role": "user", "content": unified_prompt}],
+            priority=PRIORITY_ANSWER,
         ).content
         total_tokens += _tok(answer)
         elapsed = time.time() - step_start
@@ -0,0 +1,200 @@
+"""
+構造を考慮したトークン単位のチャンク分割と、親チャンクへの展開。
+
+文書（markdown の見出しセクション・PDF のページ）を「。」などの文末・改行・見出しの境界で
+文単位に区切り、トークン数の上限まで詰めて2段階のチャンクを作る。
+
+- 親チャンク : PARENT_CHUNK_TOKENS まで。見出しの行で必ず区切る
+- 子チャンク : 親チャンクをさらに CHUNK_TOKENS まで詰め直したもの。Embedding・BM25 の対象
+
+インデックスに入れるのは子チャンクだけで、metadata の parent_id・chunk_index で親に
+ひも付ける。子チャンクは重なりなしで親を分割しているため、親の本文は兄弟の子チャンクを
+chunk_index 順に連結すれば復元できる（親を別に保存しない）。
+
+検索では小さな子チャンクで的を絞り、同じ親の子チャンクが PARENT_EXPAND_MIN_HITS 件以上
+ヒットしたときだけ親チャンクに広げる（expand_to_parents）。1件だけのヒットは子チャンクのまま
+LLM に渡すため、コンテキストが短くなる。
+
+トークン数は tiktoken（MODEL_NAME の語彙）で数える。語彙を読み込めない環境（オフライン）では
+文字数で近似する（日本語は概ね1文字1トークン以下のため、上限を超えない側の近似になる）。
+"""
+import re
+import uuid
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from .config import CHUNK_TOKENS, CHUNKER, MODEL_NAME, PARENT_CHUNK_TOKENS, PARENT_EXPAND_MIN_HITS
+
+# 文の終わり（句点・感嘆符・疑問符とそれに続く閉じ括弧）と改行
+_SENTENCE_END = re.compile(r"[。！？!?]+[」』）)]*|\n+")
+# markdown の見出し行（ここで必ずチャンクを区切る）
+_HEADING_LINE = re.compile(r"^#{1,6}\s")
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.encoding_for_model(MODEL_NAME)
+        except Exception as e:
+            print(f"[chunking] tiktoken の語彙を読み込めないため文字数でトークン数を近似します: {type(e).__name__}")
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_sentences(text: str) -> list[str]:
+    """文単位に区切る（区切り文字・改行は直前の文に含める。連結すると元の text に戻る）。"""
+    units = []
+    start = 0
+    for m in _SENTENCE_END.finditer(text):
+        units.append(text[start:m.end()])
+        start = m.end()
+    if start < len(text):
+        units.append(text[start:])
+    return units
+
+
+def _hard_split(unit: str, tokens: int, max_tokens: int) -> list[str]:
+    """上限を超える1文を、文字数でほぼ等分する（句点の無い長い行など）。"""
+    parts = -(-tokens // max_tokens)
+    size = -(-len(unit) // parts)
+    return [unit[i:i + size] for i in range(0, len(unit), size)]
+
+
+def pack_sentences(units: list[str], max_tokens: int) -> list[list[str]]:
+    """
+    文を順に詰めてグループにする。見出しの行では必ず区切る。
+
+    全体が max_tokens に収まらない場合は、必要なグループ数で等分した大きさに達した時点で
+    区切る（末尾に数語だけの小さなチャンクが残らないようにする）。
+    """
+    counts = [count_tokens(unit) for unit in units]
+    total = sum(counts)
+    target = total / -(-total // max_tokens) if total > max_tokens else max_tokens
+
+    groups: list[list[str]] = []
+    current: list[str] = []
+    current_tokens = 0
+    for unit, tokens in zip(units, counts):
+        full = current_tokens + tokens > max_tokens or current_tokens >= target
+        if current and (full or _HEADING_LINE.match(unit)):
+            groups.append(current)
+            current, current_tokens = [], 0
+        if tokens > max_tokens:
+            pieces = _hard_split(unit, tokens, max_tokens)
+            groups.extend([piece] for piece in pieces[:-1])
+            current, current_tokens = [pieces[-1]], count_tokens(pieces[-1])
+            continue
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def split_documents(
+    docs: list[Document],
+    method: str = CHUNKER,
+    chunk_tokens: int = CHUNK_TOKENS,
+    parent_tokens: int = PARENT_CHUNK_TOKENS,
+) -> list[Document]:
+    """
+    文書をチャンクに分割する。
+
+    method="token" なら親子チャンク（子チャンクを返す。metadata に parent_id / chunk_index /
+    parent_chunks / tokens）、"char" なら従来の 1000 文字・重なり 100 文字の分割。
+    """
+    if method == "char":
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=100,
+        )
+        return splitter.split_documents(docs)
+
+    chunks = []
+    for doc in docs:
+        for parent in pack_sentences(split_sentences(doc.page_content), parent_tokens):
+            children = [c for c in ("".join(g) for g in pack_sentences(parent, chunk_tokens)) if c.strip()]
+            parent_id = uuid.uuid4().hex
+            for i, text in enumerate(children):
+                chunks.append(Document(
+                    page_content=text,
+                    metadata={
+                        **doc.metadata,
+                        "parent_id": parent_id,
+                        "chunk_index": i,
+                        "parent_chunks": len(children),
+                        "tokens": count_tokens(text),
+                    },
+                ))
+    return chunks
+
+
+def _parent_text(db, parent_id: str) -> str | None:
+    """兄弟の子チャンクを chunk_index 順に連結して親チャンクの本文を復元する。"""
+    from .vectorstore import _get_shared_index
+
+    shared = _get_shared_index(db)
+    if shared is not None:
+        rows = shared.parent_rows(parent_id)
+        return "".join(shared.text(row) for row in rows) if rows else None
+
+    data = db.get(where={"parent_id": parent_id}, include=["documents", "metadatas"])
+    siblings = sorted(
+        zip(data.get("metadatas") or [], data.get("documents") or []),
+        key=lambda pair: (pair[0] or {}).get("chunk_index", 0),
+    )
+    return "".join(text for _, text in siblings) or None
+
+
+def expand_to_parents(
+    db,
+    results: list[tuple[Document, float]],
+    min_hits: int = PARENT_EXPAND_MIN_HITS,
+) -> list[tuple[Document, float]]:
+    """
+    同じ親の子チャンクが min_hits 件以上ある場合に、それらを親チャンク1件にまとめる。
+
+    親チャンクは最初にヒットした子チャンクの位置に置き、距離は兄弟の最小値を使う。
+    それ以外の結果は子チャンクのまま返す。min_hits が 0 以下なら何もしない。
+    """
+    if min_hits <= 0:
+        return results
+
+    hits: dict[str, list[float]] = {}
+    for doc, score in results:
+        parent_id = doc.metadata.get("parent_id")
+        if parent_id and doc.metadata.get("parent_chunks", 1) > 1:
+            hits.setdefault(parent_id, []).append(score)
+
+    expanded = []
+    done = set()
+    for doc, score in results:
+        parent_id = doc.metadata.get("parent_id")
+        if parent_id not in hits or len(hits[parent_id]) < min_hits:
+            expanded.append((doc, score))
+            continue
+        if parent_id in done:
+            continue
+        done.add(parent_id)
+        text = _parent_text(db, parent_id)
+        if text is None:
+            expanded.append((doc, score))
+            continue
+        metadata = {k: v for k, v in doc.metadata.items() if k not in ("chunk_index", "tokens")}
+        metadata["expanded_chunks"] = len(hits[parent_id])
+        expanded.append((Document(page_content=text, metadata=metadata), min(hits[parent_id])))
+    return expanded
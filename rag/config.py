@@ -1,8 +1,52 @@
 # ------------------------------------------------------------
 # 設定値をここに集約（提出向け）
 # ------------------------------------------------------------
+import os
+
 MODEL_NAME = "gpt-4o-mini"
 TEMPERATURE = 0.0
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# バックエンド切り替え（"openai" | "stub"）
+# stub はネットワーク・APIキー不要の決定的な代替実装（負荷試験・ベンチマーク用）
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", LLM_BACKEND)
+STUB_LLM_LATENCY_MS = float(os.getenv("STUB_LLM_LATENCY_MS", "0"))   # stub LLM の1呼び出しあたりの疑似遅延
+STUB_EMBEDDING_DIM = 256                                              # stub Embedding の次元数
+
+# ベクトル検索のバックエンド（"chroma" | "numpy" | "ivf"）
+# numpy は storage/index の Embedding 行列を mmap して全件を内積で採点する（build_index.py の出力が必要）
+# ivf は同じ行列を IVF インデックスで近似検索する（大規模なナレッジベース向け）
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# IVF（k-means 粗量子化）インデックス設定（VECTOR_BACKEND=ivf）
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))     # リスト数（0 は √n × 4 を自動設定）。build_index.py 実行時に使う
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))  # 検索時に調べるリスト数（大きいほど recall↑・レイテンシ↑）
+
+# NumPy バックエンドの一次検索に使う量子化 Embedding（"none" | "int8" | "binary"）
+# 量子化ベクトルで上位 k × VECTOR_RESCORE_FACTOR 件に絞り、その行だけ float32 で採点し直す
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+# ハイブリッド検索でベクトル検索の順位を付ける件数（量子化・IVF 使用時）。これより下の行は RRF で順位 n 扱い
+HYBRID_VECTOR_DEPTH = int(os.getenv("HYBRID_VECTOR_DEPTH", "50"))
+# カテゴリ未指定時に各カテゴリのパーティションを並列に採点するスレッド数（1 で逐次）
+PARTITION_FANOUT_WORKERS = int(os.getenv("PARTITION_FANOUT_WORKERS", "4"))
+
+# 取り込む文書の形式（"auto" | "pdf"）。auto は同名の .md があれば PDF の代わりに markdown を見出し単位で取り込む
+INGEST_FORMAT = os.getenv("INGEST_FORMAT", "auto")
+
+# チャンク分割設定（rag.chunking）
+# "token": 文末（。）・改行・見出しの境界でトークン数の上限まで詰める親子チャンク | "char": 従来の 1000 文字分割
+CHUNKER = os.getenv("CHUNKER", "token")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))                 # 検索対象の子チャンクの最大トークン数
+PARENT_CHUNK_TOKENS = int(os.getenv("PARENT_CHUNK_TOKENS", "1024"))  # 親チャンクの最大トークン数（見出しで必ず区切る）
+PARENT_EXPAND_MIN_HITS = int(os.getenv("PARENT_EXPAND_MIN_HITS", "2"))  # 同じ親の子がこの件数以上ヒットしたら親に広げる（0 で無効）
+
+# インデックスのバージョン管理（storage/versions/<バージョン>。rag.index_versions）
+INDEX_KEEP_VERSIONS = max(2, int(os.getenv("INDEX_KEEP_VERSIONS", "3")))     # 公開中を含めて残すバージョン数
+INDEX_CHECK_INTERVAL = float(os.getenv("INDEX_CHECK_INTERVAL", "5"))          # API が storage/CURRENT の変化を確認する間隔（秒、0 で確認しない）
+INDEX_WARMUP_QUERIES = ["解約 方法", "返金 条件", "請求 支払い", "ログイン できない"]  # 切り替え前に新しいインデックスで流す検索
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "2"))          # build_index.py --watch が data/ を確認する間隔（秒）
+INDEX_WATCH_DEBOUNCE = float(os.getenv("INDEX_WATCH_DEBOUNCE", "5"))          # 最後の変更からこの秒数だけ変化が無ければ再インデックスする
 
 # 検索設定
 TOP_K = 8
@@ -10,6 +54,22 @@ RETRIEVER_K = 8
 RETRIEVER_K_DEFAULT = 4
 WEAK_SCORE_THRESHOLD = 1.5  # スコアがこれ以上なら補助質問を出す（距離ベース: 大きいほど無関係）
 
+# リランキング設定（RRF 統合後の候補を語の網羅率・近接度・カテゴリで並べ替える。rag.rerank）
+# TOP_K 件を検索して並べ替え、上位 RERANK_TOP_N 件だけを LLM に渡す（0 で無効 = TOP_K 件をそのまま渡す）
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "0"))
+RERANK_WEIGHTS = {"fusion": 1.0, "coverage": 1.0, "proximity": 0.5, "category": 0.3}
+
+# 検索結果キャッシュ（(リライト後のクエリ, カテゴリ, k) → チャンクID・距離。rag.retrieval_cache）
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))   # 保持する件数（0 で無効）
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))    # 有効期間（秒）
+
+# FAQ 高速応答（rag.faq）。解約・返金・請求・ログインの短く一般的な質問には、インデックスの
+# バージョンごとに事前生成した回答を LLM を呼ばずに返す
+FAQ_ENABLED = os.getenv("FAQ_ENABLED", "true").lower() == "true"
+FAQ_ANSWER_MODE = os.getenv("FAQ_ANSWER_MODE", "extractive")  # "extractive"（資料の検索本文をそのまま使う）| "llm"（build_index.py 実行時に生成）
+FAQ_MAX_QUESTION_CHARS = 40  # これより長い質問は個別の事情を含むとみなして通常の RAG に回す
+FAQ_CITATIONS = 2            # 意図ごとに回答・根拠に使うセクション数
+
 # スコア変換設定
 # "similarity": スコアが0〜1で大きいほど良い場合（類似度）
 # "distance": スコアが0に近いほど良い場合（距離）
@@ -18,3 +78,22 @@ SHOW_RAW_SCORE = False   # raw値を併記するかどうか
 
 # Agent設定
 AGENT_ROUNDS = 0  # 速度優先: 改善ラウンドを無効化
+
+# モード整形設定
+FORMAT_CACHE_SIZE = 256  # 整形結果を保持する件数（回答ハッシュ×モード）
+FORMAT_PREFETCH = True   # 回答生成後にコール/チャット両モードを先読み整形する
+
+# LLMゲートウェイ設定（同時実行数・レート制限。環境変数で上書き可能）
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))   # プロセス全体で同時に投げるLLM呼び出し数
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "500"))             # 1分あたりのリクエスト数上限
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "200000"))          # 1分あたりのトークン数上限
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))    # 待ち行列でこれ以上待たされたら諦める（秒）
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))           # 429 時の再試行回数
+LLM_OUTPUT_TOKENS_ESTIMATE = 500  # レート計算用の出力トークン見積もり
+# 先読み整形など誰も待っていない投機的な呼び出しに残しておく枠の割合。投機的な呼び出しは
+# RPM / TPM・同時実行数のうちこの割合を超える余裕があるときだけ実行し、残りを同期処理のために空けておく
+LLM_SPECULATIVE_RESERVE = float(os.getenv("LLM_SPECULATIVE_RESERVE", "0.5"))
+
+# API サーバーのワーカープロセス数（start.sh の uvicorn --workers と同じ値）
+# LLM の RPM / TPM 上限はワーカー間で等分して各プロセスのゲートウェイに割り当てる
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
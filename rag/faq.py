@@ -0,0 +1,272 @@
+"""
+よくある意図（解約・返金・請求・ログイン）の事前生成回答と、LLM を呼ばない意図判定。
+
+問い合わせの大半は _build_followup_questions の選択肢にある少数の意図に集中するため、
+意図ごとの回答と根拠をインデックスのバージョンごとに作っておき（faq.json）、
+短く一般的な質問はキーワードだけで意図を判定してそのまま返す。
+
+- 作成: build_index.py が新しいバージョンを公開する前に build_faq で作り、バージョンの
+        ディレクトリに faq.json として保存する（--watch の差分更新でも作り直す）。
+        faq.json が無いバージョン（旧レイアウト・以前のビルド）は API が開くときに作る
+- 回答: FAQ_ANSWER_MODE="extractive" は根拠セクションの「検索本文」をそのまま使う（LLM 不要）。
+        "llm" は作成時に agent_answer で生成する（配信時は LLM を呼ばない）
+- 判定: 正規化した質問が意図の必須語をすべて含み、除外語・数字（日付や金額など個別の事情）を
+        含まず、FAQ_MAX_QUESTION_CHARS 文字以内のときだけ一致とする。迷う質問は通常の RAG に回す
+"""
+import json
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+from .chunking import _parent_text, expand_to_parents
+from .config import FAQ_ANSWER_MODE, FAQ_CITATIONS, FAQ_MAX_QUESTION_CHARS, TOP_K
+from .rerank import rerank
+from .vectorstore import hybrid_retrieve_with_score
+
+FAQ_NAME = "faq.json"
+
+# 根拠チャンクのうち回答に使う本文（markdown の **検索本文** / PDF の「検索本文」の次の段落）
+_ANSWER_BODY = re.compile(r"検索本文\**\s*\n(.+?)(?:\n\s*\n|\n\**key_facts|\Z)", re.DOTALL)
+_HEADING_LINE = re.compile(r"^#{1,6}\s.*$", re.MULTILINE)
+_DIGITS = re.compile(r"\d")
+
+
+@dataclass(frozen=True)
+class Intent:
+    """
+    意図の定義。required の各グループから1語ずつ含む質問を、この意図とみなす。
+
+    query / category は回答を作るときの検索条件、question は LLM で回答を作るときの代表質問。
+    sections は根拠にする資料の項目ID（検索結果にあればそれだけを使い、無ければ検索順で選ぶ）。
+    """
+    id: str
+    question: str
+    query: str
+    category: str
+    required: tuple[tuple[str, ...], ...]
+    exclude: tuple[str, ...] = ()
+    sections: tuple[str, ...] = ()
+
+
+# 判定は上から順に行う（具体的な意図を先に置く）
+INTENTS: tuple[Intent, ...] = (
+    Intent(
+        id="cancel_timing",
+        question="解約はいつ有効になりますか？",
+        query="解約 適用 タイミング",
+        category="unknown",
+        required=(("解約",), ("いつ", "タイミング", "有効", "いつまで")),
+        exclude=("トライアル", "返金", "データ"),
+        sections=("cancel-002",),
+    ),
+    Intent(
+        id="cancel_method",
+        question="解約の方法を教えてください。",
+        query="解約 方法 手続き",
+        category="unknown",
+        required=(("解約",), ("方法", "手続", "やり方", "どうやって", "どうすれば", "どこから", "したい")),
+        exclude=("トライアル", "返金", "データ"),
+        sections=("cancel-001", "cancel-006"),
+    ),
+    Intent(
+        id="refund_policy",
+        question="返金はできますか？",
+        query="返金 ポリシー 条件",
+        category="unknown",
+        required=(("返金",), ("できます", "できる", "可能", "条件", "ポリシー", "について", "したい", "もらえ", "ほしい", "欲しい", "して")),
+        exclude=("二重", "障害"),
+        sections=("cancel-004",),
+    ),
+    Intent(
+        id="billing_payment",
+        question="支払い方法を教えてください。",
+        query="請求 支払い 方法",
+        category="service",
+        required=(("支払", "請求"), ("方法", "手段", "について", "どうやって", "何が使え")),
+        exclude=("誤請求", "二重", "変更", "領収書"),
+        sections=("billing-003", "billing-004"),
+    ),
+    Intent(
+        id="login_trouble",
+        question="ログインできない場合はどうすればよいですか？",
+        query="ログイン できない 対処",
+        category="unknown",
+        required=(("ログイン",), ("できない", "できません", "入れない", "失敗", "エラー")),
+        exclude=("二段階", "sso"),
+        sections=("tech-001",),
+    ),
+)
+
+
+def _normalize(question: str) -> str:
+    q = unicodedata.normalize("NFKC", question).lower()
+    return re.sub(r"\s+", "", q).rstrip("?!.。、")
+
+
+def match_intent(question: str, intents: tuple[Intent, ...] = INTENTS) -> Intent | None:
+    """質問がよくある意図のどれかにそのまま当てはまれば返す（LLM は呼ばない）。"""
+    q = _normalize(question)
+    if not q or len(q) > FAQ_MAX_QUESTION_CHARS or _DIGITS.search(q):
+        return None
+    for intent in intents:
+        if any(word in q for word in intent.exclude):
+            continue
+        if all(any(word in q for word in group) for group in intent.required):
+            return intent
+    return None
+
+
+def _section_id(doc: Document) -> str:
+    return (doc.metadata.get("section") or "").split("|", 1)[0]
+
+
+def _answer_body(db, doc: Document) -> str | None:
+    """
+    根拠チャンクから回答に使う検索本文を取り出す。子チャンクに無ければ親チャンクから探す。
+    どちらにも無ければ None。
+    """
+    m = _ANSWER_BODY.search(doc.page_content)
+    if m is None and doc.metadata.get("parent_id"):
+        m = _ANSWER_BODY.search(_parent_text(db, doc.metadata["parent_id"]) or "")
+    if m is None:
+        return None
+    return " ".join(line.strip() for line in m.group(1).splitlines() if line.strip())
+
+
+def _citation(doc: Document, score: float) -> dict:
+    text = doc.page_content.strip().replace("\n", " ")
+    page = doc.metadata.get("page", None)
+    return {
+        "category": doc.metadata.get("category", "unknown"),
+        "source": doc.metadata.get("source", ""),
+        "page": (page + 1) if isinstance(page, int) else None,
+        "section": doc.metadata.get("section") or None,
+        "quote": text[:400] + ("..." if len(text) > 400 else ""),
+        "score": float(score),
+    }
+
+
+def _build_entry(db, intent: Intent, mode: str, llm) -> dict | None:
+    results = hybrid_retrieve_with_score(db, intent.query, k=TOP_K, category=intent.category)
+    if not results:
+        return None
+    best_score = min(score for _, score in results)
+    results = expand_to_parents(db, rerank(db, intent.query, results, top_n=TOP_K))
+
+    preferred = [(doc, score) for doc, score in results if _section_id(doc) in intent.sections]
+    if preferred:
+        results = preferred
+
+    # 先頭と同じ資料カテゴリの、別々のセクションだけを根拠にする
+    top_category = results[0][0].metadata.get("category", "unknown")
+    cited: list[tuple[Document, float]] = []
+    seen = set()
+    for doc, score in results:
+        key = doc.metadata.get("section") or doc.metadata.get("parent_id") or doc.page_content[:80]
+        if doc.metadata.get("category", "unknown") != top_category or key in seen:
+            continue
+        seen.add(key)
+        cited.append((doc, score))
+        if len(cited) >= FAQ_CITATIONS:
+            break
+
+    if mode == "llm":
+        from .agent import agent_answer
+
+        context = "\n\n---\n\n".join(doc.page_content for doc, _ in cited)
+        result = agent_answer(llm, intent.question, context, rounds=0)
+        answer, accuracy, completeness = result["answer"], result["accuracy"], result["completeness"]
+    else:
+        # 資料の本文をそのまま使うため、根拠との食い違いは起きない
+        bodies = [body for body in (_answer_body(db, doc) for doc, _ in cited) if body]
+        if not bodies:
+            text = _HEADING_LINE.sub("", cited[0][0].page_content).strip()
+            bodies = [text[:400]]
+        answer = "\n\n".join(dict.fromkeys(bodies))
+        accuracy = completeness = None  # 自己評価をしていないため、スコアは付けない
+
+    return {
+        "intent": intent.id,
+        "question": intent.question,
+        "answer": answer,
+        "category": top_category,
+        "best_score": float(best_score),
+        "accuracy": accuracy,
+        "completeness": completeness,
+        "citations": [_citation(doc, score) for doc, score in cited],
+    }
+
+
+def build_faq(db, mode: str = FAQ_ANSWER_MODE, llm=None, intents: tuple[Intent, ...] = INTENTS) -> dict:
+    """開いたインデックス db から、意図ごとの回答・根拠を作る（faq.json の中身）。"""
+    if mode == "llm" and llm is None:
+        from .providers import create_llm
+
+        llm = create_llm()
+    entries = {}
+    for intent in intents:
+        entry = _build_entry(db, intent, mode, llm)
+        if entry is not None:
+            entries[intent.id] = entry
+    return {"mode": mode, "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"), "entries": entries}
+
+
+def write_faq(path: Path, faq: dict) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(faq, f, ensure_ascii=False, indent=1)
+
+
+class FAQStore:
+    """1バージョン分の事前生成回答。match() で質問に当てはまる回答を返す。"""
+
+    def __init__(self, faq: dict, source: str):
+        self.entries: dict[str, dict] = faq.get("entries", {})
+        self.mode = faq.get("mode", "")
+        if self.mode == "extractive":
+            # 以前の faq.json には自己評価なしで 100 を入れていたため、読み込み時に取り除く
+            for entry in self.entries.values():
+                entry["accuracy"] = entry["completeness"] = None
+        self.generated_at = faq.get("generated_at", "")
+        self.source = source  # "file"（build_index.py が作成）| "built"（API が開くときに作成）
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+        self._by_intent: dict[str, int] = {}
+
+    @classmethod
+    def open(cls, path: Path, db) -> "FAQStore":
+        """path の faq.json を読む。無ければ db から（LLM を使わずに）作る。"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(json.load(f), "file")
+        except (OSError, ValueError):
+            return cls(build_faq(db, mode="extractive"), "built")
+
+    def match(self, question: str) -> dict | None:
+        intent = match_intent(question)
+        entry = self.entries.get(intent.id) if intent is not None else None
+        with self._lock:
+            if entry is None:
+                self._counters["misses"] += 1
+            else:
+                self._counters["hits"] += 1
+                self._by_intent[entry["intent"]] = self._by_intent.get(entry["intent"], 0) + 1
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._counters["hits"]
+            total = hits + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+                "by_intent": dict(self._by_intent),
+                "intents": sorted(self.entries),
+                "mode": self.mode,
+                "source": self.source,
+                "generated_at": self.generated_at,
+            }
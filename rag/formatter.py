@@ -0,0 +1,127 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .config import FORMAT_CACHE_SIZE
+from .llm_gateway import llm_invoke, LLMCancelledError, PRIORITY_FORMAT, PRIORITY_PREFETCH
+from .prompts import get_mode_prompt
+
+MODES = ("call", "chat")
+
+
+def _format(llm, mode: str, answer: str, priority: int = PRIORITY_FORMAT, cancelled=None) -> str:
+    prompt = get_mode_prompt(mode, answer)
+    return llm_invoke(llm, [{"role": "user", "content": prompt}], priority=priority, cancelled=cancelled).content
+
+
+class _OnStart:
+    """LLM の invoke 直前（ゲートウェイの待ち行列を抜けた時点）に on_start を呼ぶラッパー。"""
+
+    def __init__(self, llm, on_start):
+        self._llm = llm
+        self._on_start = on_start
+
+    def invoke(self, messages):
+        self._on_start()
+        return self._llm.invoke(messages)
+
+
+class FormatCache:
+    """
+    コール/チャットモードの整形結果を (回答ハッシュ, モード) 単位で保持するLRUキャッシュ。
+
+    値には Future を格納するため、先読み中のエントリに対する要求は
+    LLMを重複して呼ばずに先読みの完了を待つ。ただし先読みは最も低い優先度で実行するため、
+    まだゲートウェイの待ち行列にいる先読みは取り消し、要求した側が PRIORITY_FORMAT で整形する。
+    """
+
+    def __init__(self, maxsize: int = FORMAT_CACHE_SIZE, workers: int = 4):
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[tuple[str, str], Future]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 先読み中のキー → {"started": LLM 呼び出しを開始したか, "cancelled": 要求側に引き継いだか}
+        self._prefetching: dict[tuple[str, str], dict] = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="format-prefetch")
+
+    @staticmethod
+    def _key(answer: str, mode: str) -> tuple[str, str]:
+        return hashlib.sha256(answer.strip().encode("utf-8")).hexdigest(), mode
+
+    def _reserve(self, key: tuple[str, str], prefetch_state: dict | None = None) -> tuple[Future, bool]:
+        """既存の Future を返すか、新しい Future を登録する（prefetch_state があれば先読み中として記録）。戻り値2つ目は既存かどうか。"""
+        with self._lock:
+            fut = self._entries.get(key)
+            if fut is not None:
+                self._entries.move_to_end(key)
+                return fut, True
+            fut = Future()
+            self._entries[key] = fut
+            if prefetch_state is not None:
+                self._prefetching[key] = prefetch_state
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+            return fut, False
+
+    def _fill(self, key: tuple[str, str], fut: Future, llm, mode: str, answer: str) -> None:
+        try:
+            fut.set_result(_format(llm, mode, answer))
+        except Exception as e:
+            self._discard(key, fut, e)
+
+    def _discard(self, key: tuple[str, str], fut: Future, e: Exception) -> None:
+        # 失敗結果はキャッシュしない（次回の要求で再実行する）
+        with self._lock:
+            if self._entries.get(key) is fut:
+                del self._entries[key]
+        fut.set_exception(e)
+
+    def _prefetch_fill(self, key: tuple[str, str], fut: Future, state: dict, llm, mode: str, answer: str) -> None:
+        def _start():
+            with self._lock:
+                if state["cancelled"]:
+                    raise LLMCancelledError("先読みは要求側に引き継がれました")
+                state["started"] = True
+
+        try:
+            text = _format(_OnStart(llm, _start), mode, answer,
+                           priority=PRIORITY_PREFETCH, cancelled=lambda: state["cancelled"])
+        except Exception as e:
+            with self._lock:
+                self._prefetching.pop(key, None)
+                cancelled = state["cancelled"]
+            if not cancelled:  # 引き継いだ場合は要求側が Future を埋める
+                self._discard(key, fut, e)
+            return
+        with self._lock:
+            self._prefetching.pop(key, None)
+        fut.set_result(text)
+
+    def get(self, llm, answer: str, mode: str) -> tuple[str, bool]:
+        """
+        整形済みテキストを返す。未整形ならこの場で整形する。
+
+        Returns:
+            (整形済みテキスト, キャッシュ・先読みから返したか)
+        """
+        key = self._key(answer, mode)
+        fut, existed = self._reserve(key)
+        if existed:
+            with self._lock:
+                state = self._prefetching.get(key)
+                if state is not None and not state["started"]:
+                    # 先読みがまだ待ち行列にいる: 取り消してこの要求の優先度で整形する
+                    state["cancelled"] = True
+                    existed = False
+        if not existed:
+            self._fill(key, fut, llm, mode, answer)
+        return fut.result(), existed
+
+    def prefetch(self, llm, answer: str) -> None:
+        """全モードの整形をバックグラウンドで開始する（既に登録済みのモードは除く）。"""
+        for mode in MODES:
+            key = self._key(answer, mode)
+            state = {"started": False, "cancelled": False}
+            fut, existed = self._reserve(key, prefetch_state=state)
+            if not existed:
+                self._executor.submit(self._prefetch_fill, key, fut, state, llm, mode, answer)
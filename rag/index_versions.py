@@ -0,0 +1,137 @@
+"""
+インデックスのバージョン管理（storage/ 配下）。
+
+    storage/
+      CURRENT               # 公開中のバージョン名（1行。os.replace で原子的に書き換える）
+      versions/<バージョン>/
+        chroma/             # Chroma の永続化ディレクトリ
+        index/              # 共有インデックス（rag.shared_index）
+        sources.json        # 取り込んだ元文書の一覧（data/ からの相対パス → 更新時刻・サイズ・SHA-256）
+      chroma/, index/       # 旧レイアウト（CURRENT が無い場合はこちらを使う）
+
+build_index.py は新しい versions/<バージョン>/ に書き出し、共有インデックスの manifest.json
+（最後に原子的に置かれる）ができた時点でそのバージョンを完成とみなして CURRENT を差し替える。
+公開したバージョンのディレクトリは以後書き換えないため、古いバージョンを開いている
+ワーカーと新しいバージョンの書き込みが競合しない。API の各ワーカーは CURRENT の変化を検知して
+新しいバージョンに切り替える（api/index_manager.py）。
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+from .shared_index import MANIFEST_NAME
+
+CURRENT_NAME = "CURRENT"
+VERSIONS_DIR = "versions"
+LEGACY_VERSION = "legacy"
+SOURCES_NAME = "sources.json"
+
+
+def current_version(storage_dir: Path) -> str | None:
+    """公開中のバージョン名。CURRENT が無ければ None（旧レイアウト）。"""
+    try:
+        version = (Path(storage_dir) / CURRENT_NAME).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    return version or None
+
+
+def version_dirs(storage_dir: Path, version: str | None) -> tuple[Path, Path]:
+    """バージョンの (Chroma の永続化ディレクトリ, 共有インデックスのディレクトリ)。"""
+    storage_dir = Path(storage_dir)
+    if version is None or version == LEGACY_VERSION:
+        return storage_dir / "chroma", storage_dir / "index"
+    base = storage_dir / VERSIONS_DIR / version
+    return base / "chroma", base / "index"
+
+
+def resolve_index_dirs(storage_dir: Path) -> tuple[Path, Path]:
+    """公開中のバージョン（CURRENT が無ければ旧レイアウト）の (Chroma, 共有インデックス) のディレクトリ。"""
+    return version_dirs(storage_dir, current_version(storage_dir))
+
+
+def _all_versions(storage_dir: Path) -> list[str]:
+    root = Path(storage_dir) / VERSIONS_DIR
+    if not root.exists():
+        return []
+    return sorted(p.name for p in root.iterdir() if p.is_dir())
+
+
+def is_complete(storage_dir: Path, version: str) -> bool:
+    """共有インデックスの manifest.json まで書き出し済みか。"""
+    return (version_dirs(storage_dir, version)[1] / MANIFEST_NAME).exists()
+
+
+def list_versions(storage_dir: Path) -> list[str]:
+    """完成済みのバージョン名（古い順）。書き出し中・中断したものは含めない。"""
+    return [v for v in _all_versions(storage_dir) if is_complete(storage_dir, v)]
+
+
+def create_version(storage_dir: Path) -> tuple[str, Path]:
+    """新しいバージョン名と、その書き出し先（versions/<バージョン>）を作って返す。"""
+    root = Path(storage_dir) / VERSIONS_DIR
+    root.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    version = stamp
+    suffix = 1
+    while (root / version).exists():
+        suffix += 1
+        version = f"{stamp}_{suffix}"
+    (root / version).mkdir()
+    return version, root / version
+
+
+def read_sources(storage_dir: Path, version: str | None) -> dict[str, dict] | None:
+    """バージョンが取り込んだ元文書の一覧。記録が無い（旧レイアウト・以前のビルド）なら None。"""
+    if version is None or version == LEGACY_VERSION:
+        return None
+    path = Path(storage_dir) / VERSIONS_DIR / version / SOURCES_NAME
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_sources(version_dir: Path, sources: dict[str, dict]) -> None:
+    with open(Path(version_dir) / SOURCES_NAME, "w", encoding="utf-8") as f:
+        json.dump(sources, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def publish_version(storage_dir: Path, version: str) -> None:
+    """CURRENT を version に差し替える（一時ファイルに書いてから os.replace）。"""
+    storage_dir = Path(storage_dir)
+    if version != LEGACY_VERSION and version not in list_versions(storage_dir):
+        raise ValueError(f"存在しないバージョンです: {version}")
+    tmp_path = storage_dir / f"{CURRENT_NAME}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, storage_dir / CURRENT_NAME)
+
+
+def gc_versions(storage_dir: Path, keep: int, in_use: set[str] | None = None) -> list[str]:
+    """
+    公開中のバージョンより古いものを、新しい順に keep - 1 個だけ残して削除する。
+
+    公開中より古い未完成のディレクトリ（中断したビルド）も削除する。
+    公開中より新しいバージョン（書き出し中・公開前）と in_use（このプロセスで使用中）は削除しない。
+    他のワーカーが切り替え前の古いバージョンを開いている可能性があるため、keep は 2 以上にすること。
+    """
+    current = current_version(storage_dir)
+    versions = list_versions(storage_dir)
+    if current not in versions:
+        return []
+    older = versions[:versions.index(current)]
+    expired = older[:max(0, len(older) - (keep - 1))]
+    expired += [v for v in _all_versions(storage_dir) if v < current and not is_complete(storage_dir, v)]
+    removed = []
+    for version in expired:
+        if in_use and version in in_use:
+            continue
+        shutil.rmtree(Path(storage_dir) / VERSIONS_DIR / version, ignore_errors=True)
+        removed.append(version)
+    return removed
@@ -0,0 +1,132 @@
+"""
+k-means による粗量子化の転置ファイル（IVF）インデックス（NumPy のみ）。
+
+正規化済み Embedding を球面 k-means で nlist 個のクラスタ（リスト）に分け、
+検索時はクエリに近い重心 nprobe 個のリストに属する行だけを float32 で採点する。
+全件走査の代わりに約 nprobe / nlist の行だけを読むため、チャンク数が数万件を超える
+ナレッジベースでもレイテンシを抑えられる（代わりに recall が 1.0 を下回りうる）。
+
+追加の行は学習済みの重心に割り当てるだけで、再学習せずに挿入できる（add）。
+build_index.py の差分更新（--watch）は公開中のバージョンの重心に新しいバージョンの全行を
+割り当て直し（reassign）、リストの偏りが大きくなったときだけ k-means をやり直す（needs_retrain）。
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+def default_nlist(n: int) -> int:
+    """リスト数の目安（√n の4倍、1〜n に収める）。"""
+    return max(1, min(n, int(4 * np.sqrt(n))))
+
+
+def spherical_kmeans(
+    matrix: np.ndarray,
+    nlist: int,
+    iters: int = 20,
+    seed: int = 0,
+    sample: int = 100_000,
+) -> np.ndarray:
+    """コサイン類似度の k-means で重心（正規化済み、nlist × dim）を求める。"""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(matrix, dtype=np.float32)
+    if len(data) > sample:
+        data = data[rng.choice(len(data), size=sample, replace=False)]
+    nlist = min(nlist, len(data))
+    centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # 空のクラスタはランダムな点で置き直す
+            sums[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms == 0, 1.0, norms)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """重心と、リストごとに並べた行番号（CSR 形式）を持つ IVF インデックス。"""
+
+    def __init__(self, centroids: np.ndarray, rows: np.ndarray, indptr: np.ndarray, trained_sizes: list[int] | None = None):
+        self.centroids = centroids
+        self.rows = rows
+        self.indptr = indptr
+        self.trained_sizes = trained_sizes or np.diff(indptr).tolist()
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, nlist: int | None = None, iters: int = 20, seed: int = 0) -> "IVFIndex":
+        centroids = spherical_kmeans(matrix, nlist or default_nlist(len(matrix)), iters=iters, seed=seed)
+        index = cls(centroids, np.zeros(0, dtype=np.int64), np.zeros(len(centroids) + 1, dtype=np.int64))
+        index.add(matrix, first_row=0)
+        index.trained_sizes = np.diff(index.indptr).tolist()
+        return index
+
+    @classmethod
+    def reassign(cls, base: "IVFIndex", matrix: np.ndarray) -> "IVFIndex":
+        """base の重心を再学習せずに使い、matrix の全行を割り当てる（学習時のリストの大きさは引き継ぐ）。"""
+        index = cls(base.centroids, np.zeros(0, dtype=np.int64), np.zeros(base.nlist + 1, dtype=np.int64),
+                    trained_sizes=list(base.trained_sizes))
+        index.add(matrix, first_row=0)
+        return index
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(np.asarray(vectors, dtype=np.float32) @ self.centroids.T, axis=1)
+
+    def add(self, vectors: np.ndarray, first_row: int) -> None:
+        """行番号 first_row から始まる vectors を最寄りのリストに追加する（重心は更新しない）。"""
+        if len(vectors) == 0:
+            return
+        lists = np.concatenate([np.repeat(np.arange(self.nlist), np.diff(self.indptr)), self.assign(vectors)])
+        rows = np.concatenate([np.asarray(self.rows, dtype=np.int64), np.arange(first_row, first_row + len(vectors))])
+        order = np.lexsort((rows, lists))
+        self.rows = rows[order]
+        self.indptr = np.zeros(self.nlist + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum(np.bincount(lists, minlength=self.nlist))
+
+    def needs_retrain(self, growth: float = 2.0) -> bool:
+        """学習時よりいずれかのリストが growth 倍以上に膨らんでいたら再学習を勧める。"""
+        sizes = np.diff(self.indptr)
+        trained = np.maximum(np.asarray(self.trained_sizes), 1)
+        return bool((sizes > growth * trained).any())
+
+    def probe(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        """クエリに近い nprobe 個のリストに属する行番号（昇順）を返す。"""
+        nprobe = min(nprobe, self.nlist)
+        sims = self.centroids @ q
+        lists = np.argpartition(-sims, nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+        parts = [self.rows[self.indptr[i]:self.indptr[i + 1]] for i in lists]
+        rows = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        rows.sort()
+        return rows
+
+    def save(self, index_dir: Path) -> None:
+        index_dir = Path(index_dir)
+        np.save(index_dir / "ivf_centroids.npy", self.centroids)
+        np.save(index_dir / "ivf_rows.npy", np.asarray(self.rows, dtype=np.int64))
+        np.save(index_dir / "ivf_indptr.npy", self.indptr)
+        with open(index_dir / "ivf.json", "w", encoding="utf-8") as f:
+            json.dump({"nlist": self.nlist, "trained_sizes": list(map(int, self.trained_sizes))}, f)
+
+    @classmethod
+    def load(cls, index_dir: Path) -> "IVFIndex":
+        index_dir = Path(index_dir)
+        with open(index_dir / "ivf.json", encoding="utf-8") as f:
+            info = json.load(f)
+        return cls(
+            np.load(index_dir / "ivf_centroids.npy"),
+            np.load(index_dir / "ivf_rows.npy", mmap_mode="r"),
+            np.load(index_dir / "ivf_indptr.npy"),
+            trained_sizes=info.get("trained_sizes"),
+        )
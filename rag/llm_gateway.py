@@ -0,0 +1,219 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from .config import (
+    LLM_MAX_CONCURRENCY,
+    LLM_RPM_LIMIT,
+    LLM_TPM_LIMIT,
+    LLM_QUEUE_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_OUTPUT_TOKENS_ESTIMATE,
+    LLM_SPECULATIVE_RESERVE,
+    WEB_CONCURRENCY,
+)
+
+# 優先度（小さいほど先に実行される）
+PRIORITY_ANSWER = 0  # 回答生成・コンテキスト圧縮
+PRIORITY_QUERY = 1   # クエリリライト・カテゴリ推定
+PRIORITY_FORMAT = 2  # モード整形（/api/format の要求時）
+PRIORITY_EVAL = 3    # 自己評価
+PRIORITY_PREFETCH = 4  # 先読み整形（投機的な呼び出し。これ以上の値は同期処理の枠を食わない）
+
+
+class LLMBackpressureError(RuntimeError):
+    """待ち行列で LLM_QUEUE_TIMEOUT 秒以上待たされた場合に送出する。"""
+
+
+class LLMCancelledError(RuntimeError):
+    """待ち行列にいる間に呼び出し元が取り消した場合に送出する。"""
+
+
+class TokenBucket:
+    """1分あたりの上限 rate_per_minute で補充されるトークンバケット。"""
+
+    def __init__(self, rate_per_minute: int):
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self._rate = rate_per_minute / 60.0
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount を消費できるまでの待ち時間（秒）。バケット容量を超える要求は満杯で通す。"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self._rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+def _estimate_tokens(messages) -> int:
+    """入力トークン数を見積もる（日本語は概ね1文字1トークン以下のため文字数で近似）。"""
+    if isinstance(messages, str):
+        return len(messages)
+    total = 0
+    for m in messages:
+        content = m.get("content", "") if isinstance(m, dict) else getattr(m, "content", "")
+        total += len(str(content))
+    return total
+
+
+def _is_rate_limited(e: Exception) -> bool:
+    return getattr(e, "status_code", None) == 429 or type(e).__name__ == "RateLimitError"
+
+
+def _retry_after(e: Exception) -> float | None:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """
+    プロセス内の全LLM呼び出しを通す関所。
+
+    - 同時実行数を max_concurrency に制限する
+    - RPM / TPM のトークンバケットで送信ペースを抑える
+    - 待ち行列は優先度順（回答生成 > クエリ前処理 > 整形 > 自己評価 > 先読み）
+    - 先読みなどの投機的な呼び出しは、RPM / TPM・同時実行数に speculative_reserve の割合の
+      余裕が残るときだけ実行する（同期処理の予算を使い切らない）
+    - 429 はジッター付き指数バックオフで再試行する
+    - queue_timeout 秒以上待たされたら LLMBackpressureError で早めに諦める
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        rpm: int = LLM_RPM_LIMIT,
+        tpm: int = LLM_TPM_LIMIT,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        speculative_reserve: float = LLM_SPECULATIVE_RESERVE,
+    ):
+        self.max_concurrency = max_concurrency
+        self.speculative_reserve = min(max(speculative_reserve, 0.0), 1.0)
+        self._speculative_concurrency = max(1, int(max_concurrency * (1.0 - self.speculative_reserve)))
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self._rpm = TokenBucket(rpm)
+        self._tpm = TokenBucket(tpm)
+        self._cond = threading.Condition()
+        self._waiters: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._counters = {"calls": 0, "rate_limited": 0, "rejected": 0}
+        self._max_queue_wait = 0.0
+
+    def _acquire(self, priority: int, tokens: int, cancelled=None) -> None:
+        entry = (priority, next(self._seq))
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        speculative = priority >= PRIORITY_PREFETCH
+        max_active = self._speculative_concurrency if speculative else self.max_concurrency
+        # 投機的な呼び出しは、消費後もバケットに reserve の割合が残る場合だけ通す
+        rpm_need, tpm_need = 1, tokens
+        if speculative:
+            rpm_need += self._rpm.capacity * self.speculative_reserve
+            tpm_need += self._tpm.capacity * self.speculative_reserve
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            while True:
+                if cancelled is not None and cancelled():
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                    raise LLMCancelledError("LLM呼び出しは待ち行列で取り消されました")
+                remaining = deadline - time.monotonic()
+                timeout = remaining
+                # 先頭（最優先）の待ち手だけが枠とレートを確認する
+                if self._waiters[0] == entry and self._active < max_active:
+                    wait = max(self._rpm.wait_time(rpm_need), self._tpm.wait_time(tpm_need))
+                    if wait == 0.0:
+                        self._rpm.consume(1)
+                        self._tpm.consume(tokens)
+                        heapq.heappop(self._waiters)
+                        self._active += 1
+                        self._counters["calls"] += 1
+                        self._max_queue_wait = max(self._max_queue_wait, time.monotonic() - start)
+                        self._cond.notify_all()
+                        return
+                    timeout = min(wait, remaining)
+                if remaining <= 0:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._counters["rejected"] += 1
+                    self._cond.notify_all()
+                    raise LLMBackpressureError(
+                        f"LLM呼び出しの待ち時間が上限({self.queue_timeout:g}秒)を超えました"
+                    )
+                self._cond.wait(timeout)
+
+    def _release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def invoke(self, llm, messages, priority: int = PRIORITY_ANSWER, cancelled=None):
+        """
+        llm.invoke(messages) をゲートウェイ経由で実行する。
+
+        cancelled（引数なしで bool を返す関数）が真になると、待ち行列から抜けて LLMCancelledError を送出する。
+        """
+        tokens = _estimate_tokens(messages) + LLM_OUTPUT_TOKENS_ESTIMATE
+        for attempt in range(self.max_retries + 1):
+            self._acquire(priority, tokens, cancelled)
+            try:
+                return llm.invoke(messages)
+            except Exception as e:
+                if not _is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                delay = _retry_after(e) or min(30.0, 1.0 * (2 ** attempt))
+            finally:
+                self._release()
+            with self._cond:
+                self._counters["rate_limited"] += 1
+            print(f"[LLMGateway] 429 のため {delay:.1f}秒後に再試行します ({attempt + 1}/{self.max_retries})")
+            time.sleep(delay * random.uniform(0.5, 1.5))
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                **self._counters,
+                "active": self._active,
+                "queued": len(self._waiters),
+                "max_queue_wait_sec": round(self._max_queue_wait, 3),
+            }
+
+
+_gateway: LLMGateway | None = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                # レート上限はAPIキー単位なので、ワーカープロセス間で等分する
+                _gateway = LLMGateway(
+                    rpm=max(1, LLM_RPM_LIMIT // WEB_CONCURRENCY),
+                    tpm=max(1, LLM_TPM_LIMIT // WEB_CONCURRENCY),
+                )
+    return _gateway
+
+
+def llm_invoke(llm, messages, priority: int = PRIORITY_ANSWER, cancelled=None):
+    """プロセス共通のゲートウェイ経由で llm.invoke を呼ぶ。"""
+    return get_gateway().invoke(llm, messages, priority=priority, cancelled=cancelled)
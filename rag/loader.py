@@ -1,6 +1,13 @@
+import re
 from pathlib import Path
 
 from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+
+SOURCE_SUFFIXES = (".md", ".pdf")
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_RULE_OR_BLANK = re.compile(r"^\s*(?:-{3,}|\*{3,}|_{3,})?\s*$")
 
 
 def load_pdf_documents(pdf_root: Path):
@@ -25,3 +32,103 @@ def load_pdf_documents(pdf_root: Path):
         documents.extend(pages)
 
     return documents, pdf_files
+
+
+def select_source_files(data_dir: Path, fmt: str = "auto") -> list[Path]:
+    """
+    data_dir 配下の取り込み対象ファイル。
+
+    fmt="auto" なら同じ名前の .md と .pdf がある場合は .md を使う（PDF の解析より速く、見出しの構造が残る）。
+    fmt="pdf" なら PDF だけを使う。隠しファイル・Office の一時ファイルは除く。
+    """
+    suffixes = (".pdf",) if fmt == "pdf" else SOURCE_SUFFIXES
+    files = [
+        p for p in data_dir.rglob("*")
+        if p.suffix.lower() in suffixes and not p.name.startswith((".", "~$"))
+    ]
+    chosen: dict[Path, Path] = {}
+    for path in sorted(files, key=lambda p: suffixes.index(p.suffix.lower())):
+        chosen.setdefault(path.with_suffix(""), path)
+    return sorted(chosen.values())
+
+
+def split_markdown_sections(text: str) -> list[tuple[list[str], str]]:
+    """
+    markdown を見出しごとのセクションに分け、[(見出しの階層, 本文), ...] を返す。
+
+    本文はセクションの見出し行から次の見出しの直前まで（前後の区切り線・空行は除く）。
+    見出し・区切り線・引用しか無いセクション（カテゴリ名と編集メモだけの h1 など）は返さない。
+    コードブロック内の # は見出しとみなさない。
+    """
+    sections = []
+    stack: list[tuple[int, str]] = []
+    lines: list[str] = []
+    in_code = False
+
+    def flush():
+        body = list(lines)
+        while body and _RULE_OR_BLANK.match(body[-1]):
+            body.pop()
+        content = [
+            line for line in body
+            if not _RULE_OR_BLANK.match(line) and not _HEADING.match(line) and not line.lstrip().startswith(">")
+        ]
+        if content:
+            sections.append(([title for _, title in stack], "\n".join(body).strip()))
+
+    for line in text.splitlines():
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+        m = None if in_code else _HEADING.match(line)
+        if m:
+            flush()
+            level = len(m.group(1))
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            stack.append((level, m.group(2)))
+            lines = [line]
+        else:
+            lines.append(line)
+    flush()
+    return sections
+
+
+def source_path(path: Path, data_dir: Path) -> str:
+    """metadata["source"] に入れるパス。data_dir の親からの相対パス（例: data/service/解約.pdf）。"""
+    return path.relative_to(data_dir.parent).as_posix()
+
+
+def load_markdown_documents(paths: list[Path], data_dir: Path) -> list[Document]:
+    """
+    markdown を見出しのセクション単位で Document にする。
+
+    metadata: source（data_dir の親からの相対パス）、section（直近の見出し）、section_path（見出しの階層を " > " で連結）
+    """
+    documents = []
+    for path in paths:
+        for titles, body in split_markdown_sections(path.read_text(encoding="utf-8")):
+            documents.append(Document(
+                page_content=body,
+                metadata={
+                    "source": source_path(path, data_dir),
+                    "section": titles[-1] if titles else "",
+                    "section_path": " > ".join(titles),
+                },
+            ))
+    return documents
+
+
+def load_source_documents(paths: list[Path], data_dir: Path) -> list[Document]:
+    """
+    select_source_files(data_dir) で選んだファイルを読み込む（.md は見出し単位、.pdf はページ単位）。
+
+    metadata["source"] はどちらも data_dir の親からの相対パス（チェックアウト先のパスを含めない）。
+    """
+    documents = load_markdown_documents([p for p in paths if p.suffix.lower() == ".md"], data_dir)
+    for path in paths:
+        if path.suffix.lower() == ".pdf":
+            pages = PyPDFLoader(str(path)).load()
+            for page in pages:
+                page.metadata["source"] = source_path(path, data_dir)
+            documents.extend(pages)
+    return documents
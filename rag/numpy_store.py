@@ -0,0 +1,249 @@
+"""
+共有インデックス（storage/index）の Embedding 行列を使うインプロセスのベクトル検索。
+
+コーパスは数百チャンク程度なので、近似最近傍探索（Chroma の HNSW）を使わずとも
+正規化済み行列とクエリベクトルの内積1回 + argpartition で全件を厳密に採点できる。
+Chroma と同じメソッド名・戻り値（(Document, 距離) のリスト）を持つため、
+rag.vectorstore の検索関数からはそのまま差し替えて使える（VECTOR_BACKEND=numpy）。
+
+VECTOR_QUANTIZATION に int8 / binary を指定すると、量子化ベクトルで候補を絞ってから
+候補行だけを float32 で採点し直す（rag.quantization）。
+
+ann="ivf"（VECTOR_BACKEND=ivf）の場合は IVF インデックスで近い nprobe 個のリストの行だけを
+採点する（rag.ivf）。カテゴリ指定時は調べた行のうちパーティション内の行だけを使い、
+k 件に満たなければそのパーティションを全件採点する。
+
+ハイブリッド検索（rag.vectorstore）は exhaustive=False で呼び、量子化・IVF の候補だけに
+順位を付ける（k 件に満たなくてもよい）。候補から漏れた行は RRF で順位 n として扱うため、
+全件の float32 行列を読まずに済む。
+
+カテゴリ指定の検索は共有インデックスのパーティション（連続した行範囲）だけを採点する。
+カテゴリ未指定（unknown）の検索は全パーティションを並列に採点し、各上位k件をマージする。
+
+距離は Chroma の既定（l2 = 二乗ユークリッド距離）に合わせて 2 - 2cos を返す。
+正規化済みベクトル同士ではこの2つは一致するため、WEAK_SCORE_THRESHOLD はそのまま使える。
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from .config import IVF_NPROBE, PARTITION_FANOUT_WORKERS, VECTOR_QUANTIZATION, VECTOR_RESCORE_FACTOR
+from .quantization import QUANTIZATIONS, binary_scores, int8_scores, rescored_top_k
+from .shared_index import SharedIndex
+
+# 行列積は GIL を解放するため、パーティションごとの採点はスレッドで並列化できる
+_fanout_pool = (
+    ThreadPoolExecutor(max_workers=PARTITION_FANOUT_WORKERS, thread_name_prefix="partition")
+    if PARTITION_FANOUT_WORKERS > 1 else None
+)
+
+
+def _top_k(sims: np.ndarray, k: int) -> np.ndarray:
+    """類似度の高い順に上位k件の位置を返す（同点は位置の若い順）。"""
+    if k < len(sims):
+        top = np.argpartition(-sims, k - 1)[:k]
+        return top[np.lexsort((top, -sims[top]))]
+    return np.argsort(-sims, kind="stable")
+
+
+class NumpyVectorStore:
+    """SharedIndex の mmap 行列に対する厳密な全件ベクトル検索。"""
+
+    def __init__(
+        self,
+        shared_index: SharedIndex,
+        embedding_function: Embeddings,
+        quantization: str = VECTOR_QUANTIZATION,
+        rescore_factor: int = VECTOR_RESCORE_FACTOR,
+        ann: str = "none",
+        nprobe: int = IVF_NPROBE,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"未対応の量子化方式です: {quantization}（{' / '.join(QUANTIZATIONS)}）")
+        self.shared_index = shared_index
+        self.embeddings = embedding_function
+        self.rescore_factor = rescore_factor
+        self.quantization = quantization
+        if quantization != "none" and shared_index.quantized(quantization) is None:
+            print(f"[NumpyVectorStore] 共有インデックスに {quantization} 行列が無いため float32 で検索します"
+                  "（build_index.py --export-only で作り直してください）")
+            self.quantization = "none"
+        self.nprobe = nprobe
+        self.ivf = shared_index.ivf() if ann == "ivf" else None
+        if ann == "ivf" and self.ivf is None:
+            print("[NumpyVectorStore] 共有インデックスに IVF が無いため全件検索します"
+                  "（build_index.py --export-only で作り直してください）")
+
+    def __len__(self) -> int:
+        return len(self.shared_index)
+
+    @property
+    def approximate(self) -> bool:
+        """量子化・IVF で候補を絞る（全件の float32 採点をしない）か。"""
+        return self.quantization != "none" or self.ivf is not None
+
+    def _search_partition(self, q: np.ndarray, k: int, part: slice) -> tuple[np.ndarray, np.ndarray]:
+        """1パーティション（行範囲）の上位k件を (行番号, 類似度) で返す。"""
+        matrix = self.shared_index.embeddings[part]
+        if self.quantization != "none" and k * self.rescore_factor < len(matrix):
+            quantized = self.shared_index.quantized(self.quantization)
+            if self.quantization == "int8":
+                approx = int8_scores(quantized[0][part], quantized[1][part], q)
+            else:
+                approx = binary_scores(quantized[0][part], quantized[1], q)
+            top, sims = rescored_top_k(matrix, approx, q, k, k * self.rescore_factor)
+            return top + part.start, sims
+
+        sims = matrix @ q
+        top = _top_k(sims, k)
+        return top + part.start, sims[top]
+
+    def _search_ivf(
+        self,
+        q: np.ndarray,
+        k: int,
+        part: slice | None,
+        exhaustive: bool = True,
+    ) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        IVF で候補行を絞って採点する。None なら全件採点に任せる。
+
+        exhaustive=True は候補が k 件に満たなければ None。False は候補が1件でもあればその分だけ返す
+        （スコープが k × rescore_factor 件以下なら全件採点の方が安いため None）。
+        """
+        if not exhaustive:
+            size = (part.stop - part.start) if part is not None else len(self)
+            if size <= k * self.rescore_factor:
+                return None
+        rows = self.ivf.probe(q, self.nprobe)
+        if part is not None:
+            rows = rows[(rows >= part.start) & (rows < part.stop)]
+        if len(rows) == 0 or (exhaustive and len(rows) < k):
+            return None
+        sims = self.shared_index.embeddings[rows] @ q
+        order = np.lexsort((rows, -sims))[:k]
+        return rows[order], sims[order]
+
+    def _search_all(self, q: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """全パーティションを並列に採点し、各上位k件をマージする。"""
+        parts = [slice(start, stop) for start, stop in self.shared_index.partitions.values()]
+        mapper = _fanout_pool.map if _fanout_pool is not None else map
+        found = list(mapper(lambda part: self._search_partition(q, k, part), parts))
+        rows = np.concatenate([r for r, _ in found])
+        sims = np.concatenate([s for _, s in found])
+        order = np.lexsort((rows, -sims))[:k]
+        return rows[order], sims[order]
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray:
+        q = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        return q / norm if norm > 0 else q
+
+    def _search_rows(
+        self,
+        embedding: list[float],
+        k: int,
+        filter: dict | None,
+        exhaustive: bool = True,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """上位k件を (行番号, 距離) の配列で返す（Document は作らない）。"""
+        q = self._normalize(embedding)
+
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64))
+        if k <= 0:
+            return empty
+        part = None
+        if filter:
+            unsupported = set(filter) - {"category"}
+            if unsupported:
+                raise ValueError(f"NumpyVectorStore は category 以外のフィルタに未対応です: {sorted(unsupported)}")
+            part = self.shared_index.partition_slice(filter["category"])
+            if part is None:
+                return empty
+
+        found = self._search_ivf(q, k, part, exhaustive) if self.ivf is not None else None
+        if found is not None:
+            rows, sims = found
+        elif part is not None:
+            rows, sims = self._search_partition(q, k, part)
+        else:
+            rows, sims = self._search_all(q, k)
+        return rows, np.maximum(0.0, 2.0 - 2.0 * sims.astype(np.float64))
+
+    def similarity_search_rows(
+        self,
+        query: str,
+        k: int = 4,
+        filter: dict | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        similarity_search_with_score と同じ検索を (共有インデックスの行番号, 距離) の配列で返す。
+        ハイブリッド検索は順位だけが必要なため、本文の読み出しと Document の生成を省く。
+        """
+        return self._search_rows(self.embeddings.embed_query(query), k, filter)
+
+    def similarity_search_rows_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: dict | None = None,
+        exhaustive: bool = True,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        similarity_search_rows の Embedding 済み版。exhaustive=False なら IVF で調べたリストの行が
+        k 件に満たなくても、その分だけを返す（ハイブリッド検索用）。
+        """
+        return self._search_rows(embedding, k, filter, exhaustive)
+
+    def row_distances(self, embedding: list[float], rows: np.ndarray) -> np.ndarray:
+        """指定した行だけを float32 で採点した距離（ベクトル検索の候補外の行の距離を求める用）。"""
+        rows = np.asarray(rows, dtype=np.int64)
+        sims = self.shared_index.embeddings[np.sort(rows)] @ self._normalize(embedding)
+        sims = sims[np.argsort(np.argsort(rows))]
+        return np.maximum(0.0, 2.0 - 2.0 * sims.astype(np.float64))
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: dict | None = None,
+    ) -> list[tuple[Document, float]]:
+        rows, dists = self._search_rows(embedding, k, filter)
+        results = []
+        for row, dist in zip(rows.tolist(), dists.tolist()):
+            doc = Document(
+                page_content=self.shared_index.text(row),
+                metadata=dict(self.shared_index.metadatas[row]),
+                id=self.shared_index.ids[row],
+            )
+            results.append((doc, dist))
+        return results
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: dict | None = None,
+    ) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(
+            self.embeddings.embed_query(query), k=k, filter=filter
+        )
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def get(self, include: list[str] | None = None) -> dict:
+        """Chroma.get と同じ形・同じ順序で全チャンクを返す（BM25 を従来経路で組み立てる場合用）。"""
+        include = include or ["documents", "metadatas"]
+        rows = self.shared_index.scope_rows(None).tolist()
+        data: dict = {"ids": [self.shared_index.ids[r] for r in rows]}
+        if "documents" in include:
+            data["documents"] = [self.shared_index.text(r) for r in rows]
+        if "metadatas" in include:
+            data["metadatas"] = [dict(self.shared_index.metadatas[r]) for r in rows]
+        if "embeddings" in include:
+            data["embeddings"] = np.asarray(self.shared_index.embeddings[rows])
+        return data
@@ -0,0 +1,22 @@
+from langchain_core.embeddings import Embeddings
+
+from .config import MODEL_NAME, TEMPERATURE, EMBEDDING_MODEL, LLM_BACKEND, EMBEDDING_BACKEND
+
+
+def create_llm(temperature: float = TEMPERATURE, **kwargs):
+    """設定（LLM_BACKEND）に応じたチャットモデルを返す。"""
+    if LLM_BACKEND == "stub":
+        from .stub import StubChatModel
+        return StubChatModel()
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=MODEL_NAME, temperature=temperature, **kwargs)
+
+
+def create_embeddings() -> Embeddings:
+    """設定（EMBEDDING_BACKEND）に応じた Embedding を返す。"""
+    if EMBEDDING_BACKEND == "stub":
+        from .stub import StubEmbeddings
+        return StubEmbeddings()
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL)
+
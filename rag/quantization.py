@@ -0,0 +1,79 @@
+"""
+Embedding 行列の量子化（int8 / binary）と、量子化ベクトルでの一次検索 + float32 再採点。
+
+- int8  : 行ごとの最大絶対値でスケーリングして int8 に丸める（メモリ 1/4）
+- binary: 各次元が全体平均より大きいかを1ビットに詰める（メモリ 1/32）。一次検索はハミング距離
+          （平均で中心化してから符号を取るのは、非負成分の多い Embedding でもビットに情報を残すため）
+
+一次検索で上位 candidates 件に絞り込み、その行だけ float32 行列（mmap）から読み出して
+内積で採点し直す。float32 行列のページは候補行の分しか触れないため、ワーカーの常駐メモリは
+ほぼ量子化行列の大きさになる。
+"""
+import numpy as np
+
+QUANTIZATIONS = ("none", "int8", "binary")
+
+_BLOCK_ROWS = 8192  # int8 → float32 変換を一度に行う行数（一時メモリの上限）
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount_rows(x: np.ndarray) -> np.ndarray:
+    """uint8 行列の行ごとの立っているビット数。"""
+    if x.shape[1] % 8 == 0:
+        x = np.ascontiguousarray(x).view(np.uint64)  # 8バイト単位でまとめて数える
+    if hasattr(np, "bitwise_count"):  # NumPy 2.0+
+        return np.bitwise_count(x).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[x.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+
+def quantize_int8(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """行ごとに対称スケーリングした int8 行列と、行ごとのスケール（float32）を返す。"""
+    max_abs = np.abs(matrix).max(axis=1)
+    scales = np.where(max_abs == 0, 1.0, max_abs / 127.0).astype(np.float32)
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def quantize_binary(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """各次元が平均より大きいかをビットに詰めた uint8 行列と、中心（次元ごとの平均）を返す。"""
+    center = matrix.mean(axis=0).astype(np.float32)
+    return np.packbits(matrix > center, axis=1), center
+
+
+def int8_scores(codes: np.ndarray, scales: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """int8 行列と float32 クエリの近似内積。"""
+    out = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), _BLOCK_ROWS):
+        block = codes[start:start + _BLOCK_ROWS].astype(np.float32)
+        out[start:start + len(block)] = (block @ q) * scales[start:start + len(block)]
+    return out
+
+
+def binary_scores(bits: np.ndarray, center: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """ビットの一致数（大きいほど近い）。"""
+    q_bits = np.packbits(q > center)
+    hamming = _popcount_rows(np.bitwise_xor(bits, q_bits))
+    return (bits.shape[1] * 8 - hamming).astype(np.float32)
+
+
+def rescored_top_k(
+    matrix: np.ndarray,
+    approx: np.ndarray,
+    q: np.ndarray,
+    k: int,
+    candidates: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    近似スコア approx の上位 candidates 件を float32 行列で採点し直し、上位k件の
+    (位置, 類似度) を返す。位置は matrix / approx の行番号。
+    """
+    n = len(approx)
+    candidates = min(n, max(k, candidates))
+    if candidates < n:
+        cand = np.argpartition(-approx, candidates - 1)[:candidates]
+    else:
+        cand = np.arange(n)
+    cand.sort()  # mmap の読み出しを行番号順にする
+    sims = matrix[cand] @ q
+    order = np.lexsort((cand, -sims))[:k]
+    return cand[order], sims[order]
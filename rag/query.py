@@ -1,5 +1,7 @@
 import re
 
+from .llm_gateway import llm_invoke, PRIORITY_QUERY
+
 
 def guess_category(question: str, llm=None) -> str:
     q = question.lower()
@@ -25,7 +27,7 @@ def guess_category(question: str, llm=None) -> str:
                 "customer（顧客情報）/ service（サービス・解約・料金）/ company（会社情報）/ unknown（不明）\n\n"
                 f"質問: {question}\n\nカテゴリ（1語のみ）:"
             )
-            result = llm.invoke(prompt)
+            result = llm_invoke(llm, prompt, priority=PRIORITY_QUERY)
             cat = result.content.strip().lower()
             if cat in ("customer", "service", "company"):
                 return cat
@@ -44,7 +46,7 @@ def rewrite_query_for_search(question: str, llm=None) -> str:
                 "理由・背景・敬語は不要です。名詞や動詞のキーワードのみを短く出力してください。\n\n"
                 f"質問: {question}\n\nキーワード:"
             )
-            result = llm.invoke(prompt)
+            result = llm_invoke(llm, prompt, priority=PRIORITY_QUERY)
             keyword = result.content.strip()
             if keyword:
                 return keyword
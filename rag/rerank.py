@@ -0,0 +1,137 @@
+"""
+RRF 統合後の候補を並べ替える軽量リランカー（クロスエンコーダ・LLM 呼び出しなし）。
+
+ハイブリッド検索の上位候補それぞれを、次の特徴量の重み付き和（RERANK_WEIGHTS）で採点し直す。
+
+- fusion    : RRF での順位（1 - 順位 / 候補数）。元の並びを土台として残す
+- coverage  : 質問の内容語（助詞・記号を除いたトークン）のうち、チャンクに現れる語の割合
+- proximity : チャンク内で、現れた内容語をすべて含む最小の窓の詰まり具合（連続して並ぶと 1）
+- category  : 候補全体の fusion の重みのうち、チャンクと同じカテゴリが占める割合
+              （カテゴリ推定が unknown で全カテゴリを検索したときに、多数派のカテゴリを優先する）
+
+チャンクのトークン列は共有インデックス（storage/index）に語彙 ID 列として書き出してあり、
+候補の分だけ mmap から読む。共有インデックスが無い場合はその場でトークン化する（採点は同じ）。
+
+上位 top_n 件だけを LLM に渡すことでコンテキストを短くする（RERANK_TOP_N）。
+返す距離はベクトル距離のままなので、WEAK_SCORE_THRESHOLD の判定には影響しない。
+"""
+import re
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .config import RERANK_WEIGHTS
+from .vectorstore import _get_shared_index, _get_tokenizer, _tokenizer_name
+
+# 内容語とみなさないトークン（ひらがな1〜2文字の助詞・助動詞、記号・空白）
+_FUNCTION_TOKEN = re.compile(r"[\u3040-\u309f]{1,2}|[\W_]+")
+
+
+def _query_terms(tokens: list[str]) -> list[str]:
+    """質問のトークンから内容語を重複なく取り出す（出現順）。"""
+    return list(dict.fromkeys(t for t in tokens if not _FUNCTION_TOKEN.fullmatch(t)))
+
+
+def _min_window(doc_ids: np.ndarray, term_ids: np.ndarray) -> tuple[int, int]:
+    """
+    チャンクに現れた質問語の種類数 m と、その m 種類をすべて含む最小の窓の長さ（トークン数）を返す。
+    """
+    positions = np.flatnonzero(np.isin(doc_ids, term_ids))
+    terms = doc_ids[positions].tolist()
+    matched = len(set(terms))
+    if matched < 2:
+        return matched, matched
+
+    positions = positions.tolist()
+    counts: dict[int, int] = {}
+    have = 0
+    best = len(doc_ids)
+    left = 0
+    for right, term in enumerate(terms):
+        counts[term] = counts.get(term, 0) + 1
+        if counts[term] == 1:
+            have += 1
+        while have == matched:
+            best = min(best, positions[right] - positions[left] + 1)
+            counts[terms[left]] -= 1
+            if counts[terms[left]] == 0:
+                have -= 1
+            left += 1
+    return matched, best
+
+
+def _encode(db, query: str, docs: list[Document], use_janome: bool) -> tuple[np.ndarray, list[np.ndarray]]:
+    """質問の内容語とチャンクのトークン列を、共通の ID 空間の配列にして返す。"""
+    tokenize = _get_tokenizer(use_janome)
+    terms = _query_terms(tokenize(query))
+    shared = _get_shared_index(db)
+    tokenizer = _tokenizer_name(use_janome)
+    rows = [shared.row_of(doc.id) for doc in docs] if shared is not None else [None] * len(docs)
+
+    if shared is not None and shared.has_token_positions(tokenizer) and None not in rows:
+        # 語彙に無い質問語はどのチャンクにも現れない負の ID にする（網羅率の分母には数える）
+        vocab = shared.vocab(tokenizer)
+        term_ids = np.asarray([vocab.get(t, -2 - i) for i, t in enumerate(terms)], dtype=np.int32)
+        return term_ids, [shared.token_ids(row, tokenizer) for row in rows]
+
+    # 共有インデックスが無い場合は質問語だけに ID を振ってトークン化し直す（その他の語は -1）
+    vocab = {t: i for i, t in enumerate(terms)}
+    term_ids = np.arange(len(terms), dtype=np.int32)
+    doc_ids = [
+        np.asarray([vocab.get(t, -1) for t in tokenize(doc.page_content)], dtype=np.int32)
+        for doc in docs
+    ]
+    return term_ids, doc_ids
+
+
+def rerank_features(
+    db,
+    query: str,
+    results: list[tuple[Document, float]],
+    use_janome: bool = True,
+) -> list[dict[str, float]]:
+    """候補ごとの特徴量（fusion / coverage / proximity / category）を RRF の並び順で返す。"""
+    n = len(results)
+    docs = [doc for doc, _ in results]
+    term_ids, doc_ids = _encode(db, query, docs, use_janome)
+
+    fusion = [1.0 - rank / n for rank in range(n)]
+    mass: dict[str, float] = {}
+    for doc, f in zip(docs, fusion):
+        category = doc.metadata.get("category", "unknown")
+        mass[category] = mass.get(category, 0.0) + f
+    total_mass = sum(fusion) or 1.0
+
+    features = []
+    for doc, f, ids in zip(docs, fusion, doc_ids):
+        matched, window = _min_window(ids, term_ids) if len(term_ids) else (0, 0)
+        features.append({
+            "fusion": f,
+            "coverage": matched / len(term_ids) if len(term_ids) else 0.0,
+            "proximity": (matched - 1) / (window - 1) if matched >= 2 else 0.0,
+            "category": mass[doc.metadata.get("category", "unknown")] / total_mass,
+        })
+    return features
+
+
+def rerank(
+    db,
+    query: str,
+    results: list[tuple[Document, float]],
+    top_n: int,
+    use_janome: bool = True,
+    weights: dict[str, float] = RERANK_WEIGHTS,
+) -> list[tuple[Document, float]]:
+    """
+    ハイブリッド検索の結果を特徴量の重み付き和で並べ替え、上位 top_n 件を返す。
+
+    同点は元の RRF の順位を保つ。top_n が 0 以下なら並べ替えだけ行って全件返す。
+    """
+    if len(results) <= 1:
+        return results
+    features = rerank_features(db, query, results, use_janome)
+    scores = [sum(weights.get(name, 0.0) * value for name, value in f.items()) for f in features]
+    order = sorted(range(len(results)), key=lambda i: (-scores[i], i))
+    if top_n > 0:
+        order = order[:top_n]
+    return [results[i] for i in order]
@@ -0,0 +1,156 @@
+"""
+ハイブリッド検索の結果キャッシュ（LRU + TTL）。
+
+rewrite_query_for_search は言い回しの違う質問を同じキーワード（例:「解約 方法」）に
+まとめるため、(リライト後のクエリ, カテゴリ, k) が同じ検索は同じ結果になる。
+ヒット時はクエリの Embedding（リモート呼び出し）も BM25 の採点も行わない。
+
+保持するのはチャンク ID と距離だけで、本文・メタデータはヒット時に共有インデックス
+（無ければ Chroma）から ID で引き直す。インデックスの世代（index_generation）が
+変わったら全件を破棄する（build_index.py で作り直した場合）。
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+from .config import RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL
+from .vectorstore import _get_shared_index, hybrid_retrieve_with_score
+
+
+def index_generation(*paths: Path) -> tuple:
+    """インデックスの世代（ファイルの更新時刻）。build_index.py で作り直すと変わる。"""
+    generation = []
+    for path in paths:
+        try:
+            generation.append(Path(path).stat().st_mtime_ns)
+        except OSError:
+            generation.append(None)
+    return tuple(generation)
+
+
+def _normalize_query(query: str) -> str:
+    """
+    表記ゆれ（全角/半角・空白）を吸収したクエリ。キャッシュのキーと、ミス時の検索の両方に使う。
+
+    BM25 の語・Embedding は大文字と小文字を区別するため、大文字・小文字はそろえない。
+    """
+    q = unicodedata.normalize("NFKC", query)
+    return re.sub(r"\s+", " ", q).strip()
+
+
+def _documents_by_id(db, ids: list[str]) -> list[Document] | None:
+    """チャンク ID の順に Document を作る。1件でも見つからなければ None。"""
+    shared = _get_shared_index(db)
+    if shared is not None:
+        rows = [shared.row_of(chunk_id) for chunk_id in ids]
+        if None in rows:
+            return None
+        return [
+            Document(page_content=shared.text(row), metadata=shared.metadatas[row], id=shared.ids[row])
+            for row in rows
+        ]
+
+    data = db.get(ids=ids, include=["documents", "metadatas"])
+    found = {
+        chunk_id: Document(page_content=content, metadata=meta or {}, id=chunk_id)
+        for chunk_id, content, meta in zip(data.get("ids") or [], data.get("documents") or [], data.get("metadatas") or [])
+    }
+    if len(found) != len(set(ids)):
+        return None
+    return [found[chunk_id] for chunk_id in ids]
+
+
+class RetrievalCache:
+    """
+    (正規化したクエリ, カテゴリ, k, トークナイザ) → [(チャンクID, 距離), ...] の LRU キャッシュ。
+
+    エントリは ttl 秒で失効する。maxsize が 0 以下ならキャッシュせず毎回検索する。
+    """
+
+    def __init__(self, maxsize: int = RETRIEVAL_CACHE_SIZE, ttl: float = RETRIEVAL_CACHE_TTL):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries: "OrderedDict[tuple, tuple[float, list[tuple[str, float]]]]" = OrderedDict()
+        self._generation: tuple | None = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "expired": 0, "invalidations": 0}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _lookup(self, key: tuple, generation: tuple | None) -> list[tuple[str, float]] | None:
+        with self._lock:
+            if generation != self._generation:
+                if self._entries:
+                    self._counters["invalidations"] += 1
+                self._entries.clear()
+                self._generation = generation
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self._ttl:
+                del self._entries[key]
+                self._counters["expired"] += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _store(self, key: tuple, generation: tuple | None, value: list[tuple[str, float]]) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return  # 検索中にインデックスが作り直された
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def retrieve(
+        self,
+        db,
+        query: str,
+        k: int = 4,
+        category: str = "unknown",
+        use_janome: bool = True,
+        generation: tuple | None = None,
+    ) -> list[tuple[Document, float]]:
+        """
+        正規化したクエリでの hybrid_retrieve_with_score と同じ結果を、キャッシュがあればそこから返す。
+
+        キーが同じクエリは必ず同じ文字列で検索するため、どのクエリが先に来ても結果は変わらない。
+        """
+        query = _normalize_query(query)
+        if self._maxsize <= 0:
+            return hybrid_retrieve_with_score(db, query, k=k, category=category, use_janome=use_janome)
+
+        key = (query, category, k, use_janome)
+        cached = self._lookup(key, generation)
+        if cached is not None:
+            docs = _documents_by_id(db, [chunk_id for chunk_id, _ in cached])
+            if docs is not None:
+                with self._lock:
+                    self._counters["hits"] += 1
+                return [(doc, score) for doc, (_, score) in zip(docs, cached)]
+
+        with self._lock:
+            self._counters["misses"] += 1
+        results = hybrid_retrieve_with_score(db, query, k=k, category=category, use_janome=use_janome)
+        if all(doc.id for doc, _ in results):
+            self._store(key, generation, [(doc.id, float(score)) for doc, score in results])
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._counters["hits"]
+            total = hits + self._counters["misses"]
+            return {
+                **self._counters,
+                "size": len(self._entries),
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+            }
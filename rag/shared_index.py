@@ -0,0 +1,382 @@
+"""
+複数ワーカーで共有する読み取り専用インデックス（storage/index/）。
+
+build_index.py がチャンク本文・Embedding 行列・BM25 の転置インデックスを
+NumPy 配列として書き出し、各ワーカーは np.load(mmap_mode="r") で開く。
+実体は OS のページキャッシュ上で共有されるため、ワーカー数を増やしても
+メモリ使用量はほぼ増えない（各ワーカーが持つのはメタデータと語彙表のみ）。
+
+BM25 の重み（idf × tf 正規化項）は rank_bm25.BM25Okapi と同じ式で事前計算しておき、
+問い合わせ時は質問のトークン分だけ転置リストを足し込む。カテゴリ絞り込み時の
+BM25 は従来どおり「そのカテゴリの文書だけで作ったBM25」と同じスコアになるよう、
+全体（__all__）とカテゴリごとにスコープを分けて保持する。
+
+チャンクはカテゴリ順に並べ替えて書き出し、各カテゴリを連続した行範囲（パーティション）に
+置く。カテゴリ指定の検索は自分の行範囲（配列のビュー）だけを読めばよい。
+全体スコープの BM25 は並べ替え前（Chroma の取得順）の順序で採点し、同点時の順位を従来と揃える。
+
+各チャンクのトークン列も BM25 の語彙 ID 列（CSR 形式）として書き出し、
+リランカー（rag.rerank）が語の出現位置をトークン化し直さずに参照できるようにする。
+"""
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from .config import IVF_NLIST
+from .ivf import IVFIndex
+from .quantization import quantize_binary, quantize_int8
+
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 2
+GLOBAL_SCOPE = "__all__"
+TOKENIZERS = ("janome", "regex")
+
+
+def _scope_of(category: str | None) -> str:
+    return category if category and category != "unknown" else GLOBAL_SCOPE
+
+
+def _build_bm25_postings(tokenized: list[list[str]], scope_rows: list[np.ndarray]):
+    """スコープごとに BM25Okapi を作り、(語彙, indptr, 文書位置, 重み) の CSR 形式にまとめる。"""
+    from rank_bm25 import BM25Okapi
+
+    vocab: dict[str, int] = {}
+    for tokens in tokenized:
+        for t in tokens:
+            vocab.setdefault(t, len(vocab))
+
+    indptr = np.zeros((len(scope_rows), len(vocab) + 1), dtype=np.int64)
+    docs_parts: list[np.ndarray] = []
+    weight_parts: list[np.ndarray] = []
+    offset = 0
+    for s, rows in enumerate(scope_rows):
+        corpus = [tokenized[r] for r in rows]
+        postings: dict[int, tuple[list[int], list[float]]] = {}
+        if corpus:
+            bm25 = BM25Okapi(corpus)
+            for pos, freqs in enumerate(bm25.doc_freqs):
+                norm = bm25.k1 * (1 - bm25.b + bm25.b * bm25.doc_len[pos] / bm25.avgdl)
+                for term, tf in freqs.items():
+                    weight = bm25.idf[term] * (tf * (bm25.k1 + 1) / (tf + norm))
+                    p = postings.setdefault(vocab[term], ([], []))
+                    p[0].append(pos)
+                    p[1].append(weight)
+        counts = np.zeros(len(vocab), dtype=np.int64)
+        for tid, (positions, _) in postings.items():
+            counts[tid] = len(positions)
+        indptr[s, 1:] = offset + np.cumsum(counts)
+        indptr[s, 0] = offset
+        for tid in sorted(postings):
+            positions, weights = postings[tid]
+            docs_parts.append(np.asarray(positions, dtype=np.int32))
+            weight_parts.append(np.asarray(weights, dtype=np.float64))
+        offset = int(indptr[s, -1])
+
+    docs = np.concatenate(docs_parts) if docs_parts else np.zeros(0, dtype=np.int32)
+    weights = np.concatenate(weight_parts) if weight_parts else np.zeros(0, dtype=np.float64)
+    return vocab, indptr, docs, weights
+
+
+def _build_ivf(embeddings: np.ndarray, base_ivf: IVFIndex | None) -> IVFIndex:
+    """base_ivf があればその重心に割り当て直し、偏りが大きい・リスト数の設定が違う場合だけ学習し直す。"""
+    if base_ivf is not None and base_ivf.centroids.shape[1] == embeddings.shape[1] \
+            and (not IVF_NLIST or IVF_NLIST == base_ivf.nlist):
+        ivf = IVFIndex.reassign(base_ivf, embeddings)
+        if not ivf.needs_retrain():
+            print(f"[SharedIndex] IVF: 既存の重心 {ivf.nlist} 個に割り当てました（再学習なし）")
+            return ivf
+        print("[SharedIndex] IVF: リストの偏りが大きくなったため k-means を再学習します")
+    return IVFIndex.train(embeddings, nlist=IVF_NLIST or None)
+
+
+def export_shared_index(db, index_dir: Path, base_ivf: IVFIndex | None = None) -> Path:
+    """
+    Chroma の全チャンクを共有インデックスとして index_dir に書き出す。
+
+    書き込みは一時ディレクトリで行い、完成してから差し替える（読み込み中のワーカーが
+    書きかけのファイルを開かないようにするため）。base_ivf（差分更新の元バージョンの IVF）を
+    渡すと、その重心を再利用して k-means の学習を省く。
+    """
+    from .vectorstore import _get_tokenizer, _regex_tokenize
+
+    data = db.get(include=["documents", "metadatas", "embeddings"])
+    ids: list[str] = list(data.get("ids") or [])
+    contents: list[str] = list(data.get("documents") or [])
+    metadatas: list[dict] = [m or {} for m in (data.get("metadatas") or [])]
+    embeddings = np.asarray(data.get("embeddings"), dtype=np.float32)
+    if not contents:
+        raise RuntimeError("共有インデックスに書き出すチャンクがありません")
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.where(norms == 0, 1.0, norms)
+
+    # カテゴリごとに連続した行範囲になるよう安定ソートで並べ替える
+    categories = [m.get("category", "unknown") for m in metadatas]
+    perm = sorted(range(len(contents)), key=lambda i: categories[i])
+    ids = [ids[i] for i in perm]
+    contents = [contents[i] for i in perm]
+    metadatas = [metadatas[i] for i in perm]
+    categories = [categories[i] for i in perm]
+    embeddings = embeddings[perm]
+    global_rows = np.argsort(perm)  # 並べ替え前の順序 → 新しい行番号
+
+    partitions: dict[str, list[int]] = {}
+    for row, category in enumerate(categories):
+        partitions.setdefault(category, [row, row])[1] = row + 1
+    scopes = [GLOBAL_SCOPE] + list(partitions)
+    scope_rows = [global_rows] + [np.arange(start, stop) for start, stop in partitions.values()]
+
+    tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    encoded = [c.encode("utf-8") for c in contents]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    (tmp_dir / "texts.bin").write_bytes(b"".join(encoded))
+    np.save(tmp_dir / "text_offsets.npy", offsets)
+    np.save(tmp_dir / "embeddings.npy", embeddings)
+    np.save(tmp_dir / "global_rows.npy", global_rows)
+    codes, scales = quantize_int8(embeddings)
+    np.save(tmp_dir / "embeddings_int8.npy", codes)
+    np.save(tmp_dir / "embeddings_int8_scales.npy", scales)
+    bits, center = quantize_binary(embeddings)
+    np.save(tmp_dir / "embeddings_binary.npy", bits)
+    np.save(tmp_dir / "embeddings_binary_center.npy", center)
+    _build_ivf(embeddings, base_ivf).save(tmp_dir)
+    with open(tmp_dir / "metadata.jsonl", "w", encoding="utf-8") as f:
+        for chunk_id, meta in zip(ids, metadatas):
+            f.write(json.dumps({"id": chunk_id, "metadata": meta}, ensure_ascii=False) + "\n")
+
+    tokenizers = []
+    for name in TOKENIZERS:
+        tokenize = _get_tokenizer(name == "janome")
+        if name == "janome" and tokenize is _regex_tokenize:
+            continue  # Janome 未インストール時は regex のみ
+        tokenized = [tokenize(c) for c in contents]
+        vocab, indptr, docs, weights = _build_bm25_postings(tokenized, scope_rows)
+        with open(tmp_dir / f"bm25_{name}_vocab.json", "w", encoding="utf-8") as f:
+            json.dump(vocab, f, ensure_ascii=False)
+        np.save(tmp_dir / f"bm25_{name}_indptr.npy", indptr)
+        np.save(tmp_dir / f"bm25_{name}_docs.npy", docs)
+        np.save(tmp_dir / f"bm25_{name}_weights.npy", weights)
+        token_indptr = np.zeros(len(tokenized) + 1, dtype=np.int64)
+        token_indptr[1:] = np.cumsum([len(tokens) for tokens in tokenized])
+        np.save(tmp_dir / f"tokens_{name}_indptr.npy", token_indptr)
+        np.save(tmp_dir / f"tokens_{name}_ids.npy",
+                np.asarray([vocab[t] for tokens in tokenized for t in tokens], dtype=np.int32))
+        tokenizers.append(name)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "num_chunks": len(contents),
+        "dim": int(embeddings.shape[1]),
+        "scopes": scopes,
+        "partitions": partitions,
+        "quantized": ["int8", "binary"],
+        "tokenizers": tokenizers,
+        "token_positions": tokenizers,
+    }
+    with open(tmp_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    tmp_dir.rename(index_dir)
+    return index_dir
+
+
+class SharedIndex:
+    """
+    共有インデックスの読み取り用ハンドル。
+
+    大きな配列（本文・Embedding・BM25 転置リスト）はすべて mmap で開くため、
+    このオブジェクト自体は軽量で、ワーカーごとに1つ持っても実メモリは共有される。
+    """
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / MANIFEST_NAME, encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"未対応の共有インデックス形式です: {self.manifest.get('format_version')}"
+                "（build_index.py --export-only で作り直してください）"
+            )
+
+        self._texts = np.memmap(self.index_dir / "texts.bin", dtype=np.uint8, mode="r")
+        self._offsets = np.load(self.index_dir / "text_offsets.npy", mmap_mode="r")
+        self.embeddings = np.load(self.index_dir / "embeddings.npy", mmap_mode="r")
+
+        self.ids: list[str] = []
+        self.metadatas: list[dict] = []
+        with open(self.index_dir / "metadata.jsonl", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                self.ids.append(entry["id"])
+                self.metadatas.append(entry["metadata"])
+        self._row_of_id = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self._parent_rows: dict[str, list[int]] | None = None
+
+        self.scopes: list[str] = self.manifest["scopes"]
+        self._scope_pos = {s: i for i, s in enumerate(self.scopes)}
+        self.partitions: dict[str, tuple[int, int]] = {
+            category: (start, stop) for category, (start, stop) in self.manifest["partitions"].items()
+        }
+        self._scope_rows = {GLOBAL_SCOPE: np.load(self.index_dir / "global_rows.npy", mmap_mode="r")}
+        for category, (start, stop) in self.partitions.items():
+            self._scope_rows[category] = np.arange(start, stop)
+        self._scope_positions: dict[str, np.ndarray] = {}
+
+        self._quantized: dict[str, tuple] = {}
+        self._ivf: IVFIndex | None = None
+
+        self._bm25 = {}
+        for name in self.manifest["tokenizers"]:
+            with open(self.index_dir / f"bm25_{name}_vocab.json", encoding="utf-8") as f:
+                vocab = json.load(f)
+            self._bm25[name] = (
+                vocab,
+                np.load(self.index_dir / f"bm25_{name}_indptr.npy", mmap_mode="r"),
+                np.load(self.index_dir / f"bm25_{name}_docs.npy", mmap_mode="r"),
+                np.load(self.index_dir / f"bm25_{name}_weights.npy", mmap_mode="r"),
+            )
+        self._tokens = {
+            name: (
+                np.load(self.index_dir / f"tokens_{name}_indptr.npy", mmap_mode="r"),
+                np.load(self.index_dir / f"tokens_{name}_ids.npy", mmap_mode="r"),
+            )
+            for name in self.manifest.get("token_positions", [])
+        }
+
+    def __len__(self) -> int:
+        return len(self.metadatas)
+
+    def text(self, row: int) -> str:
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return self._texts[start:end].tobytes().decode("utf-8")
+
+    def row_of(self, chunk_id: str | None) -> int | None:
+        """チャンク ID の行番号（見つからなければ None）。"""
+        return self._row_of_id.get(chunk_id)
+
+    def parent_rows(self, parent_id: str) -> list[int]:
+        """親チャンク（rag.chunking）に属する子チャンクの行番号（chunk_index 順）。"""
+        if self._parent_rows is None:
+            groups: dict[str, list[int]] = {}
+            for row, meta in enumerate(self.metadatas):
+                if meta.get("parent_id"):
+                    groups.setdefault(meta["parent_id"], []).append(row)
+            for rows in groups.values():
+                rows.sort(key=lambda row: self.metadatas[row].get("chunk_index", 0))
+            self._parent_rows = groups
+        return self._parent_rows.get(parent_id, [])
+
+    def quantized(self, kind: str) -> tuple | None:
+        """
+        量子化済み行列を mmap で開いて返す（初回のみ読み込み）。書き出されていなければ None。
+
+        int8 は (int8 行列, 行スケール)、binary は (ビット行列, 中心ベクトル) のタプル。
+        """
+        if kind not in self._quantized:
+            if kind not in self.manifest.get("quantized", []):
+                return None
+            if kind == "int8":
+                self._quantized[kind] = (
+                    np.load(self.index_dir / "embeddings_int8.npy", mmap_mode="r"),
+                    np.load(self.index_dir / "embeddings_int8_scales.npy", mmap_mode="r"),
+                )
+            else:
+                self._quantized[kind] = (
+                    np.load(self.index_dir / "embeddings_binary.npy", mmap_mode="r"),
+                    np.load(self.index_dir / "embeddings_binary_center.npy"),
+                )
+        return self._quantized[kind]
+
+    def ivf(self) -> IVFIndex | None:
+        """IVF インデックスを開いて返す（初回のみ読み込み）。書き出されていなければ None。"""
+        if self._ivf is None and (self.index_dir / "ivf.json").exists():
+            self._ivf = IVFIndex.load(self.index_dir)
+        return self._ivf
+
+    def prefetch(self, quantization: str = "none") -> None:
+        """
+        検索で読む配列（BM25 の転置リスト、quantization の量子化行列）のページを読み込んでおく。
+
+        float32 の Embedding 行列は触らない（量子化・IVF 使用時は候補行しか読まないため）。
+        """
+        arrays = [a for _, *postings in self._bm25.values() for a in postings]
+        if quantization != "none" and self.quantized(quantization) is not None:
+            arrays.append(self.quantized(quantization)[0])
+        for array in arrays:
+            # 1ページ（4KB）に1要素ずつ触れればページキャッシュに載る
+            step = max(1, 4096 // max(1, array.itemsize))
+            int(np.asarray(array).reshape(-1)[::step].sum())
+
+    def partition_slice(self, category: str) -> slice | None:
+        """カテゴリのパーティション（連続した行範囲）。存在しないカテゴリは None。"""
+        bounds = self.partitions.get(category)
+        return slice(*bounds) if bounds else None
+
+    def scope_rows(self, category: str | None) -> np.ndarray:
+        """カテゴリに属するチャンクの行番号（未知カテゴリは全件、存在しないカテゴリは空）。"""
+        return self._scope_rows.get(_scope_of(category), np.zeros(0, dtype=np.int64))
+
+    def scope_position(self, category: str | None) -> np.ndarray:
+        """行番号 → scope_rows(category) 内の位置（スコープ外の行は -1）。スコープごとに1回だけ作る。"""
+        scope = _scope_of(category)
+        if scope not in self._scope_positions:
+            position = np.full(len(self), -1, dtype=np.int64)
+            rows = self.scope_rows(category)
+            position[rows] = np.arange(len(rows))
+            self._scope_positions[scope] = position
+        return self._scope_positions[scope]
+
+    def has_bm25(self, tokenizer: str) -> bool:
+        return tokenizer in self._bm25
+
+    def vocab(self, tokenizer: str) -> dict[str, int]:
+        """BM25 の語彙表（トークン → 語彙 ID）。"""
+        return self._bm25[tokenizer][0]
+
+    def has_token_positions(self, tokenizer: str) -> bool:
+        return tokenizer in self._tokens
+
+    def token_ids(self, row: int, tokenizer: str) -> np.ndarray:
+        """チャンクのトークン列を語彙 ID の配列で返す（位置 = 先頭からのトークン番号）。"""
+        indptr, ids = self._tokens[tokenizer]
+        return ids[int(indptr[row]):int(indptr[row + 1])]
+
+    def bm25_scores(self, query_tokens: list[str], tokenizer: str, category: str | None) -> np.ndarray:
+        """scope_rows(category) の並びに対応する BM25 スコアを返す（BM25Okapi.get_scores と同値）。"""
+        scope = _scope_of(category)
+        rows = self.scope_rows(category)
+        scores = np.zeros(len(rows), dtype=np.float64)
+        if scope not in self._scope_pos:
+            return scores
+        s = self._scope_pos[scope]
+        vocab, indptr, docs, weights = self._bm25[tokenizer]
+        for token in query_tokens:
+            tid = vocab.get(token)
+            if tid is None:
+                continue
+            lo, hi = int(indptr[s, tid]), int(indptr[s, tid + 1])
+            scores[docs[lo:hi]] += weights[lo:hi]
+        return scores
+
+
+def open_shared_index(index_dir: Path, expected_chunks: int | None = None) -> SharedIndex | None:
+    """共有インデックスを開く。無い・壊れている・件数が合わない場合は None（従来経路で検索する）。"""
+    if not (Path(index_dir) / MANIFEST_NAME).exists():
+        return None
+    try:
+        index = SharedIndex(index_dir)
+    except Exception as e:
+        print(f"[SharedIndex] 読み込みに失敗したため使用しません: {e}")
+        return None
+    if expected_chunks is not None and len(index) != expected_chunks:
+        print(f"[SharedIndex] チャンク数が Chroma と一致しないため使用しません "
+              f"({len(index)} != {expected_chunks})。build_index.py を再実行してください")
+        return None
+    return index
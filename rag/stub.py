@@ -0,0 +1,122 @@
+"""
+ネットワーク不要の決定的な LLM / Embedding 代替実装。
+
+負荷試験・レイテンシ計測・CI 用。回答品質は評価対象外で、
+プロンプトの種類を見分けて呼び出し元がパースできる形式の定型文を返す。
+"""
+import hashlib
+import json
+import math
+import re
+import time
+import unicodedata
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+
+from .config import STUB_EMBEDDING_DIM, STUB_LLM_LATENCY_MS
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_CJK_RUN_RE = re.compile(r"[^\x00-\x7f\s、。，．・「」『』（）()\[\]【】！？!?:：;；/]+")
+
+
+def _hash_tokens(text: str) -> list[str]:
+    """英数字は単語単位、日本語は文字bigram（1文字のみの場合はunigram）でトークン化する。"""
+    t = unicodedata.normalize("NFKC", text).lower()
+    tokens = _WORD_RE.findall(t)
+    for run in _CJK_RUN_RE.findall(t):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+# 全ベクトル共通の成分の重み（二乗）。bag-of-words のコサイン類似度は小さく出やすいため、
+# 距離を text-embedding-3-small と同程度のレンジ（関連文書で 1.0 前後）に寄せる。順位は変わらない。
+_SHARED_WEIGHT = 0.5
+
+
+class StubEmbeddings(Embeddings):
+    """hashing trick による bag-of-words 埋め込み（L2正規化済み・決定的）。"""
+
+    def __init__(self, dim: int = STUB_EMBEDDING_DIM):
+        self.dim = dim
+
+    def _embed(self, text: str) -> list[float]:
+        vec = [0.0] * (self.dim - 1)
+        counts: dict[str, int] = {}
+        for tok in _hash_tokens(text):
+            counts[tok] = counts.get(tok, 0) + 1
+        for tok, c in counts.items():
+            h = int.from_bytes(hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest(), "little")
+            sign = 1.0 if (h >> 63) & 1 else -1.0
+            vec[h % len(vec)] += sign * (1.0 + math.log(c))
+        norm = math.sqrt(sum(v * v for v in vec))
+        if norm == 0:
+            return vec + [1.0]
+        scale = math.sqrt(1.0 - _SHARED_WEIGHT) / norm
+        return [v * scale for v in vec] + [math.sqrt(_SHARED_WEIGHT)]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+def _section(prompt: str, header: str) -> str:
+    """プロンプト中の「[header]」直後から次の「[」見出しまでを取り出す。"""
+    m = re.search(re.escape(f"[{header}]") + r"\n(.*?)(?:\n\[[^\]\n]+\]|\Z)", prompt, re.DOTALL)
+    return m.group(1).strip() if m else ""
+
+
+def _canned_reply(prompt: str) -> str:
+    if '"accuracy"' in prompt:
+        return json.dumps({"accuracy": 80, "completeness": 80})
+    if '"judgment"' in prompt and "### 項目" in prompt:
+        n = len(re.findall(r"^### 項目\d+", prompt, re.MULTILINE))
+        return json.dumps(
+            [{"id": i, "judgment": "○", "reason": "stub"} for i in range(1, n + 1)], ensure_ascii=False
+        )
+    if '"judgment"' in prompt:
+        return json.dumps({"judgment": "○", "reason": "stub"}, ensure_ascii=False)
+    if '"expected_answer"' in prompt:
+        return "[]"
+    if "カテゴリ（1語のみ）" in prompt:
+        return "unknown"
+    if "検索キーワード" in prompt or "口語化した質問" in prompt:
+        m = re.search(r"(?:質問|元の質問)[:：]\s*(.+)", prompt)
+        return m.group(1).strip() if m else ""
+    for header in ("RAG回答", "コンテキスト"):
+        body = _section(prompt, header)
+        if body:
+            sentences = re.split(r"(?<=。)", re.sub(r"\s+", " ", body))
+            return "".join(sentences[:3]).strip()[:300]
+    return "資料に記載がありません。"
+
+
+class StubChatModel:
+    """ChatOpenAI の invoke 互換の定型応答LLM。latency_ms だけ待ってから返す。"""
+
+    def __init__(self, latency_ms: float = STUB_LLM_LATENCY_MS, **_: object):
+        self.latency_ms = latency_ms
+
+    def invoke(self, messages) -> AIMessage:
+        if isinstance(messages, str):
+            prompt = messages
+        else:
+            prompt = "\n".join(
+                str(m.get("content", "") if isinstance(m, dict) else getattr(m, "content", ""))
+                for m in messages
+            )
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+        content = _canned_reply(prompt)
+        return AIMessage(
+            content=content,
+            response_metadata={
+                "model_name": "stub",
+                "token_usage": {"prompt_tokens": len(prompt), "completion_tokens": len(content)},
+            },
+        )
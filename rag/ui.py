@@ -77,7 +77,9 @@ def render_citations(citations: list[dict]):
             
             # メタ情報にスコアを追加
             meta_parts = []
-            if page:
+            if c.get("section"):
+                meta_parts.append(f"セクション: {c['section']}")
+            elif page:
                 meta_parts.append(f"ページ: {page}")
             else:
                 meta_parts.append("ページ: 不明")
@@ -124,7 +126,7 @@ def render_agent_log(agent_log: dict | None) -> None:
             "steps": [{"icon": str, "label": str, "status": "pending"|"running"|"done"}],
             "is_processing": bool,
             "self_eval": {"accuracy": int, "completeness": int},   # 0-100
-            "exec_meta": {"loops": int, "tokens": int},
+            "exec_meta": {"loops": int, "tokens": int, "latency": float | None},
         }
     """
     st.markdown("### 🧠 推論ステータス")
@@ -178,6 +180,9 @@ def render_agent_log(agent_log: dict | None) -> None:
             st.metric("反復回数", f"{exec_meta.get('loops', 0)} 回")
         with col2:
             st.metric("トークン数", f"~{exec_meta.get('tokens', 0):,}")
+        latency = exec_meta.get("latency")
+        if latency is not None:
+            st.caption(f"応答時間（クライアント計測）: {latency:.2f} 秒")
 
 
 def render_contact_guidance(user_text: str, citations: list[dict]):
@@ -1,16 +1,48 @@
 import re
+import threading
 from pathlib import Path
-from langchain_openai import OpenAIEmbeddings
+from typing import Callable
+
+import numpy as np
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 
-def open_vectorstore(persist_dir: Path) -> Chroma:
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    return Chroma(
+from .config import HYBRID_VECTOR_DEPTH, VECTOR_BACKEND
+from .numpy_store import NumpyVectorStore
+from .providers import create_embeddings
+from .shared_index import SharedIndex, open_shared_index
+
+def open_vectorstore(
+    persist_dir: Path,
+    index_dir: Path | None = None,
+    backend: str = VECTOR_BACKEND,
+) -> Chroma | NumpyVectorStore:
+    """
+    ベクトルストアを開く。index_dir に共有インデックス（build_index.py が出力）があれば
+    db.shared_index として紐づけ、BM25・本文の取得をそちらから行う。
+
+    backend="numpy" / "ivf" の場合は Chroma を開かず、共有インデックスの Embedding 行列で検索する
+    （共有インデックスが無ければ Chroma にフォールバックする）。
+    """
+    embeddings = create_embeddings()
+    if backend in ("numpy", "ivf"):
+        shared = open_shared_index(index_dir) if index_dir is not None else None
+        if shared is not None:
+            return NumpyVectorStore(shared, embeddings, ann="ivf" if backend == "ivf" else "none")
+        print("[vectorstore] 共有インデックスが無いため Chroma で検索します（build_index.py を実行してください）")
+
+    db = Chroma(
         collection_name="docs",
         persist_directory=str(persist_dir),
         embedding_function=embeddings,
     )
+    if index_dir is not None:
+        db.shared_index = open_shared_index(index_dir, expected_chunks=db._collection.count())
+    return db
+
+
+def _get_shared_index(db) -> SharedIndex | None:
+    return getattr(db, "shared_index", None)
 
 def retrieve_with_score(db: Chroma, query: str, k: int = 4, category: str = "unknown"):
     kwargs = {}
@@ -36,7 +68,13 @@ def retrieve_with_score(db: Chroma, query: str, k: int = 4, category: str = "unk
         quote = text[:400] + ("..." if len(text) > 400 else "")  # メール等が切れないよう長め
 
         citations.append(
-            {"category": cat, "source": src, "page": (page + 1) if isinstance(page, int) else None, "quote": quote}
+            {
+                "category": cat,
+                "source": src,
+                "page": (page + 1) if isinstance(page, int) else None,
+                "section": d.metadata.get("section") or None,
+                "quote": quote,
+            }
         )
 
     return context, citations, best_score
@@ -55,6 +93,189 @@ def _vector_only_search(
     return db.similarity_search_with_score(query, k=k, **vec_kwargs)
 
 
+_janome_local = threading.local()
+
+
+def _regex_tokenize(text: str) -> list[str]:
+    return re.findall(r'\w+', text)
+
+
+def _get_tokenizer(use_janome: bool = True) -> Callable[[str], list[str]]:
+    """BM25 用のトークナイザを返す。Janome が無い場合は正規表現にフォールバックする。
+
+    Janome の Tokenizer は生成コストが高くスレッドセーフでもないため、スレッドごとに1つ使い回す。
+    """
+    if not use_janome:
+        return _regex_tokenize
+    jt = getattr(_janome_local, "tokenizer", None)
+    if jt is None:
+        try:
+            from janome.tokenizer import Tokenizer as JanomeTokenizer
+        except ImportError:
+            return _regex_tokenize
+        jt = _janome_local.tokenizer = JanomeTokenizer()
+
+    def _tokenize(text: str) -> list[str]:
+        return [t.surface for t in jt.tokenize(text)]
+    return _tokenize
+
+
+def _tokenizer_name(use_janome: bool) -> str:
+    """実際に使われるトークナイザ名（Janome が無い環境では regex）。"""
+    return "regex" if _get_tokenizer(use_janome) is _regex_tokenize else "janome"
+
+
+def _load_corpus(db: Chroma, category: str) -> tuple[list[str], list[str], list[dict]]:
+    """Chroma から全チャンク（ID・本文・メタデータ）を取得し、カテゴリ指定があれば絞り込む。"""
+    all_data = db.get(include=["documents", "metadatas"])
+    all_ids: list[str] = all_data.get("ids") or []
+    all_contents: list[str] = all_data.get("documents") or []
+    all_metadatas: list[dict] = all_data.get("metadatas") or []
+    if category and category != "unknown":
+        triples = [(i, c, m) for i, c, m in zip(all_ids, all_contents, all_metadatas)
+                   if m and m.get("category") == category]
+        if not triples:
+            return [], [], []
+        all_ids, all_contents, all_metadatas = (list(x) for x in zip(*triples))
+    return all_ids, all_contents, all_metadatas
+
+
+def _bm25_corpus_scores(
+    db: Chroma,
+    query: str,
+    category: str,
+    use_janome: bool = True,
+) -> tuple[list[str], list[dict], list[float]]:
+    """
+    カテゴリ内の全チャンクと BM25 スコアを返す。
+
+    共有インデックスがあれば事前計算済みの転置リストで採点し、
+    無ければ従来どおり Chroma から全件取得して BM25 を組み立てる（結果は同じ）。
+    """
+    tokenize = _get_tokenizer(use_janome)
+    shared = _get_shared_index(db)
+    tokenizer = _tokenizer_name(use_janome)
+    if shared is not None and shared.has_bm25(tokenizer):
+        rows = shared.scope_rows(category)
+        scores = shared.bm25_scores(tokenize(query), tokenizer, category)
+        return [shared.text(r) for r in rows], [shared.metadatas[r] for r in rows], scores
+
+    from rank_bm25 import BM25Okapi
+
+    _, all_contents, all_metadatas = _load_corpus(db, category)
+    if not all_contents:
+        return [], [], []
+    bm25 = BM25Okapi([tokenize(doc) for doc in all_contents])
+    return all_contents, all_metadatas, bm25.get_scores(tokenize(query))
+
+
+def _bm25_only_search(
+    db: Chroma,
+    query: str,
+    k: int,
+    category: str,
+    use_janome: bool = True,
+) -> list[tuple[Document, float]]:
+    """BM25 のみで結果を返す（ベンチマーク用）。スコアは BM25 スコア（大きいほど良い）。"""
+    all_contents, all_metadatas, scores = _bm25_corpus_scores(db, query, category, use_janome)
+    if not all_contents:
+        return []
+    top = sorted(range(len(all_contents)), key=lambda i: scores[i], reverse=True)[:k]
+    return [
+        (Document(page_content=all_contents[i], metadata=all_metadatas[i] or {}), float(scores[i]))
+        for i in top
+    ]
+
+
+def _stable_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    スコアの高い順に上位k件の位置を返す。同点は位置の若い順
+    （sorted(..., reverse=True) と同じ並び）で、境界の同点も同じ基準で切る。
+    """
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    kth = np.partition(-scores, k - 1)[k - 1]
+    candidates = np.flatnonzero(-scores <= kth)  # 境界と同点の位置もすべて含める（昇順）
+    return candidates[np.argsort(-scores[candidates], kind="stable")][:k]
+
+
+def _fusion_inputs(
+    db: Chroma,
+    query: str,
+    category: str,
+    use_janome: bool,
+    vector_depth: int = HYBRID_VECTOR_DEPTH,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, Callable[[int], Document], Callable[[np.ndarray], np.ndarray] | None] | None:
+    """
+    RRF の入力を、カテゴリ内の全チャンク（スコープ）での位置（整数）に揃えて返す。
+
+    Returns:
+        (BM25 スコア, ベクトル検索結果の順位順のスコープ内位置, その距離, 位置 → Document の関数,
+        スコープ内位置の配列 → 距離の関数)。
+        ベクトル検索結果がスコープ内に見つからない場合の位置は -1。文書が無ければ None。
+        最後の関数は、ベクトル検索が量子化・IVF の候補（vector_depth 件）だけに順位を付けた
+        場合に、候補外の行の距離を求めるためのもの（全件に順位を付けた場合は None）。
+    """
+    tokenize = _get_tokenizer(use_janome)
+    shared = _get_shared_index(db)
+    tokenizer = _tokenizer_name(use_janome)
+    vec_kwargs = {}
+    if category and category != "unknown":
+        vec_kwargs["filter"] = {"category": category}
+
+    if shared is not None and shared.has_bm25(tokenizer):
+        rows = shared.scope_rows(category)
+        if len(rows) == 0:
+            return None
+        bm25_scores = shared.bm25_scores(tokenize(query), tokenizer, category)
+        distance_of = None
+        if isinstance(db, NumpyVectorStore):
+            # 行番号と距離だけを受け取り、本文の読み出しは上位k件の分だけにする
+            embedding = db.embeddings.embed_query(query)
+            if db.approximate:
+                # 量子化・IVF の候補だけに順位を付ける（float32 行列は候補行しか読まない）
+                vec_rows, vec_dist = db.similarity_search_rows_by_vector(
+                    embedding, k=min(len(rows), vector_depth), exhaustive=False, **vec_kwargs
+                )
+
+                def distance_of(positions: np.ndarray) -> np.ndarray:
+                    return db.row_distances(embedding, rows[positions])
+            else:
+                vec_rows, vec_dist = db.similarity_search_rows_by_vector(embedding, k=len(rows), **vec_kwargs)
+        else:
+            vector_results = db.similarity_search_with_score(query, k=len(rows), **vec_kwargs)
+            found_rows = [shared.row_of(doc.id) for doc, _ in vector_results]
+            vec_rows = np.asarray([-1 if r is None else r for r in found_rows], dtype=np.int64)
+            vec_dist = np.asarray([score for _, score in vector_results], dtype=np.float64)
+        position = shared.scope_position(category)
+        vec_pos = np.where(vec_rows >= 0, position[vec_rows], -1)
+
+        def to_document(pos: int) -> Document:
+            row = int(rows[pos])
+            return Document(page_content=shared.text(row), metadata=shared.metadatas[row], id=shared.ids[row])
+
+        return bm25_scores, vec_pos, vec_dist, to_document, distance_of
+
+    from rank_bm25 import BM25Okapi
+
+    all_ids, all_contents, all_metadatas = _load_corpus(db, category)
+    if not all_contents:
+        return None
+    bm25 = BM25Okapi([tokenize(doc) for doc in all_contents])
+    bm25_scores = np.asarray(bm25.get_scores(tokenize(query)), dtype=np.float64)
+    vector_results = db.similarity_search_with_score(query, k=len(all_contents), **vec_kwargs)
+    position_of = {chunk_id: pos for pos, chunk_id in enumerate(all_ids)}
+    vec_pos = np.asarray([position_of.get(doc.id, -1) for doc, _ in vector_results], dtype=np.int64)
+    vec_dist = np.asarray([score for _, score in vector_results], dtype=np.float64)
+
+    def to_document(pos: int) -> Document:
+        return Document(page_content=all_contents[pos], metadata=all_metadatas[pos], id=all_ids[pos])
+
+    return bm25_scores, vec_pos, vec_dist, to_document, None
+
+
 def hybrid_retrieve_with_score(
     db: Chroma,
     query: str,
@@ -62,88 +283,53 @@ def hybrid_retrieve_with_score(
     category: str = "unknown",
     rrf_k: int = 60,
     use_janome: bool = True,
+    vector_depth: int = HYBRID_VECTOR_DEPTH,
 ) -> list[tuple[Document, float]]:
     """BM25 + ベクトル検索を RRF で統合するハイブリッド検索。
     BM25 が利用できない場合はベクトル検索のみにフォールバックする。
 
+    量子化・IVF を使う NumpyVectorStore では、ベクトル検索の順位を上位 vector_depth 件の候補だけに
+    付ける（それ以外は順位 n）。それ以外のストアは従来どおり全件に順位を付ける。
+
     Returns:
         (Document, distance) のリスト。distance は小さいほど良い（ベクトル距離ベース）。
     """
     try:
-        from rank_bm25 import BM25Okapi
+        import rank_bm25  # noqa: F401
     except ImportError:
         print("[hybrid_retrieve] rank_bm25 not found, falling back to vector search")
         return _vector_only_search(db, query, k, category)
 
     try:
-        # Chromaから全ドキュメントを取得
-        all_data = db.get(include=["documents", "metadatas"])
-        all_contents: list[str] = all_data.get("documents") or []
-        all_metadatas: list[dict] = all_data.get("metadatas") or []
-
-        if not all_contents:
+        # カテゴリ内の全チャンクの BM25 スコアとベクトル検索の順位（共有インデックスがあれば事前計算済み）
+        inputs = _fusion_inputs(db, query, category, use_janome, vector_depth)
+        if inputs is None:
+            # 文書が無い・カテゴリが見つからない場合はベクトル検索のみ
             return _vector_only_search(db, query, k, category)
+        bm25_scores, vec_pos, vec_dist, to_document, distance_of = inputs
 
-        # カテゴリフィルタ（Pythonレベル）
-        if category and category != "unknown":
-            pairs = [(c, m) for c, m in zip(all_contents, all_metadatas)
-                     if m and m.get("category") == category]
-            if pairs:
-                all_contents, all_metadatas = zip(*pairs)
-                all_contents, all_metadatas = list(all_contents), list(all_metadatas)
-            else:
-                # カテゴリが見つからない場合はフィルタなしで再検索
-                return _vector_only_search(db, query, k, category)
-
-        n = len(all_contents)
-
-        # BM25 検索（トークナイズ）
-        if use_janome:
-            try:
-                from janome.tokenizer import Tokenizer as JanomeTokenizer
-                _jt = JanomeTokenizer()
-                def _tokenize(text: str) -> list[str]:
-                    return [t.surface for t in _jt.tokenize(text)]
-            except ImportError:
-                def _tokenize(text: str) -> list[str]:
-                    return re.findall(r'\w+', text)
-        else:
-            def _tokenize(text: str) -> list[str]:
-                return re.findall(r'\w+', text)
-
-        tokenized_corpus = [_tokenize(doc) for doc in all_contents]
-        bm25 = BM25Okapi(tokenized_corpus)
-        bm25_scores = bm25.get_scores(_tokenize(query))
-        bm25_rank = {
-            all_contents[idx]: rank
-            for rank, idx in enumerate(sorted(range(n), key=lambda i: bm25_scores[i], reverse=True))
-        }
-
-        # ベクトル検索
-        vec_kwargs = {}
-        if category and category != "unknown":
-            vec_kwargs["filter"] = {"category": category}
-        vector_results = db.similarity_search_with_score(query, k=n, **vec_kwargs)
-        vec_data = {doc.page_content: (rank, score) for rank, (doc, score) in enumerate(vector_results)}
-
-        # RRF スコア計算（高いほど良い）
-        rrf_scores = {}
-        for content in all_contents:
-            bm25_r = bm25_rank.get(content, n)
-            vec_r = vec_data.get(content, (n, 1.0))[0]
-            rrf_scores[content] = 1 / (rrf_k + bm25_r) + 1 / (rrf_k + vec_r)
-
-        # 上位 k 件を取得
-        top_contents = sorted(rrf_scores, key=lambda c: rrf_scores[c], reverse=True)[:k]
-
-        content_to_meta = dict(zip(all_contents, all_metadatas))
-        results = []
-        for content in top_contents:
-            doc = Document(page_content=content, metadata=content_to_meta.get(content, {}))
-            _, vec_dist = vec_data.get(content, (n, 0.15))
-            results.append((doc, vec_dist))
-
-        return results
+        # 順位はチャンクのスコープ内位置（整数）で持つ。同点は位置の若い順。
+        # ベクトル検索の候補に入らなかったチャンクの順位は n
+        n = len(bm25_scores)
+        bm25_rank = np.empty(n, dtype=np.int64)
+        bm25_rank[np.argsort(-bm25_scores, kind="stable")] = np.arange(n)
+
+        found = vec_pos >= 0
+        vec_rank = np.full(n, n, dtype=np.int64)
+        vec_rank[vec_pos[found]] = np.flatnonzero(found)
+        vec_score = np.full(n, 0.15)
+        vec_score[vec_pos[found]] = vec_dist[found]
+
+        # RRF スコア計算（高いほど良い）と上位 k 件
+        rrf_scores = 1 / (rrf_k + bm25_rank) + 1 / (rrf_k + vec_rank)
+        top = _stable_top_k(rrf_scores, k)
+
+        # BM25 だけで上位に入った候補外のチャンクは、その行だけ採点して距離を求める
+        missing = top[vec_rank[top] == n]
+        if distance_of is not None and len(missing):
+            vec_score[missing] = distance_of(missing)
+
+        return [(to_document(pos), float(vec_score[pos])) for pos in top.tolist()]
 
     except Exception as e:
         print(f"[hybrid_retrieve] BM25 error: {e}, falling back to vector search")
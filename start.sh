@@ -2,7 +2,8 @@
 set -e
 
 # FastAPI バックエンドをバックグラウンドで起動（内部 port 8000）
-uvicorn api.main:app --host 0.0.0.0 --port 8000 &
+# WEB_CONCURRENCY でワーカープロセス数を指定（インデックスは公開中のバージョンの index/ を mmap で共有）
+uvicorn api.main:app --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-1}" &
 
 # Streamlit フロントエンドをフォアグラウンドで起動（Cloud Run の $PORT を使用）
 exec streamlit run app.py \
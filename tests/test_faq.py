@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rag.faq import FAQStore, match_intent
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("解約はいつ有効になりますか？", "cancel_timing"),
+    ("解約方法を教えて", "cancel_method"),
+    ("返金してほしい", "refund_policy"),
+    ("返金して欲しいです", "refund_policy"),
+    ("返金はできますか", "refund_policy"),
+    ("支払い方法を教えてください", "billing_payment"),
+    ("ログインできません", "login_trouble"),
+])
+def test_match_intent(question, intent):
+    assert match_intent(question).id == intent
+
+
+@pytest.mark.parametrize("question", [
+    "トライアル中の解約はいつ有効になりますか",  # 除外語（cancel_timing）
+    "3月20日に解約したらいつまで使えますか",      # 数字
+    "トライアル中に解約したい",                    # 除外語（cancel_method）
+    "二重請求の返金をしてほしい",                  # 除外語（refund_policy）
+    "返金は10日以内にしてもらえますか",            # 数字
+    "二重請求の支払い方法について",                # 除外語（billing_payment）
+    "SSOでログインできない",                       # 除外語（login_trouble）
+    "料金プランを教えて",                          # どの意図にも当てはまらない
+])
+def test_match_intent_rejects(question):
+    assert match_intent(question) is None
+
+
+def test_match_intent_rejects_long_question():
+    assert match_intent("解約方法を教えてください。" + "契約内容について詳しく確認したいことがあります。" * 3) is None
+
+
+def test_extractive_entries_have_no_self_eval_scores():
+    # 以前の faq.json の抜粋回答には自己評価なしの 100 が入っていた
+    entry = {"intent": "refund_policy", "answer": "…", "accuracy": 100, "completeness": 100}
+    store = FAQStore({"mode": "extractive", "entries": {"refund_policy": entry}}, "file")
+    hit = store.match("返金してほしい")
+    assert hit["accuracy"] is None and hit["completeness"] is None